@@ -0,0 +1,200 @@
+import sys
+import asyncio
+import inspect
+import threading
+from threading import Thread
+from rsudp import printM, printW, printE, helpers
+import rsudp.raspberryshake as RS
+from rsudp.bus import route, TERM
+from rsudp.p_producer import Producer
+from rsudp.test import TEST
+
+
+def on_loop(consumer):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param consumer: a consumer
+	:rtype: bool
+	:return: whether the consumer can run as a coroutine on the :py:class:`Engine` loop (it has an ``async def handle(item)`` method)
+	'''
+	return inspect.iscoroutinefunction(getattr(consumer, 'handle', None))
+
+
+class Receiver(asyncio.DatagramProtocol):
+	'''
+	.. versionadded:: 2.3.0
+
+	Receives datagrams on the event loop of the :py:class:`Engine`.
+	When the loop reports a datagram, every other datagram already
+	waiting on the socket is read as well (up to
+	:py:data:`rsudp.p_producer.Producer.max_batch`), and the batch is
+	handed to the Producer's filtering and parsing
+	(:py:meth:`rsudp.p_producer.Producer._put_batch`) in one go,
+	as the threaded Producer does.
+
+	:param Engine engine: the engine
+	'''
+	def __init__(self, engine):
+		self.engine = engine
+
+	def datagram_received(self, data, addr):
+		prod = self.engine.producer
+		batch = [(data, addr)]
+		try:
+			while len(batch) < prod.max_batch:
+				batch.append(RS.sock.recvfrom(4096))
+		except (BlockingIOError, InterruptedError):
+			pass
+		prod.largest_batch = max(prod.largest_batch, len(batch))
+		prod._put_batch(batch)
+		prod._tasks()
+		if self.engine.testing:
+			TEST['x_data'][1] = True
+
+	def error_received(self, exc):
+		printW('Error on the data socket: %s' % (exc), sender=self.engine.sender)
+
+
+class Engine(Thread):
+	'''
+	.. versionadded:: 2.3.0
+
+	An asyncio event loop that does the work of the
+	:py:class:`rsudp.p_producer.Producer` and the
+	:py:class:`rsudp.c_consumer.Consumer` (see :ref:`producer-consumer`)
+	in one thread, and runs the network-bound consumers as coroutines
+	on the same loop instead of a thread each. The client uses it instead
+	of the Producer and Consumer threads when the ``"engine"`` setting
+	is ``"asyncio"``.
+
+	Datagrams are received by a :py:class:`Receiver` and the resulting
+	batches are published on the bus straight away. Consumers that have
+	an ``async def handle(item)`` method (see :py:func:`on_loop`), such as
+	:py:class:`rsudp.c_forward.Forward` and the notifiers, are not started
+	as threads; each gets a task that awaits items from its queue and
+	hands them to ``handle``. Blocking calls in a ``handle`` method are
+	passed to a thread with :py:func:`asyncio.to_thread`. Consumers that
+	do a lot of work on the data (Alert, Write, RSAM, the plot) stay in
+	threads of their own, or in processes (see :py:mod:`rsudp.shm`).
+
+	:param rsudp.bus.Bus bus: the bus the sub-consumers are subscribed to
+	:param list threads: the consumers to monitor for status changes (see :py:class:`rsudp.p_producer.Producer`)
+	:param bool testing: whether or not testing is active
+	:param rsudp.shm.PacketRing ring: shared memory ring to also write data packets to
+	'''
+	def __init__(self, bus, threads, testing=False, ring=None):
+		super().__init__()
+		self.sender = 'Engine'
+		self.bus = bus
+		self.testing = testing
+		self.consumers = [t for t in threads if on_loop(t)]
+		self.loop = None
+		self.loop_thread = None
+		self.stop = False
+		# the Producer's filtering, parsing and status checks, with this engine as its queue
+		self.producer = Producer(self, threads, testing=testing, ring=ring)
+		for c in self.consumers:
+			if c.queue.policy == 'block':
+				# a full queue must not hold up the loop that empties it
+				printW('%s runs on the event loop, so its queue drops the oldest item when full instead of blocking'
+					   % c.sender, sender=self.sender)
+				c.queue.set_policy('drop-oldest')
+		printM('Starting with %s consumers on the event loop.' % len(self.consumers), self.sender)
+
+	def put(self, item):
+		'''
+		Publishes an item or a list of items on the bus.
+		Can be called from any thread (the plot, for example, uses this
+		to send ``IMGPATH`` and ``TERM`` messages).
+
+		:param item: a data packet or message, or a list of them
+		'''
+		if self.loop and (threading.get_ident() != self.loop_thread):
+			self.loop.call_soon_threadsafe(self._publish, item)
+		else:
+			self._publish(item)
+
+	def _publish(self, item):
+		items = item if isinstance(item, list) else [item]
+		for i, it in enumerate(items):
+			if route(it)[0] == TERM:
+				# nothing after TERM is delivered
+				items = items[:i+1]
+				RS.producer = False
+				break
+		self.bus.publish_many(items)
+		if self.testing:
+			TEST['x_masterqueue'][1] = True
+
+	async def _get(self, consumer, ready):
+		'''
+		Waits for the next item on a consumer's queue.
+		'''
+		queue = consumer.queue
+		while not queue.qsize():
+			ready.clear()
+			if not queue.qsize():
+				await ready.wait()
+		return queue.get_nowait()
+
+	async def _drive(self, consumer):
+		'''
+		Hands the items on a consumer's queue to its ``handle`` coroutine
+		until a ``TERM`` message has been handled.
+		'''
+		ready = asyncio.Event()
+		def wake():
+			if threading.get_ident() == self.loop_thread:
+				ready.set()
+			else:
+				self.loop.call_soon_threadsafe(ready.set)
+		consumer.queue.wake = wake
+		while True:
+			item = await self._get(consumer, ready)
+			try:
+				await consumer.handle(item)
+			except Exception as e:
+				printE('%s' % e, sender=consumer.sender)
+				consumer.alive = False
+				break
+			if route(item)[0] == TERM:
+				break
+
+	async def _main(self):
+		self.loop = asyncio.get_running_loop()
+		self.loop_thread = threading.get_ident()
+		RS.producer = True
+		tasks = [self.loop.create_task(self._drive(c)) for c in self.consumers]
+		# pass on the data read while discovering the data stream
+		self.producer._put_batch(RS.take_held())
+		RS.sock.setblocking(False)
+		transport, protocol = await self.loop.create_datagram_endpoint(
+			lambda: Receiver(self), sock=RS.sock)
+		while RS.producer:
+			# the Receiver checks the consumers after each batch; this covers quiet periods
+			await asyncio.sleep(0.1)
+			self.producer._tasks()
+			if self.producer.stop:
+				RS.producer = False
+		transport.close()
+
+		print()
+		printM('Sending TERM signal to threads...', self.sender)
+		self._publish(helpers.msg_term())
+		if tasks:
+			await asyncio.wait(tasks, timeout=10)
+		printM('Exiting.', self.sender)
+
+	def run(self):
+		'''
+		Runs the event loop until the Producer would have stopped, then
+		sends ``TERM`` to the consumers and waits for the ones on the loop
+		to finish.
+		'''
+		try:
+			asyncio.run(self._main())
+		finally:
+			self.stop = True
+			self.producer.stop = True
+		sys.exit()
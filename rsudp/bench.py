@@ -0,0 +1,331 @@
+import os, sys
+import getopt
+import json
+import subprocess
+from rsudp import settings_loc
+from rsudp.c_settings import Settings
+
+
+# run in a fresh interpreter so that nothing is imported beforehand
+PROBE = '''
+import sys, time, json
+t = time.perf_counter()
+import rsudp.client as C
+for section in sys.argv[1:]:
+	C.load(section)
+t = time.perf_counter() - t
+from rsudp.helpers import process_stats
+wall, cpu, rss = process_stats()
+print(json.dumps({'import': t, 'wall': wall, 'rss': rss}))
+'''
+
+# runs the client with a number of Forward consumers while SENDER feeds it data
+ENGINE_PROBE = '''
+import sys, json, resource, threading, subprocess
+import rsudp
+import rsudp.client as C
+import rsudp.raspberryshake as rs
+engine, forwards, rate, seconds, sender = sys.argv[1], int(sys.argv[2]), sys.argv[3], sys.argv[4], sys.argv[5]
+C.ENGINE = engine
+rs.initd, rs.port = True, 0
+rs.openSOCK('127.0.0.1')
+rs.chns, rs.numchns, rs.sps = ['EHZ', 'ENZ', 'ENN', 'ENE'], 4, 100
+for i in range(forwards):
+	C.mk_p(C.load('forward').Forward(num=i, addr='127.0.0.1', port=9, fwd_data=True,
+									 fwd_alarms=False, cha='all', q=C.mk_q()))
+threads = []
+threading.Timer(float(seconds) / 2, lambda: threads.append(threading.active_count() - 1)).start()
+feed = subprocess.Popen([sys.executable, '-c', sender, str(rs.sock.getsockname()[1]), rate, seconds,
+						 rsudp.resource_path('test', 'testdata')])
+before = resource.getrusage(resource.RUSAGE_SELF)
+C.start()
+after = resource.getrusage(resource.RUSAGE_SELF)
+feed.wait()
+print(json.dumps({'threads': threads[0] if threads else 0,
+				  'cpu': (after.ru_utime + after.ru_stime) - (before.ru_utime + before.ru_stime),
+				  'vcsw': after.ru_nvcsw - before.ru_nvcsw, 'ivcsw': after.ru_nivcsw - before.ru_nivcsw}))
+'''
+
+# queues a backlog of test data for a Write consumer and times how long it takes to write it
+WRITE_PROBE = '''
+import os, sys, time, json, shutil, tempfile
+import rsudp, rsudp.raspberryshake as rs
+from rsudp import helpers
+from rsudp.bus import Subscription
+seconds = float(sys.argv[1])
+with open(rsudp.resource_path('test', 'testdata'), 'rb') as f:
+	packets = [p for p in rs.parse_packets([l.strip() for l in f if l.startswith(b'{')]) if isinstance(p, rs.Packet)]
+rs.chns = sorted(set(p.cha for p in packets))
+rs.numchns, rs.sps, rs.tf = len(rs.chns), 100, 250
+# repeat the test data, one copy after the other, until there are enough seconds of it
+span = sum(len(p.data) for p in packets if p.cha == rs.chns[0]) / rs.sps
+q = Subscription()
+n = 0
+for r in range(int(seconds // span) + 1):
+	for p in packets:
+		q.put(rs.Packet(p.cha, p.time + r * span, p.data))
+		n += 1
+q.put(helpers.msg_term())
+out = tempfile.mkdtemp()
+os.makedirs(os.path.join(out, 'data'))
+from rsudp.c_write import Write
+w = Write(q=q, data_dir=out, cha='all')
+wall, cpu = time.perf_counter(), time.process_time()
+w.start()
+w.join()
+wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+size = sum(os.path.getsize(f) for f in w.outfiles)
+shutil.rmtree(out)
+print(json.dumps({'packets': n, 'seconds': (int(seconds // span) + 1) * span, 'wall': wall, 'cpu': cpu,
+				  'bytes': size, 'realtime': rs.numchns * 1000 / rs.tf}))
+'''
+
+# sends the test data to a port at a number of packets per second, then TERM
+SENDER = '''
+import sys, time, socket
+port, rate, seconds = int(sys.argv[1]), float(sys.argv[2]), float(sys.argv[3])
+with open(sys.argv[4], 'rb') as f:
+	lines = [l.strip() for l in f if l.startswith(b'{')]
+sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+start, n = time.monotonic(), 0
+while time.monotonic() - start < seconds:
+	sock.sendto(lines[n % len(lines)], ('127.0.0.1', port))
+	n += 1
+	time.sleep(max(0, start + n / rate - time.monotonic()))
+sock.sendto(b'TERM', ('127.0.0.1', port))
+'''
+
+
+def measure(sections=(), python=sys.executable):
+	'''
+	.. versionadded:: 2.3.0
+
+	Starts a fresh Python interpreter, imports the client and the
+	consumer modules of the given settings sections
+	(see :py:func:`rsudp.client.load`), and reports how long that took
+	and how much memory the interpreter ended up using.
+
+	.. code-block:: python
+
+		>>> measure(['alert', 'write'])
+		{'import': 0.41, 'wall': 0.47, 'rss': 58.3}
+
+	:param list sections: names of settings sections to load
+	:param str python: the Python interpreter to run
+	:rtype: dict
+	:return: import time (s), time since the interpreter started (s) and resident memory (MB)
+	'''
+	env = dict(os.environ, MPLBACKEND=os.environ.get('MPLBACKEND', 'Agg'))
+	out = subprocess.run([python, '-c', PROBE] + list(sections), env=env,
+						 capture_output=True, text=True, check=True).stdout
+	return json.loads(out.strip().splitlines()[-1])
+
+
+def measure_engine(engine, forwards=4, rate=400, seconds=10, python=sys.executable):
+	'''
+	.. versionadded:: 2.3.0
+
+	Starts a fresh Python interpreter running the client with the given
+	engine (see :py:class:`rsudp.aio.Engine`) and a number of
+	:py:class:`rsudp.c_forward.Forward` consumers, feeds it the test data
+	from another process for a number of seconds, and reports what
+	that cost.
+
+	.. code-block:: python
+
+		>>> measure_engine('asyncio')
+		{'threads': 2, 'cpu': 0.61, 'vcsw': 4102, 'ivcsw': 35}
+
+	:param str engine: ``'threads'`` or ``'asyncio'``
+	:param int forwards: number of Forward consumers
+	:param float rate: data packets sent per second
+	:param float seconds: how long to send data for
+	:param str python: the Python interpreter to run
+	:rtype: dict
+	:return: threads running, CPU time (s), and voluntary and involuntary context switches
+	'''
+	out = subprocess.run([python, '-c', ENGINE_PROBE, engine, str(forwards), str(rate),
+						  str(seconds), SENDER], capture_output=True, text=True, check=True).stdout
+	return json.loads(out.strip().splitlines()[-1])
+
+
+def report_engines(forwards=4, rate=400, seconds=10):
+	'''
+	.. versionadded:: 2.3.0
+
+	Prints the threads, CPU time and context switches the client takes
+	to forward the same data with each engine (see :py:func:`measure_engine`).
+
+	:param int forwards: number of Forward consumers
+	:param float rate: data packets sent per second
+	:param float seconds: how long to send data for
+	'''
+	print('%s Forward consumers, %s packets/s for %s s' % (forwards, rate, seconds))
+	print('%-24s %10s %10s %10s %10s' % ('', 'threads', 'CPU (s)', 'vol. cs', 'invol. cs'))
+	for engine in ('threads', 'asyncio'):
+		r = measure_engine(engine, forwards=forwards, rate=rate, seconds=seconds)
+		print('%-24s %10s %10.2f %10s %10s' % (engine, r['threads'], r['cpu'], r['vcsw'], r['ivcsw']))
+
+
+def measure_write(seconds=3600, python=sys.executable):
+	'''
+	.. versionadded:: 2.3.0
+
+	Starts a fresh Python interpreter, queues ``seconds`` of the test data
+	(four channels, repeated as often as needed) for a
+	:py:class:`rsudp.c_write.Write` consumer writing to a temporary
+	directory, and reports how long it took to write all of it.
+
+	.. code-block:: python
+
+		>>> measure_write(3600)
+		{'packets': 58080, 'seconds': 3630.0, 'wall': 2.4, 'cpu': 2.3, 'bytes': 3294208, 'realtime': 16.0}
+
+	:param float seconds: seconds of data to write
+	:param str python: the Python interpreter to run
+	:rtype: dict
+	:return: packets and seconds of data written, wall and CPU time (s), size of the files (bytes), and packets per second of the data in real time
+	'''
+	out = subprocess.run([python, '-c', WRITE_PROBE, str(seconds)],
+						 capture_output=True, text=True, check=True).stdout
+	return json.loads(out.strip().splitlines()[-1])
+
+
+def report_write(seconds=3600):
+	'''
+	.. versionadded:: 2.3.0
+
+	Prints how fast the Write consumer writes a backlog of data
+	(see :py:func:`measure_write`), in packets per second and as a
+	multiple of the rate the data comes in at.
+
+	:param float seconds: seconds of data to write
+	'''
+	r = measure_write(seconds)
+	print('%s packets (%.0f s of data, %.0f packets/s in real time), %.1f MB of miniSEED'
+		  % (r['packets'], r['seconds'], r['realtime'], r['bytes'] / 1e6))
+	print('%-24s %10s %10s %12s %12s' % ('', 'wall (s)', 'CPU (s)', 'packets/s', 'x real time'))
+	rate = r['packets'] / r['wall']
+	print('%-24s %10.2f %10.2f %12.0f %12.0f' % ('write', r['wall'], r['cpu'], rate, rate / r['realtime']))
+
+
+def enabled_sections(settings):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param dict settings: settings dictionary (see :ref:`defaults`)
+	:rtype: list
+	:return: the settings sections that would start a consumer module
+	'''
+	from rsudp.client import MODULES
+	return [s for s in MODULES if settings.get(s, {}).get('enabled', False)]
+
+
+def report(settings, each=False, runs=3):
+	'''
+	.. versionadded:: 2.3.0
+
+	Prints the startup cost of the client with the sections enabled in a
+	settings file. Each measurement is the fastest of ``runs`` fresh
+	interpreters, to keep disk cache effects out of the numbers.
+	If ``each`` is ``True``, the cost of each consumer module on its own
+	is printed as well.
+
+	:param dict settings: settings dictionary (see :ref:`defaults`)
+	:param bool each: whether to measure every consumer module separately
+	:param int runs: how many times to repeat each measurement
+	'''
+	def best(sections):
+		results = [measure(sections) for i in range(runs)]
+		return min(results, key=lambda r: r['import'])
+
+	sections = enabled_sections(settings)
+	base = best([])
+	print('%-24s %10s %10s %10s' % ('', 'import (s)', 'start (s)', 'RSS (MB)'))
+	print('%-24s %10.3f %10.3f %10s' % ('client', base['import'], base['wall'], base['rss']))
+	if each:
+		from rsudp.client import MODULES
+		for s in MODULES:
+			r = best([s])
+			print('%-24s %+10.3f %+10.3f %+10.1f' % ('  + %s' % s, r['import'] - base['import'],
+					r['wall'] - base['wall'], r['rss'] - base['rss']))
+	r = best(sections)
+	print('%-24s %10.3f %10.3f %10s' % ('enabled sections', r['import'], r['wall'], r['rss']))
+	print('  (%s)' % (', '.join(sections) or 'none'))
+
+
+def main():
+	'''
+	.. versionadded:: 2.3.0
+
+	Measures how long rsudp takes to start and how much memory it uses
+	with the consumer modules enabled in a settings file.
+	Supply -h from the command line to see help text.
+	'''
+	hlp_txt = '''
+Usage: rs-bench [ OPTIONS ]
+where OPTIONS := {
+    -h | --help
+            display this help message
+    -s | --settings=/path/to/settings/json
+            measure the modules enabled in this settings file
+            (default: %s)
+    -e | --each
+            also measure each consumer module on its own
+    -n | --runs=N
+            take the fastest of N runs of each measurement (default: 3)
+    -E | --engines
+            instead, compare the threaded and asyncio engines forwarding
+            test data (threads, CPU time and context switches)
+    -f | --forwards=N
+            number of Forward consumers to run with -E (default: 4)
+    -W | --write
+            instead, measure how fast the Write consumer writes a backlog
+            of test data
+    -S | --seconds=N
+            seconds of test data to write with -W (default: 3600)
+    }
+''' % settings_loc
+
+	settings = Settings.default_settings(verbose=False)
+	if os.path.exists(settings_loc):
+		settings = Settings.read_settings(settings_loc)
+	each, runs, engines, forwards, write, seconds = False, 3, False, 4, False, 3600
+	try:
+		opts = getopt.getopt(sys.argv[1:], 'hs:en:Ef:WS:',
+			['help', 'settings=', 'each', 'runs=', 'engines', 'forwards=', 'write', 'seconds=']
+			)[0]
+	except Exception as e:
+		print('ERROR: %s' % e)
+		print(hlp_txt)
+		exit(1)
+
+	for o, a in opts:
+		if o in ('-h', '--help'):
+			print(hlp_txt)
+			exit(0)
+		if o in ('-s', '--settings'):
+			settings = Settings.read_settings(os.path.abspath(os.path.expanduser(a)))
+		if o in ('-e', '--each'):
+			each = True
+		if o in ('-n', '--runs'):
+			runs = max(1, int(a))
+		if o in ('-E', '--engines'):
+			engines = True
+		if o in ('-f', '--forwards'):
+			forwards = max(0, int(a))
+		if o in ('-W', '--write'):
+			write = True
+		if o in ('-S', '--seconds'):
+			seconds = max(1, float(a))
+
+	if write:
+		report_write(seconds=seconds)
+	elif engines:
+		report_engines(forwards=forwards)
+	else:
+		report(settings, each=each, runs=runs)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,441 @@
+from collections import deque
+from threading import Condition, Lock
+from time import monotonic, monotonic_ns
+from queue import Empty, Full
+from rsudp import printM, printW
+from rsudp.raspberryshake import Packet, Message
+
+# kinds of item on the bus
+DATA = 'DATA'
+ALARM = 'ALARM'
+RESET = 'RESET'
+IMGPATH = 'IMGPATH'
+TERM = 'TERM'
+
+# what a full subscription does with a new item
+POLICIES = ('block', 'drop-oldest', 'drop-newest', 'coalesce')
+
+
+def route(item):
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns the routing key of an item on the bus: the kind of item and,
+	for data packets, the channel. Messages are recognized by their
+	:py:class:`rsudp.raspberryshake.MsgKind` (or, for messages that
+	are still bytes, by their first word).
+
+	.. code-block:: python
+
+		>>> route(rs.Packet('EHZ', 1582315130.292, data))
+		('DATA', 'EHZ')
+		>>> route(helpers.msg_term())
+		('TERM', None)
+
+	:param item: a data packet or message
+	:type item: rsudp.raspberryshake.Packet or rsudp.raspberryshake.Message or bytes
+	:rtype: tuple
+	:return: ``(kind, channel)``
+	'''
+	if isinstance(item, Packet):
+		return DATA, item.cha
+	if isinstance(item, Message):
+		return item.kind.name, None
+	if isinstance(item, bytes):
+		return item.split(b' ', 1)[0].decode('utf-8', 'replace'), None
+	return str(item).split(' ', 1)[0], None
+
+
+class Subscription:
+	'''
+	.. versionadded:: 2.3.0
+
+	One consumer's subscription to the :py:class:`Bus`. Holds the items
+	that match the consumer's channels and kinds of message until the
+	consumer takes them, and has the same ``get``/``put``/``task_done``/``qsize``
+	methods as the :py:class:`queue.Queue` it replaces, so consumer
+	code reads from it unchanged.
+
+	``TERM`` messages are always delivered, whatever the subscription.
+
+	What happens when an item arrives and the subscription already holds
+	``maxsize`` items depends on its overflow ``policy``:
+
+	- ``'block'`` - wait until the consumer takes an item (this holds up
+	  delivery to every other consumer too, so it is for consumers that
+	  must not lose data, such as Write and Alert)
+	- ``'drop-oldest'`` - drop the oldest item held to make room
+	- ``'drop-newest'`` - drop the new item
+	- ``'coalesce'`` - drop the oldest item held of the same kind (and
+	  channel) as the new one, so that only the latest of each is kept,
+	  or the oldest item if there is none
+
+	``TERM`` messages are never dropped. The number of items dropped
+	(:py:data:`dropped`) and the most items ever held at once
+	(:py:data:`high_water`) are counted.
+
+	Urgent messages (see :py:meth:`Bus.publish_urgent`) are kept apart
+	from the other items, are never held up or dropped, and are
+	handed out before anything else. The time each one took from being
+	raised to being taken off the queue is logged, and the longest is
+	kept in :py:data:`latency`.
+
+	:param int maxsize: most items held before the overflow policy applies (0 = no limit)
+	:param channels: channels to receive data from (``None`` = all)
+	:type channels: list or None
+	:param kinds: kinds of item to receive, e.g. ``['DATA', 'ALARM']`` (``None`` = all)
+	:type kinds: list or None
+	:param str policy: overflow policy, one of :py:data:`POLICIES`
+	:param Bus bus: the bus this subscription belongs to
+	:param str name: name used in log messages
+	'''
+	def __init__(self, maxsize=0, channels=None, kinds=None, policy='block', bus=None, name='Subscription'):
+		self.maxsize = maxsize
+		self.channels = None
+		self.kinds = None
+		self.policy = 'block'
+		self.set_policy(policy)
+		self.bus = bus
+		self.name = name
+		self.dropped = 0
+		self.high_water = 0
+		self.warn_at = 1		# number of drops at which to warn next
+		self.latency = None		# longest delay of an urgent message (ms)
+		self.items = deque()
+		self.urgent = deque()
+		self.lock = Lock()
+		self.not_empty = Condition(self.lock)
+		self.not_full = Condition(self.lock)
+		self.wake = None		# called after items are added, for consumers on an event loop
+		self.subscribe(channels=channels, kinds=kinds)
+
+	def __repr__(self):
+		return 'Subscription(channels=%s, kinds=%s, policy=%r, %s items)' % (
+				self.channels, self.kinds, self.policy, len(self.items))
+
+	def __str__(self):
+		s = '%s of %s held at most (%s), %s dropped' % (
+			self.high_water, self.maxsize or 'unlimited', self.policy, self.dropped)
+		if self.latency is not None:
+			s += ', alarms delivered in at most %.2f ms' % self.latency
+		return s
+
+	def set_policy(self, policy):
+		'''
+		Sets the overflow policy.
+
+		:param str policy: one of :py:data:`POLICIES`
+		:raise ValueError: if the policy is not one of :py:data:`POLICIES`
+		'''
+		if policy not in POLICIES:
+			raise ValueError('Unknown overflow policy %r (must be one of %s)' % (policy, ', '.join(POLICIES)))
+		self.policy = policy
+
+	def subscribe(self, channels=None, kinds=None):
+		'''
+		Sets the channels and kinds of item this subscription receives.
+
+		:param channels: channels to receive data from (``None`` = all)
+		:type channels: list or None
+		:param kinds: kinds of item to receive (``None`` = all)
+		:type kinds: list or None
+		'''
+		self.channels = None if channels is None else frozenset(channels)
+		self.kinds = None if kinds is None else frozenset(kinds) | {TERM}
+		if self.bus:
+			self.bus.reroute()
+
+	def wants(self, key):
+		'''
+		:param tuple key: routing key (see :py:func:`route`)
+		:rtype: bool
+		:return: whether items with this routing key are delivered here
+		'''
+		kind, cha = key
+		if (self.kinds is not None) and (kind not in self.kinds):
+			return False
+		if (kind == DATA) and (self.channels is not None):
+			return cha in self.channels
+		return True
+
+	def _wait_for_room(self, block, timeout):
+		if self.maxsize <= 0:
+			return
+		if not block:
+			if len(self.items) >= self.maxsize:
+				raise Full
+			return
+		end = None if timeout is None else monotonic() + timeout
+		while len(self.items) >= self.maxsize:
+			left = None if end is None else end - monotonic()
+			if (left is not None) and (left <= 0):
+				raise Full
+			self.not_full.wait(left)
+
+	def _drop(self, n=1):
+		'''
+		Counts dropped items, warning at the first drop and then
+		each time the count grows tenfold. Called with the lock held.
+		'''
+		self.dropped += n
+		if self.dropped >= self.warn_at:
+			printW('%s queue is full (%s), %s items dropped so far'
+				   % (self.name, self.policy, self.dropped), sender='Bus')
+			while self.warn_at <= self.dropped:
+				self.warn_at *= 10
+
+	def _append(self, item):
+		'''
+		Adds an item, applying a dropping overflow policy if the
+		subscription is full. Called with the lock held.
+		'''
+		if (0 < self.maxsize <= len(self.items)) and (route(item)[0] != TERM):
+			if self.policy == 'drop-newest':
+				self._drop()
+				return
+			i = 0
+			if self.policy == 'coalesce':
+				key = route(item)
+				i = next((n for n, old in enumerate(self.items) if route(old) == key), 0)
+			del self.items[i]
+			self._drop()
+		self.items.append(item)
+		if len(self.items) > self.high_water:
+			self.high_water = len(self.items)
+
+	def put(self, item, block=True, timeout=None):
+		'''
+		Adds an item. If the subscription is full, this waits for room
+		(``'block'`` policy) or drops an item (the other policies).
+
+		:param item: a data packet or message
+		:param bool block: whether to wait for room (``'block'`` policy only)
+		:param float timeout: how long to wait (``None`` = forever)
+		:raise queue.Full: if there is no room after waiting
+		'''
+		with self.lock:
+			if self.policy == 'block':
+				self._wait_for_room(block, timeout)
+			self._append(item)
+			self.not_empty.notify()
+		if self.wake:
+			self.wake()
+
+	def put_many(self, items):
+		'''
+		Adds a list of items at once, taking the lock and waking the
+		consumer once rather than once per item.
+		With the ``'block'`` policy, items are added as room allows, waiting
+		for the consumer whenever the subscription fills up, so it never
+		holds more than ``maxsize`` items.
+
+		:param list items: data packets and messages
+		'''
+		with self.lock:
+			if self.policy == 'block':
+				i = 0
+				while i < len(items):
+					if i:
+						# the consumer has to be woken to make room for the rest
+						self.not_empty.notify()
+						if self.wake:
+							self.wake()
+					self._wait_for_room(True, None)
+					room = (self.maxsize - len(self.items)) if (self.maxsize > 0) else len(items)
+					self.items.extend(items[i:i+room])
+					i += room
+					if len(self.items) > self.high_water:
+						self.high_water = len(self.items)
+			else:
+				for item in items:
+					self._append(item)
+			self.not_empty.notify()
+		if self.wake:
+			self.wake()
+
+	def put_urgent(self, item):
+		'''
+		Adds an urgent message, which is handed out before any other
+		item and is never held up or dropped.
+
+		:param rsudp.raspberryshake.Message item: the message
+		'''
+		with self.lock:
+			self.urgent.append(item)
+			self.not_empty.notify()
+		if self.wake:
+			self.wake()
+
+	def get(self, block=True, timeout=None):
+		'''
+		Removes and returns the oldest urgent message if there is one,
+		otherwise the oldest item.
+
+		:param bool block: whether to wait for an item
+		:param float timeout: how long to wait (``None`` = forever)
+		:raise queue.Empty: if there is no item after waiting
+		'''
+		with self.lock:
+			if not block:
+				if not (self.urgent or self.items):
+					raise Empty
+			else:
+				end = None if timeout is None else monotonic() + timeout
+				while not (self.urgent or self.items):
+					left = None if end is None else end - monotonic()
+					if (left is not None) and (left <= 0):
+						raise Empty
+					self.not_empty.wait(left)
+			if not self.urgent:
+				item = self.items.popleft()
+				self.not_full.notify()
+				return item
+			item = self.urgent.popleft()
+		self._delivered(item)
+		return item
+
+	def _delivered(self, item):
+		'''
+		Logs how long an urgent message took from being raised
+		to being taken off this queue.
+		'''
+		if getattr(item, 'sent', 0):
+			ms = (monotonic_ns() - item.sent) / 1e6
+			self.latency = ms if self.latency is None else max(self.latency, ms)
+			printM('%s message delivered %.2f ms after it was raised' % (item.kind.name, ms),
+				   sender=self.name)
+
+	def get_nowait(self):
+		'''
+		Same as :py:meth:`get` with ``block=False``.
+		'''
+		return self.get(block=False)
+
+	def task_done(self):
+		'''
+		Does nothing. Kept so that consumers written for
+		:py:class:`queue.Queue` work without changes.
+		'''
+		pass
+
+	def qsize(self):
+		'''
+		:rtype: int
+		:return: the number of items waiting
+		'''
+		return len(self.items) + len(self.urgent)
+
+	def empty(self):
+		'''
+		:rtype: bool
+		:return: whether there are no items waiting
+		'''
+		return not (self.items or self.urgent)
+
+
+class Bus:
+	'''
+	.. versionadded:: 2.3.0
+
+	Delivers the data packets and messages that the
+	:py:class:`rsudp.c_consumer.Consumer` receives to the
+	sub-consumers that asked for them. Each sub-consumer has a
+	:py:class:`Subscription` with the channels and kinds of message it
+	wants, so an Alert that listens to ``EHZ`` is never handed the other
+	channels' packets. The subscriptions that want each routing key
+	(kind of item and channel) are worked out once and kept.
+
+	.. code-block:: python
+
+		>>> bus = Bus()
+		>>> alert = bus.subscribe(channels=['EHZ'], kinds=['DATA'])
+		>>> sound = bus.subscribe(kinds=['ALARM'])
+		>>> bus.publish_many([packet_ehz, packet_enz, b'ALARM 2020-02-21T19:58:50.292Z'])
+		>>> alert.qsize(), sound.qsize()
+		(1, 1)
+
+	'''
+	def __init__(self):
+		self.subscriptions = []
+		self.routes = {}
+
+	def subscribe(self, maxsize=0, channels=None, kinds=None, policy='block'):
+		'''
+		Adds a subscription to the bus.
+
+		:param int maxsize: most items held before the overflow policy applies (0 = no limit)
+		:param channels: channels to receive data from (``None`` = all)
+		:type channels: list or None
+		:param kinds: kinds of item to receive (``None`` = all)
+		:type kinds: list or None
+		:param str policy: overflow policy (see :py:class:`Subscription`)
+		:rtype: rsudp.bus.Subscription
+		'''
+		sub = Subscription(maxsize=maxsize, channels=channels, kinds=kinds, policy=policy, bus=self)
+		self.subscriptions.append(sub)
+		self.reroute()
+		return sub
+
+	def reroute(self):
+		'''
+		Forgets the worked-out routes, after a subscription has changed.
+		'''
+		self.routes = {}
+
+	def subscribers(self, key):
+		'''
+		:param tuple key: routing key (see :py:func:`route`)
+		:rtype: list
+		:return: the subscriptions that want items with this routing key
+		'''
+		try:
+			return self.routes[key]
+		except KeyError:
+			subs = [sub for sub in self.subscriptions if sub.wants(key)]
+			self.routes[key] = subs
+			return subs
+
+	def publish(self, item):
+		'''
+		Delivers one item to the subscriptions that want it.
+
+		:param item: a data packet or message
+		:type item: rsudp.raspberryshake.Packet or bytes
+		'''
+		for sub in self.subscribers(route(item)):
+			sub.put(item)
+
+	def publish_urgent(self, msg):
+		'''
+		Delivers an ``ALARM`` or ``RESET`` message to the subscriptions
+		that want it right away, ahead of any data waiting in their queues,
+		and wakes their consumers.
+		This is how a consumer that raises an alarm (see
+		:py:meth:`rsudp.raspberryshake.ConsumerThread.announce`) reaches the
+		notifiers without waiting for the Producer or the master consumer.
+		The time the message is raised is stamped on it
+		(:py:attr:`rsudp.raspberryshake.Message.sent`) so that each subscription can
+		log how long delivery took.
+
+		:param rsudp.raspberryshake.Message msg: the message
+		'''
+		msg.sent = msg.sent or monotonic_ns()
+		for sub in self.subscribers(route(msg)):
+			sub.put_urgent(msg)
+
+	def publish_many(self, items):
+		'''
+		Delivers a list of items, handing each subscription all the
+		items it wants at once.
+
+		:param list items: data packets and messages
+		'''
+		out = {}
+		for item in items:
+			for sub in self.subscribers(route(item)):
+				try:
+					out[sub].append(item)
+				except KeyError:
+					out[sub] = [item]
+		for sub, its in out.items():
+			sub.put_many(its)
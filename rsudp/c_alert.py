@@ -1,8 +1,8 @@
 import sys
 import time
-from datetime import timedelta
 import rsudp.raspberryshake as rs
-from obspy.signal.trigger import recursive_sta_lta, trigger_onset
+from rsudp.ringbuffer import StreamBuffer
+from rsudp.dsp import FilterStage, DeconvStage, StaLta
 from rsudp import printM, printW, printE
 from rsudp import COLOR, helpers
 from rsudp.test import TEST
@@ -17,14 +17,19 @@ class Alert(rs.ConsumerThread):
 	"""
 	A data consumer class that listens to a specific incoming data channel
 	and calculates a recursive STA/LTA (short term average over long term 
-	average). If a threshold of STA/LTA ratio is exceeded, the class
-	sets the :py:data:`alarm` flag to the alarm time as a
-	:py:class:`obspy.core.utcdatetime.UTCDateTime` object.
-	The :py:class:`rsudp.p_producer.Producer` will see this flag
-	and send an :code:`ALARM` message to the queues with the time set here.
-	Likewise, when the :py:data:`alarm_reset` flag is set with a
-	:py:class:`obspy.core.utcdatetime.UTCDateTime`,
-	the Producer will send a :code:`RESET` message to the queues.
+	average). The deconvolution, filter and STA/LTA state is kept between packets
+	(see :py:class:`rsudp.dsp.DeconvStage` and :py:class:`rsudp.dsp.StaLta`),
+	so only new samples are processed.
+	If a threshold of STA/LTA ratio is exceeded, the class
+	sends an :code:`ALARM` message with the alarm time, channel and
+	STA/LTA ratio straight to the other consumers'
+	queues, ahead of any waiting data
+	(see :py:meth:`rsudp.raspberryshake.ConsumerThread.announce`).
+	Likewise, when the STA/LTA ratio falls below the reset level,
+	it sends a :code:`RESET` message.
+	(If it is not connected to a bus, it sets the :py:data:`alarm`
+	and :py:data:`alarm_reset` flags for the
+	:py:class:`rsudp.p_producer.Producer` to send them instead.)
 
 	:param float sta: short term average (STA) duration in seconds.
 	:param float lta: long term average (LTA) duration in seconds.
@@ -161,6 +166,9 @@ class Alert(rs.ConsumerThread):
 		self.stream = rs.Stream()
 
 		self._set_channel(cha)
+		self.buffer = StreamBuffer(seconds=self.lta + 1. / rs.sps, chans=[self.cha], fill_value='latest')
+		self.channels = [self.cha]		# only this channel's data is delivered
+		self.kinds = ['DATA']
 
 		self.sps = rs.sps
 		self.inv = rs.inv
@@ -180,20 +188,38 @@ class Alert(rs.ConsumerThread):
 		self._set_filt(bp)
 		self._print_filt()
 
+		# streaming filter and trigger state
+		self.new = 0	# samples added to the buffer since the last STA/LTA update
+		self.chunk_start = 0
+		self.chunk_end = 0
+		self.onset = False
+		self.trigger = StaLta(int(self.sta * self.sps), int(self.lta * self.sps))
+		self.deconvolver = False
+		if self.deconv:
+			self.deconvolver = DeconvStage(self.deconv, self.sps, sender=self.sender)(self.cha)
+		self.sosfilter = False
+		if self.filt:
+			self.sosfilter = FilterStage(self.filt, self.sps, freqmin=self.freqmin,
+										 freqmax=self.freqmax, freq=self.freq,
+										 sender=self.sender)()
+
 
 	def _getq(self):
 		'''
-		Reads data from the queue and updates the stream.
+		Reads data from the queue and writes it to the channel buffer.
 
 		:rtype: bool
-		:return: Returns ``True`` if stream is updated, otherwise ``False``.
+		:return: Returns ``True`` if new samples were added to the buffer, otherwise ``False``.
 		'''
 		d = self.queue.get(True, timeout=None)
 		self.queue.task_done()
-		if self.cha in str(d):
-			self.raw = rs.update_stream(stream=self.raw, d=d, fill_value='latest')
-			return True
-		elif 'TERM' in str(d):
+		if isinstance(d, rs.Packet):
+			if d.cha == self.cha:
+				n = self.buffer.write(d.cha, d.time, d.data)
+				self.new += n
+				return n > 0
+			return False
+		elif d.kind == rs.MsgKind.TERM:
 			self.alive = False
 			printM('Exiting.', self.sender)
 			sys.exit()
@@ -201,14 +227,6 @@ class Alert(rs.ConsumerThread):
 			return False
 
 
-	def _deconvolve(self):
-		'''
-		Deconvolves the stream associated with this class.
-		'''
-		if self.deconv:
-			helpers.deconvolve(self)
-
-
 	def _subloop(self):
 		'''
 		Gets the queue and figures out whether or not the specified channel is in the packet.
@@ -223,22 +241,35 @@ class Alert(rs.ConsumerThread):
 
 	def _filter(self):
 		'''
-		Filters the stream associated with this class.
+		Deconvolves and filters the samples that arrived since the last call
+		and updates the STA/LTA with them. :py:data:`self.stalta`
+		holds the STA/LTA value of each new sample.
 		'''
-		if self.filt:
-			if self.filt in 'bandpass':
-				self.stalta = recursive_sta_lta(
-							self.stream[0].copy().filter(type=self.filt,
-							freqmin=self.freqmin, freqmax=self.freqmax),
-							int(self.sta * self.sps), int(self.lta * self.sps))
-			else:
-				self.stalta = recursive_sta_lta(
-							self.stream[0].copy().filter(type=self.filt,
-							freq=self.freq),
-							int(self.sta * self.sps), int(self.lta * self.sps))
-		else:
-			self.stalta = recursive_sta_lta(self.stream[0],
-					int(self.sta * self.sps), int(self.lta * self.sps))
+		ring = self.buffer[self.cha]
+		n = min(self.new, ring.count)
+		self.new = 0
+		data = ring.view(n)
+		self.chunk_start = ring.starttime(n)
+		self.chunk_end = ring.endtime()
+		if self.deconvolver:
+			# deconvolved samples come out a little behind the raw ones
+			data = self.deconvolver(data)
+			lag = self.deconvolver.delay / self.sps
+			self.chunk_start -= lag
+			self.chunk_end -= lag
+		if self.sosfilter:
+			data = self.sosfilter(data)
+		self.stalta = self.trigger(data)
+
+
+	def _onset(self):
+		'''
+		Returns the time of the first sample in the current chunk above the threshold.
+
+		:rtype: obspy.core.utcdatetime.UTCDateTime
+		'''
+		i = int(np.argmax(self.stalta > self.thresh))
+		return rs.UTCDateTime(self.chunk_start + i / self.sps)
 
 
 	def _is_trigger(self):
@@ -265,6 +296,7 @@ class Alert(rs.ConsumerThread):
 			else:
 				self.exceed_timer_running = True
 				self.exceed_timer_start = time.time()
+				self.onset = self._onset()
 
 		else:
 			if self.exceed_timer_running:
@@ -296,13 +328,12 @@ class Alert(rs.ConsumerThread):
 		'''
 		Trigger activation logic
 		'''
-		self.alarm = helpers.fsec(self.stream[0].stats.starttime + timedelta(seconds=
-																			 trigger_onset(self.stalta, self.thresh,
-																						   self.reset)[-1][0] *
-																			 self.stream[0].stats.delta))
+		onset = helpers.fsec(self.onset if (self.duration and self.onset) else self._onset())
+		# send the ALARM before anything else
+		self.announce(helpers.msg_alarm(onset, cha=self.cha, stalta=round(float(self.stalta.max()), 3)))
 		print()
 		printM('Trigger threshold of %s exceeded at %s'
-			   % (self.thresh, self.alarm.strftime('%Y-%m-%d %H:%M:%S.%f')[:22]), self.sender)
+			   % (self.thresh, onset.strftime('%Y-%m-%d %H:%M:%S.%f')[:22]), self.sender)
 		printM('Trigger will reset when STA/LTA goes below %s...' % self.reset, sender=self.sender)
 		COLOR['current'] = COLOR['purple']
 		if self.testing:
@@ -312,12 +343,13 @@ class Alert(rs.ConsumerThread):
 		'''
 		Trigger deactivation logic
 		'''
-		self.alarm_reset = helpers.fsec(self.stream[0].stats.endtime)  # lazy; effective
+		reset = helpers.fsec(rs.UTCDateTime(self.chunk_end))
+		self.announce(helpers.msg_reset(reset, cha=self.cha, stalta=round(float(self.maxstalta), 3)))
 		print()
 		printM('Max STA/LTA ratio reached in alarm state: %s' % (round(self.maxstalta, 3)),
 			   self.sender)
 		printM('Earthquake trigger reset and active again at %s' % (
-			self.alarm_reset.strftime('%Y-%m-%d %H:%M:%S.%f')[:22]),
+			reset.strftime('%Y-%m-%d %H:%M:%S.%f')[:22]),
 			   self.sender)
 		self.maxstalta = 0
 		COLOR['current'] = COLOR['green']
@@ -330,8 +362,7 @@ class Alert(rs.ConsumerThread):
 		'''
 		if self.debug:
 			msg = '\r%s [%s] Threshold: %s; Current max STA/LTA: %.4f' % (
-					(self.stream[0].stats.starttime + timedelta(seconds=
-					 len(self.stream[0].data) * self.stream[0].stats.delta)).strftime('%Y-%m-%d %H:%M:%S'),
+					rs.UTCDateTime(self.chunk_end + 1. / self.sps).strftime('%Y-%m-%d %H:%M:%S'),
 					self.sender,
 					self.thresh,
 					round(np.max(self.stalta[-50:]), 4)
@@ -341,8 +372,8 @@ class Alert(rs.ConsumerThread):
 
 	def run(self):
 		"""
-		Reads data from the queue into a :class:`obspy.core.stream.Stream` object,
-		then runs a :func:`obspy.signal.trigger.recursive_sta_lta` function to
+		Reads data from the queue into a :class:`rsudp.ringbuffer.StreamBuffer` object,
+		then feeds the new samples through a streaming :class:`rsudp.dsp.StaLta` to
 		determine whether to raise an alert flag (:py:data:`rsudp.c_alert.Alert.alarm`).
 		The producer reads this flag and uses it to notify other consumers.
 		"""
@@ -358,24 +389,13 @@ class Alert(rs.ConsumerThread):
 		while True:
 			self._subloop()
 
-			self.raw = rs.copy(self.raw)	# necessary to avoid memory leak
-			self.stream = self.raw.copy()
-			self._deconvolve()
+			# deconvolve, filter and update the STA/LTA with the new samples
+			self._filter()
 
 			if n > wait_pkts:
-				# if the trigger is activated
-				obstart = self.stream[0].stats.endtime - timedelta(seconds=self.lta)	# obspy time
-				self.raw = self.raw.slice(starttime=obstart)		# slice the stream to the specified length (seconds variable)
-				self.stream = self.stream.slice(starttime=obstart)	# slice the stream to the specified length (seconds variable)
-
-				# filter
-				self._filter()
 				# figure out if the trigger has gone off
 				self._is_trigger()
 
-				# copy the stream (necessary to avoid memory leak)
-				self.stream = rs.copy(self.stream)
-
 				# print the current STA/LTA calculation
 				self._print_stalta()
 
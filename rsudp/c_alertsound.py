@@ -1,5 +1,5 @@
 import sys, os
-from rsudp.raspberryshake import ConsumerThread
+from rsudp.raspberryshake import ConsumerThread, Packet, MsgKind
 from rsudp import printM, printW, printE
 from rsudp.test import TEST
 import subprocess
@@ -89,6 +89,9 @@ class AlertSound(ConsumerThread):
 		super().__init__()
 		self.sender = 'AlertSound'
 		self.alive = True
+		self.channels = []
+		self.kinds = ['ALARM']
+		self.overflow = 'coalesce'
 		self.testing = testing
 
 		self.sound = soundloc
@@ -132,11 +135,13 @@ class AlertSound(ConsumerThread):
 		while True:
 			d = self.queue.get()
 			self.queue.task_done()
-			if 'TERM' in str(d):
+			if isinstance(d, Packet):
+				continue
+			elif d.kind == MsgKind.TERM:
 				self.alive = False
 				self.devnull.close()
 				printM('Exiting.', self.sender)
 				sys.exit()
-			elif 'ALARM' in str(d):
+			elif d.kind == MsgKind.ALARM:
 				if self.sound and pydub_exists:
 					self._play()
@@ -1,6 +1,7 @@
 import sys
 from threading import Thread
 from rsudp import printM, printW, printE
+from rsudp.bus import route, TERM
 from rsudp.test import TEST
 
 
@@ -8,14 +9,17 @@ class Consumer(Thread):
 	"""
 	The main consumer process. This consumer reads
 	queue messages from the :class:`rsudp.p_producer.Producer`
-	and distributes those messages to each sub-consumer in ``destinations``.
+	and publishes them on the :py:class:`rsudp.bus.Bus`, which passes each
+	one only to the sub-consumers subscribed to its channel and kind.
+	Lists of items (batches put on the queue by the Producer)
+	are published together, but sub-consumers still receive one item at a time.
 
 	:param queue.Queue queue: queue of data and messages sent by :class:`rsudp.p_producer.Producer`
-	:param list destinations: list of :py:class:`queue.Queue` objects to pass data to
+	:param rsudp.bus.Bus bus: the bus the sub-consumers are subscribed to
 	"""
 
 
-	def __init__(self, queue, destinations, testing=False):
+	def __init__(self, queue, bus, testing=False):
 		"""
 		Initializes the main consumer. 
 		
@@ -24,7 +28,7 @@ class Consumer(Thread):
 
 		self.sender = 'Consumer'
 		self.queue = queue
-		self.destinations = destinations
+		self.bus = bus
 		self.running = True
 		self.testing = testing
 
@@ -41,10 +45,17 @@ class Consumer(Thread):
 				p = self.queue.get()
 				self.queue.task_done()
 
-				for q in self.destinations:
-					q.put(p)
+				items = p if isinstance(p, list) else [p]
+				term = False
+				for i, item in enumerate(items):
+					if route(item)[0] == TERM:
+						# nothing after TERM is delivered
+						items = items[:i+1]
+						term = True
+						break
+				self.bus.publish_many(items)
 
-				if 'TERM' in str(p):
+				if term:
 					printM('Exiting.', self.sender)
 					break
 
@@ -1,6 +1,6 @@
 import sys, os
 from rsudp import printM, printW, printE
-from rsudp.raspberryshake import ConsumerThread
+from rsudp.raspberryshake import ConsumerThread, Packet, MsgKind
 from rsudp.test import TEST
 
 
@@ -48,6 +48,9 @@ class Custom(ConsumerThread):
 		super().__init__()
 		self.sender = 'Custom'
 		self.alive = True
+		self.channels = []
+		self.kinds = ['ALARM']
+		self.overflow = 'coalesce'
 		self.testing = testing
 		self.codefile = False
 		self.win_ovr = win_ovr
@@ -109,11 +112,13 @@ class Custom(ConsumerThread):
 		while True:
 			d = self.queue.get()
 			self.queue.task_done()
-			if 'TERM' in str(d):
+			if isinstance(d, Packet):
+				continue
+			elif d.kind == MsgKind.TERM:
 				self.alive = False
 				printM('Exiting.', self.sender)
 				sys.exit()
-			elif 'ALARM' in str(d):
+			elif d.kind == MsgKind.ALARM:
 				printM('Got ALARM message...', sender=self.sender)
 				self.exec_code()
 
@@ -1,17 +1,247 @@
 import os, sys
+import time
+import errno
+import json
+import asyncio
+from queue import Empty
+import ctypes
 import socket as s
-from rsudp import printM, printW, printE
+import numpy as np
+from rsudp import printM, printW, printE, helpers, codec, dsp
 import rsudp.raspberryshake as rs
 from rsudp.test import TEST
 
+
+class _iovec(ctypes.Structure):
+	_fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+class _msghdr(ctypes.Structure):
+	_fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint32),
+				('msg_iov', ctypes.POINTER(_iovec)), ('msg_iovlen', ctypes.c_size_t),
+				('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+				('msg_flags', ctypes.c_int)]
+
+class _mmsghdr(ctypes.Structure):
+	_fields_ = [('msg_hdr', _msghdr), ('msg_len', ctypes.c_uint)]
+
+class _sockaddr_in(ctypes.Structure):
+	_fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_uint16),
+				('sin_addr', ctypes.c_uint8 * 4), ('sin_zero', ctypes.c_uint8 * 8)]
+
+
+def _load_sendmmsg():
+	'''
+	Finds :code:`sendmmsg` in the C library (Linux only).
+
+	:return: the function, or ``None`` if it is not available
+	'''
+	if not sys.platform.startswith('linux'):
+		return None
+	try:
+		f = ctypes.CDLL(None, use_errno=True).sendmmsg
+	except (OSError, AttributeError):
+		return None
+	f.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+	f.restype = ctypes.c_int
+	return f
+
+SENDMMSG = _load_sendmmsg()
+_WORD = np.uint64 if ctypes.sizeof(ctypes.c_void_p) == 8 else np.uint32	# pointers and sizes
+
+
+class Destination():
+	'''
+	.. versionadded:: 2.3.0
+
+	One address and port that :py:class:`Forward` sends to, with the
+	channels and kinds of message that go there, and counts of what
+	was sent and of send errors.
+
+	:param str addr: IP address or host name
+	:param int port: network port
+	:param cha: channel(s) to forward, as for the ``"channels"`` setting
+	:type cha: str or list
+	:param bool fwd_data: whether or not to forward data packets
+	:param bool fwd_alarms: whether or not to forward :code:`ALARM` and :code:`RESET` messages
+	:param str fmt: ``'text'`` to forward data packets as received, or ``'binary'`` to aggregate and compress them (see :py:mod:`rsudp.codec`)
+	:param float latency: for the binary format, the longest time in seconds a data packet waits to be sent with others
+	:param dict derive: a derived stream to send instead of the data as received (see :py:class:`rsudp.dsp.DerivedStream`)
+	:raise ValueError: if ``fmt`` is not a known format, or ``derive`` has unknown keys
+	'''
+	def __init__(self, addr, port, cha='all', fwd_data=True, fwd_alarms=False, fmt='text', latency=1.0,
+				 derive=None):
+		self.addr = addr
+		self.port = int(port)
+		self.chans = []
+		helpers.set_channels(self, cha)
+		self.fwd_data = fwd_data
+		self.fwd_alarms = fwd_alarms
+		if fmt not in ('text', 'binary'):
+			raise ValueError('unknown format %s' % fmt)
+		self.fmt = fmt
+		self.batcher = codec.Batcher(latency) if (fmt == 'binary') else None
+		self.derive = derive or None
+		if self.derive:
+			unknown = set(self.derive) - set(dsp.DERIVE_KEYS)
+			if unknown:
+				raise ValueError('unknown derived stream setting(s) %s' % sorted(unknown))
+		# destinations asking for the same derivation share its stream
+		self.stream = json.dumps(self.derive, sort_keys=True) if self.derive else None
+		self.sent = 0
+		self.errors = 0
+		self.warn_at = 1		# number of errors at which to warn next
+		ip = s.getaddrinfo(addr, self.port, s.AF_INET, s.SOCK_DGRAM)[0][4][0]
+		self.sockaddr = _sockaddr_in(s.AF_INET, s.htons(self.port), (ctypes.c_uint8 * 4)(*s.inet_aton(ip)))
+		self.name = ctypes.addressof(self.sockaddr)
+		self.target = (ip, self.port)
+		self.multicast = rs.is_multicast(ip)
+
+	def __str__(self):
+		return '%s:%s' % (self.addr, self.port)
+
+	def fail(self, e, sender='Forward'):
+		'''
+		Counts a send error, warning at the first one and then each time
+		the count grows tenfold.
+
+		:param e: the error
+		:param str sender: the name of the module sending
+		'''
+		self.errors += 1
+		if self.errors >= self.warn_at:
+			printE('Could not send to %s (%s errors so far): %s' % (self, self.errors, e), sender=sender)
+			while self.warn_at <= self.errors:
+				self.warn_at *= 10
+
+
+def destinations(addr, port, cha='all', fwd_data=True, fwd_alarms=False, fmt='text', latency=1.0, derive=None):
+	'''
+	.. versionadded:: 2.3.0
+
+	Makes the destination table of the ``"forward"`` settings section.
+	``cha``, ``fwd_data``, ``fwd_alarms``, ``fmt``, ``latency`` and ``derive`` apply to every destination,
+	or, to give each destination its own, can be lists with one entry per
+	address (so ``cha`` is then a list of lists).
+
+	.. code-block:: python
+
+		>>> destinations(['192.168.1.250', '192.168.1.251'], [8888, 8888],
+		...              cha=[['EHZ'], ['all']], fwd_data=[True, False], fwd_alarms=True)
+		[<rsudp.c_forward.Destination ...>, <rsudp.c_forward.Destination ...>]
+
+	:param list addr: IP addresses or host names
+	:param list port: network ports
+	:raise ValueError: if the lists are not all the same length, or a format is not known
+	:rtype: list
+	:return: list of :py:class:`Destination`
+	'''
+	def each(value, nested=False):
+		if isinstance(value, list) and (not nested or (value and isinstance(value[0], list))):
+			if len(value) != len(addr):
+				raise ValueError('%s settings for %s addresses' % (len(value), len(addr)))
+			return value
+		return [value] * len(addr)
+
+	if len(addr) != len(port):
+		raise ValueError('%s addresses and %s ports' % (len(addr), len(port)))
+	return [Destination(a, p, cha=c, fwd_data=d, fwd_alarms=al, fmt=f, latency=l, derive=dv)
+			for a, p, c, d, al, f, l, dv in zip(addr, port, each(cha, nested=True), each(fwd_data),
+												each(fwd_alarms), each(fmt), each(latency), each(derive))]
+
+
+class BatchSender():
+	'''
+	.. versionadded:: 2.3.0
+
+	Sends a batch of datagrams to their destinations from one socket.
+	Where the C library has :code:`sendmmsg` (Linux), a batch of at least
+	``min_mmsg`` datagrams goes to the kernel in one call (or a few, for
+	batches longer than ``size``); elsewhere, and for smaller batches, each
+	datagram is sent with :py:meth:`socket.socket.sendto`, which costs less
+	than setting up the :code:`sendmmsg` call when there are only a few
+	datagrams to send. Each :py:class:`Destination` counts the
+	datagrams sent to it and the errors, so one unreachable destination
+	does not stop the others.
+
+	:param socket.socket sock: the socket to send from
+	:param int size: most datagrams passed to the kernel in one call
+	:param int min_mmsg: fewest datagrams to send with :code:`sendmmsg`
+	:param str sender: the name of the module sending
+	'''
+	def __init__(self, sock, size=256, min_mmsg=64, sender='Forward'):
+		self.sock = sock
+		self.size = size
+		self.min_mmsg = min_mmsg
+		self.sender = sender
+		self.mmsg = SENDMMSG
+		if self.mmsg:
+			self.iovs = (_iovec * size)()
+			self.msgs = (_mmsghdr * size)()
+			for i in range(size):
+				self.msgs[i].msg_hdr.msg_iov = ctypes.pointer(self.iovs[i])
+				self.msgs[i].msg_hdr.msg_iovlen = 1
+				self.msgs[i].msg_hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+			# the fields that change with each batch, as arrays, so they are filled in one step
+			word = np.dtype(_WORD).itemsize
+			self.iov_words = np.frombuffer(self.iovs, dtype=_WORD).reshape(size, -1)
+			self.names = np.frombuffer(self.msgs, dtype=_WORD).reshape(size, -1)[:, _msghdr.msg_name.offset // word]
+
+	def send(self, batch):
+		'''
+		:param list batch: list of ``(data, destination)`` tuples, where ``data`` is bytes and ``destination`` is a :py:class:`Destination`
+		'''
+		if (not self.mmsg) or (len(batch) < self.min_mmsg):
+			for data, dest in batch:
+				try:
+					self.sock.sendto(data, dest.target)
+					dest.sent += 1
+				except OSError as e:
+					dest.fail(e, sender=self.sender)
+			return
+		for start in range(0, len(batch), self.size):
+			self._sendmmsg(batch[start:start+self.size])
+
+	def _sendmmsg(self, batch):
+		n = len(batch)
+		datas = [data for data, dest in batch]
+		buf = b''.join(datas)	# one buffer, so that the data addresses are its start plus offsets
+		lens = np.fromiter(map(len, datas), dtype=_WORD, count=n)
+		self.iov_words[:n, 1] = lens
+		self.iov_words[:n, 0] = np.cumsum(lens) - lens + _WORD(ctypes.cast(buf, ctypes.c_void_p).value)
+		self.names[:n] = np.fromiter((dest.name for data, dest in batch), dtype=_WORD, count=n)
+		fd, i = self.sock.fileno(), 0
+		while i < n:
+			r = self.mmsg(fd, ctypes.addressof(self.msgs[i]), n - i, 0)
+			if r < 0:
+				err = ctypes.get_errno()
+				if err == errno.EINTR:
+					continue
+				# the first datagram left could not be sent; count it and carry on after it
+				batch[i][1].fail(OSError(err, os.strerror(err)), sender=self.sender)
+				i += 1
+			else:
+				for data, dest in batch[i:i+r]:
+					dest.sent += 1
+				i += r
+
+
 class Forward(rs.ConsumerThread):
 	"""
-	Single-destination data forwarding module. This consumer reads
+	Data forwarding module. This consumer reads
 	queue messages from the :class:`rsudp.c_consumer.Consumer`
-	and forwards those messages to a specified address and port.
-	Multiple of these threads can be started in order to deliver to
-	more than one destination. (see the :ref:`datacast-forwarding`
-	section in :doc:`settings`)
+	and forwards those messages to a table of destinations
+	(see :py:class:`Destination`), each with its own channels and
+	choice of data and alarm messages. Everything waiting on the queue
+	is taken at once, and all the datagrams for all the destinations
+	are sent from one socket together (see :py:class:`BatchSender`).
+	Destinations that take the binary format get their data packets
+	collected and compressed into fewer, smaller datagrams, each sent
+	within the destination's latency budget (see :py:class:`rsudp.codec.Batcher`).
+	Destinations can ask for a derived stream (decimated, band-limited or
+	an envelope, see :py:class:`rsudp.dsp.DerivedStream`) instead of the data
+	as received; each derivation is computed once for each channel and
+	shared by all the destinations that ask for it.
+	(see the :ref:`datacast-forwarding` section in :doc:`settings`)
 
 	.. versionadded:: 1.0.2
 
@@ -19,6 +249,11 @@ class Forward(rs.ConsumerThread):
 		(find boolean settings :code:`"fwd_data"` and :code:`"fwd_alarms"` in
 		settings json files built by this version and later).
 
+	.. versionchanged:: 2.3.0
+
+		One Forward module serves every destination in ``dests``.
+		Without ``dests``, it forwards to ``addr`` and ``port`` as before.
+
 	:param str addr: IP address to pass UDP data to
 	:param str port: network port to pass UDP data to (at specified address)
 	:param bool fwd_data: whether or not to forward raw data packets
@@ -26,36 +261,54 @@ class Forward(rs.ConsumerThread):
 	:param cha: channel(s) to forward. others will be ignored.
 	:type cha: str or list
 	:param queue.Queue q: queue of data and messages sent by :class:`rsudp.c_consumer.Consumer`
+	:param list dests: list of :py:class:`Destination` (see :py:func:`destinations`); if given, ``addr``, ``port``, ``fwd_data``, ``fwd_alarms`` and ``cha`` are not used
+	:param int ttl: time to live of datagrams sent to multicast groups (``1`` keeps them on the local network)
+	:param str interface: IP address of the network interface to send multicast datagrams from (``''`` lets the system choose)
 	"""
 
-	def __init__(self, num, addr, port, fwd_data, fwd_alarms, cha, q, testing=False):
+	def __init__(self, num=0, addr=None, port=None, fwd_data=True, fwd_alarms=False, cha='all',
+				 q=False, testing=False, dests=None, ttl=1, interface=''):
 		"""
 		Initializes data forwarding module.
-		
+
 		"""
 		super().__init__()
 
-		self.sender = 'Forward #%s (%s:%s)' % (num, addr, port)
+		if dests is None:
+			dests = [Destination(addr, port, cha=cha, fwd_data=fwd_data, fwd_alarms=fwd_alarms)]
+		self.dests = dests
+		if len(dests) == 1:
+			self.sender = 'Forward #%s (%s)' % (num, dests[0])
+		else:
+			self.sender = 'Forward (%s destinations)' % len(dests)
 		self.queue = q
 		self.testing = testing
-		self.addr = addr
-		self.port = port
-		self.fwd_data = fwd_data
-		self.fwd_alarms = fwd_alarms
-		self.chans = []
-		cha = rs.chns if (cha == 'all') else cha
-		cha = list(cha) if isinstance(cha, str) else cha
-		l = rs.chns
-		for c in l:
-			n = 0
-			for uch in cha:
-				if (uch.upper() in c) and (c not in str(self.chans)):
-					self.chans.append(c)
-				n += 1
-		if len(self.chans) < 1:
-			self.chans = rs.chns
+		self.max_batch = 256		# most items taken off the queue at once
+		# destinations of each channel's data, and of alarm messages
+		self.data_dests = {c: [d for d in dests if d.fwd_data and (c in d.chans)] for c in rs.chns}
+		self.alarm_dests = [d for d in dests if d.fwd_alarms]
+		self.batched = [d for d in dests if d.batcher]
+		self.ttl = int(ttl)
+		self.interface = interface
+		# one stream per derivation and channel, however many destinations use it
+		self.streams = {}
+		for d in dests:
+			if d.stream and d.fwd_data:
+				chans = self.streams.setdefault(d.stream, {})
+				for c in d.chans:
+					if c not in chans:
+						chans[c] = dsp.DerivedStream(d.derive, rs.sps)
+		self.timer = None
+		self.chans = [c for c in rs.chns if self.data_dests[c]]
+		# only what is forwarded is delivered (data is always delivered when testing)
+		self.channels = None if testing else self.chans
+		self.kinds = ((['DATA'] if (self.chans or testing) else []) +
+					  (['ALARM', 'RESET'] if self.alarm_dests else []))
+		self.overflow = 'drop-oldest'
 		self.running = True
 		self.alive = True
+		self.sock = None
+		self.out = None
 
 		printM('Starting.', self.sender)
 
@@ -65,47 +318,153 @@ class Forward(rs.ConsumerThread):
 		Exits the thread.
 		"""
 		self.alive = False
+		self._stats()
 		printM('Exiting.', self.sender)
 		sys.exit()
 
 
-	def run(self):
+	def _stats(self):
+		"""
+		Logs what was sent to each destination.
 		"""
-		Gets and distributes queue objects to another address and port on the network.
+		for d in self.dests:
+			printM('%s: %s datagrams sent, %s errors' % (d, d.sent, d.errors), sender=self.sender)
+
+
+	def _open(self):
+		"""
+		Opens the socket to forward from.
 		"""
 		printM('Opening socket...', sender=self.sender)
 		socket_type = s.SOCK_DGRAM if os.name in 'nt' else s.SOCK_DGRAM | s.SO_REUSEADDR
-		sock = s.socket(s.AF_INET, socket_type)
+		self.sock = s.socket(s.AF_INET, socket_type)
+		if any(d.multicast for d in self.dests):
+			self.sock.setsockopt(s.IPPROTO_IP, s.IP_MULTICAST_TTL, self.ttl)
+			if self.interface:
+				self.sock.setsockopt(s.IPPROTO_IP, s.IP_MULTICAST_IF, s.inet_aton(self.interface))
+			printM('Sending to multicast groups with TTL %s from %s'
+				   % (self.ttl, self.interface or 'the default interface'), sender=self.sender)
+		self.out = BatchSender(self.sock, sender=self.sender)
 
-		msg_data = '%s data' % (self.chans) if self.fwd_data else ''
-		msg_and = ' and ' if (self.fwd_data and self.fwd_alarms) else ''
-		msg_alarms = 'ALARM / RESET messages' if self.fwd_alarms else ''
+		for d in self.dests:
+			msg_data = '%s data' % (d.chans) if d.fwd_data else ''
+			msg_and = ' and ' if (d.fwd_data and d.fwd_alarms) else ''
+			msg_alarms = 'ALARM / RESET messages' if d.fwd_alarms else ''
+			msg_fmt = (' (binary, sent within %s s)' % d.batcher.latency) if d.batcher else ''
+			if d.stream and d.fwd_data:
+				msg_data += ' derived as %s at %g sps' % (d.stream, next(iter(self.streams[d.stream].values())).rate)
+			printM('Forwarding %s%s%s to %s%s' % (msg_data, msg_and, msg_alarms, d, msg_fmt), sender=self.sender)
+		if self.out.mmsg:
+			printM('Sending in batches with sendmmsg.', sender=self.sender)
 
-		printM('Forwarding %s%s%s to %s:%s' % (msg_data, msg_and, msg_alarms, self.addr,
-											   self.port), sender=self.sender)
 
-		try:
-			while self.running:
-				p = self.queue.get()	# get a packet
-				self.queue.task_done()	# close the queue
+	def _forward(self, items):
+		"""
+		Forwards a list of data packets and messages to the destinations
+		that should get them, in one batch.
 
-				if 'TERM' in str(p):	# shutdown if there's a TERM message on the queue
-					self._exit()
+		:param list items: data packets and messages
+		:rtype: bool
+		:return: ``False`` if there was a ``TERM`` message, otherwise ``True``
+		"""
+		batch = []
+		term = False
+		now = time.monotonic()
+		for p in items:
+			if isinstance(p, rs.Packet):
+				derived = {}
+				for d in self.data_dests.get(p.cha, ()):
+					q = p
+					if d.stream:
+						if d.stream not in derived:
+							derived[d.stream] = self.streams[d.stream][p.cha](p)
+						q = derived[d.stream]
+						if q is None:
+							continue
+					if d.batcher:
+						batch += [(dp, d) for dp in d.batcher.add(q, now)]
+					else:
+						batch.append((q.raw, d))
+				if self.testing:
+					TEST['c_forward'][1] = True
+			elif p.kind == rs.MsgKind.TERM:
+				term = True
+				break
+			elif (p.kind == rs.MsgKind.ALARM) or (p.kind == rs.MsgKind.RESET):
+				data = p.to_bytes()
+				for d in self.alarm_dests:
+					batch.append((data, d))
+		for d in self.batched:
+			# send what is due, or everything that is left before exiting
+			if term or (d.batcher.wait(now) == 0):
+				batch += [(dp, d) for dp in d.batcher.flush()]
+		if batch:
+			self.out.send(batch)
+		return not term
 
-				if 'IMGPATH' in str(p):
-					continue
 
-				if ('ALARM' in str(p)) or ('RESET' in str(p)):
-					if self.fwd_alarms:
-						sock.sendto(p, (self.addr, self.port))
-					continue
+	def _wait(self):
+		"""
+		:rtype: float or None
+		:return: seconds until the next binary datagram is due, or ``None`` if there is none waiting
+		"""
+		waits = [w for w in (d.batcher.wait() for d in self.batched) if w is not None]
+		return min(waits) if waits else None
 
-				if "{'" in str(p):
-					if (self.fwd_data) and (rs.getCHN(p) in self.chans):
-						sock.sendto(p, (self.addr, self.port))
 
-				if self.testing:
-					TEST['c_forward'][1] = True
+	def _send_due(self):
+		"""
+		Sends the binary datagrams that are due, and sets a timer for the
+		next ones (on the event loop of the :py:class:`rsudp.aio.Engine`).
+		"""
+		self.timer = None
+		if self.alive:
+			self._forward([])
+			wait = self._wait()
+			if wait is not None:
+				self.timer = asyncio.get_running_loop().call_later(wait, self._send_due)
+
+
+	async def handle(self, p):
+		"""
+		.. versionadded:: 2.3.0
+
+		Forwards one item. This is used instead of :py:meth:`run` when
+		the consumer runs on the event loop of the :py:class:`rsudp.aio.Engine`
+		(sending a UDP datagram does not wait for the network).
+
+		:param p: a data packet or message
+		:type p: rsudp.raspberryshake.Packet or rsudp.raspberryshake.Message
+		"""
+		if self.sock is None:
+			self._open()
+		if not self._forward([p]):
+			self.alive = False
+			if self.timer:
+				self.timer.cancel()
+			self._stats()
+			printM('Exiting.', self.sender)
+		elif (self.timer is None) and (self._wait() is not None):
+			self.timer = asyncio.get_running_loop().call_later(self._wait(), self._send_due)
+
+
+	def run(self):
+		"""
+		Gets and distributes queue objects to other addresses and ports on the network.
+		"""
+		self._open()
+		try:
+			while self.running:
+				try:
+					items = [self.queue.get(timeout=self._wait())]	# wait for a packet, or until data is due
+				except Empty:
+					items = []
+				while self.queue.qsize() and (len(items) < self.max_batch):
+					items.append(self.queue.get_nowait())	# and take whatever else is waiting
+				self.queue.task_done()
+
+				if not self._forward(items):	# shutdown if there's a TERM message on the queue
+					self._exit()
 
 		except Exception as e:
 			self.alive = False
@@ -113,4 +472,3 @@ class Forward(rs.ConsumerThread):
 			if self.testing:
 				TEST['c_forward'][1] = False
 			sys.exit(2)
-
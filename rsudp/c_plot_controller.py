@@ -57,6 +57,10 @@ class PlotsController():
 
     def run(self):
         self.get_queue()
+        if not getattr(self._plots[0], 'alive', True):
+            # TERM came before any data (e.g. when the station profile did not match)
+            printM('Exiting.', self.sender)
+            return
         for plot in self._plots:
             plot.setup(self)
 
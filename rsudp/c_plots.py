@@ -1,12 +1,12 @@
 import os, sys, platform
-import pkg_resources as pr
 import time
 import math
 import numpy as np
 from datetime import datetime, timedelta
-from obspy.signal.trigger import recursive_sta_lta, trigger_onset
 import rsudp.raspberryshake as rs
-from rsudp import printM, printW, printE, get_scap_dir, helpers
+from rsudp.ringbuffer import StreamBuffer
+from rsudp.dsp import FilterStage, DeconvStage
+from rsudp import printM, printW, printE, get_scap_dir, resource_path, helpers
 from rsudp.test import TEST
 import linecache
 import threading
@@ -15,23 +15,23 @@ QT = False
 QtGui = False
 PhotoImage = False
 try:
-    from matplotlib import use
+    # switching with pyplot already loaded makes sure the GUI can actually start
+    import matplotlib.pyplot as plt
     try:
-        use('Qt5Agg')
+        plt.switch_backend('Qt5Agg')
         from PyQt5 import QtGui
         QT = True
     except Exception as e:
         printW('Qt import failed. Trying Tk...')
         printW('detail: %s' % e, spaces=True)
         try:
-            use('TkAgg')
+            plt.switch_backend('TkAgg')
             from tkinter import PhotoImage
         except Exception as e:
             printE('Could not import either Qt or Tk, and the plot module requires at least one of them to run.', sender)
             printE('Please make sure either PyQt5 or Tkinter is installed.', sender, spaces=True)
             printE('detail: %s'% e, sender, spaces=True)
             raise ImportError('Could not import either Qt or Tk, and the plot module requires at least one of them to run')
-    import matplotlib.pyplot as plt
     import matplotlib.dates as mdates
     import matplotlib.image as mpimg
     from matplotlib import rcParams
@@ -97,6 +97,7 @@ class AbcPlot():
         self.units = None
         self.lines = None
         self.deconv = None
+        self.deconvolved = False
         self.controller = None
 
         self.kiosk = False
@@ -174,9 +175,16 @@ class AbcPlot():
 
     def deconvolve(self):
         '''
-        Send the streams to the central library deconvolve function.
+        Send the streams to the central library deconvolve function,
+        or take them from :py:data:`self.deconvolved` if the data is
+        deconvolved continuously as it arrives (see :py:class:`rsudp.dsp.DeconvStage`).
         '''
-        helpers.deconvolve(self)
+        if self.deconvolved:
+            self.stream = self.deconvolved.stream(copy=True)
+            for trace in self.stream:
+                trace.stats.units = self.deconvolved.stage.units(trace.stats.channel)
+        else:
+            helpers.deconvolve(self)
 
     def savefig(self, event_time=rs.UTCDateTime.now(), event_time_str=rs.UTCDateTime.now().strftime('%Y-%m-%d-%H%M%S')):
         '''
@@ -368,6 +376,17 @@ class Plot(AbcPlot):
         self.num_chans = len(self.chans)
 
         self.seconds = seconds
+        self.buffer = StreamBuffer(seconds=self.seconds, chans=self.chans, fill_value='latest')
+        if self.deconv:
+            # deconvolve continuously as data arrives instead of the whole window on every redraw
+            self.deconvolved = self.buffer.derive(DeconvStage(self.deconv, rs.sps, sender=self.sender))
+        self.filtered = False
+        if self.filter_waveform or self.filter_spectrogram:
+            # filter continuously as data arrives instead of refiltering the window on every redraw
+            self.filtered = (self.deconvolved or self.buffer).derive(FilterStage('bandpass', rs.sps, freqmin=self.filter_highpass,
+                                                           freqmax=self.filter_lowpass,
+                                                           corners=self.filter_corners,
+                                                           settle=True, sender=self.sender))
         self.pkts_in_period = rs.tr * rs.numchns * self.seconds  # theoretical number of packets received in self.seconds
 
         # Modes
@@ -467,7 +486,7 @@ class Plot(AbcPlot):
                               ) - np.timedelta64(self.seconds, 's')  # numpy time
         end = np.datetime64(self.stream[0].stats.endtime)  # numpy time
 
-        im = mpimg.imread(pr.resource_filename('rsudp', os.path.join('img', 'version1-01-small.png')))
+        im = mpimg.imread(resource_path('img', 'version1-01-small.png'))
         self.imax = self.fig.add_axes([0.015, 0.944, 0.2, 0.056], anchor='NW')  # [left, bottom, right, top]
         self.imax.imshow(im, aspect='equal', interpolation='bilinear')
         self.imax.axis('off')
@@ -554,7 +573,7 @@ class Plot(AbcPlot):
         Set RS plot icons.
         '''
         mgr = plt.get_current_fig_manager()
-        ico = pr.resource_filename('rsudp', os.path.join('img', ICON))
+        ico = resource_path('img', ICON)
         if QT:
             mgr.window.setWindowIcon(QtGui.QIcon(ico))
         else:
@@ -564,7 +583,7 @@ class Plot(AbcPlot):
             except:
                 printW('Failed to set PNG icon image, trying .ico instead', sender=self.sender)
                 try:
-                    ico = pr.resource_filename('rsudp', os.path.join('img', ICON2))
+                    ico = resource_path('img', ICON2)
                     ico = PhotoImage(file=ico)
                     mgr.window.tk.call('wm', 'iconphoto', mgr.window._w, ico)
                 except:
@@ -713,6 +732,23 @@ class Plot(AbcPlot):
                 fontsize=8, color=self.fgcolor, horizontalalignment='left', verticalalignment='top',
                 transform=self.ax[i * self.mult + 1].transAxes)
 
+    def _filter(self, stream):
+        '''
+        Bandpass filters the traces in a stream.
+        The traces are replaced by the continuously filtered data from
+        :py:data:`self.filtered` once it covers the whole window.
+        Until then the window is filtered as a whole.
+
+        :param obspy.core.stream.Stream stream: the stream to filter (in place)
+        '''
+        for tr in stream:
+            cha = tr.stats.channel
+            if self.filtered and (cha in self.filtered) and (self.filtered[cha].count >= len(tr.data)):
+                tr.data = self.filtered[cha].view(len(tr.data)).copy()
+            else:
+                tr.filter('bandpass', freqmin=self.filter_highpass, freqmax=self.filter_lowpass,
+                          corners=self.filter_corners)
+
     def update_plot(self):
         '''
         Redraw the plot with new data.
@@ -720,11 +756,8 @@ class Plot(AbcPlot):
         the number of channels times the data packet arrival rate in Hz.
         This has the effect of making the plot update once per second.
         '''
-        obstart = self.stream[0].stats.endtime - timedelta(seconds=self.seconds)  # obspy time
         start = np.datetime64(self.stream[0].stats.endtime) - np.timedelta64(self.seconds, 's')  # numpy time
         end = np.datetime64(self.stream[0].stats.endtime)  # numpy time
-        self.raw = self.raw.slice(starttime=obstart)  # slice the stream to the specified length (seconds variable)
-        self.stream = self.stream.slice(starttime=obstart)  # slice the stream to the specified length (seconds variable)
         self._sort_stream_channels()
         for i in range(self.num_chans):  # for each channel, update the plots
             mean = int(round(np.mean(self.stream[i].data)))
@@ -744,15 +777,22 @@ class Plot(AbcPlot):
         :py:data:`screencap==True` then aplot image will be saved when the
         event is :py:data:`self.save_pct` of the way across the plot.
         '''
-        if 'TERM' in str(d):
+        if isinstance(d, rs.Packet):
+            if d.cha in self.chans:
+                self.buffer.update(d)
+                return True
+            return False
+
+        if d.kind == rs.MsgKind.TERM:
             plt.close()
             if 'SELF' in str(d):
                 printM('Plot has been closed, plot thread will exit.', self.sender)
             self.alive = False
-            self.controller.alive = False
+            if self.controller:
+                self.controller.alive = False
             rs.producer = False
 
-        elif 'ALARM' in str(d):
+        elif d.kind == rs.MsgKind.ALARM:
             self.events += 1  # add event to count
             self.save_timer -= 1  # don't push the save time forward if there are a large number of alarm events
             event = [self.save_timer + int(self.save_pct * self.pkts_in_period),
@@ -771,12 +811,7 @@ class Plot(AbcPlot):
                               fontsize=14, color=self.fgcolor, x=0.52)
             self.fig.canvas.manager.set_window_title('(%s) %s - Raspberry Shake Monitor' % (self.events, self.stn))
 
-        if rs.getCHN(d) in self.chans:
-            self.raw = rs.update_stream(
-                stream=self.raw, d=d, fill_value='latest')
-            return True
-        else:
-            return False
+        return False
 
     def setup(self, controller, *args, **kwargs):
         """
@@ -788,6 +823,7 @@ class Plot(AbcPlot):
         for i in range((self.totchns) * 2):  # fill up a stream object
             self.controller.get_queue()
         self.set_sps()
+        self.raw = self.buffer.stream()
         self.deconvolve()
         self._sort_stream_channels()
         # instantiate a figure and set basic params
@@ -829,18 +865,14 @@ class Plot(AbcPlot):
         else:
             i += 1
 
-        self.raw = rs.copy(self.raw)  # and could eventually crash the machine
-        self.stream = rs.copy(self.stream)  # essential, otherwise the stream has a memory leak
-        self.stream_uf = rs.copy(self.stream_uf)  # Applied the same fix/patch as above to prevent memory leak
+        self.raw = self.buffer.stream()  # views of the last self.seconds of data; deconvolve() copies them or the deconvolved data
         self.deconvolve()
         self.stream.detrend(type='demean')  # Detrend the stream to support filtering for a non-deconvolved stream
         self.stream_uf = self.stream.copy()  # Make an copy of the unfiltered Stream to be used with the Spectrogram
         if self.filter_waveform:  # filter stream if waveform filtering is enabled.
-            self.stream.filter('bandpass', freqmin=self.filter_highpass, freqmax=self.filter_lowpass,
-                               corners=self.filter_corners)  # Filter for the waveform.
+            self._filter(self.stream)  # Filter for the waveform.
         if self.filter_spectrogram:  # filter stream if spectrogram filtering is enabled.
-            self.stream_uf.filter('bandpass', freqmin=self.filter_highpass, freqmax=self.filter_lowpass,
-                                  corners=self.filter_corners)
+            self._filter(self.stream_uf)
         self.update_plot()
         if u >= 0:  # avoiding a matplotlib broadcast error
             self.figloop()
@@ -920,9 +952,11 @@ class PlotAlert(Plot):
         '''
         Get data from the queue and test for whether it has certain strings.
         '''
-        if 'ALARM' in str(d):
+        if isinstance(d, rs.Packet):
+            pass
+        elif d.kind == rs.MsgKind.ALARM:
             self.s_lines.append(np.datetime64(helpers.fsec(helpers.get_msg_time(d))))
-        elif 'RESET' in str(d):
+        elif d.kind == rs.MsgKind.RESET:
             self.e_lines.append(np.datetime64(helpers.fsec(helpers.get_msg_time(d))))
         return super().getq(d)
 
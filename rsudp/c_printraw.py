@@ -1,5 +1,5 @@
 import sys
-from rsudp.raspberryshake import ConsumerThread
+from rsudp.raspberryshake import ConsumerThread, Packet, MsgKind
 from rsudp import printM, printW, printE
 from rsudp.test import TEST
 
@@ -22,6 +22,7 @@ class PrintRaw(ConsumerThread):
 		super().__init__()
 		self.sender = 'Print'
 		self.alive = True
+		self.overflow = 'drop-oldest'
 		self.testing = testing
 
 		if q:
@@ -41,11 +42,16 @@ class PrintRaw(ConsumerThread):
 		while True:
 			d = self.queue.get()
 			self.queue.task_done()
-			if 'TERM' in str(d):
+			if isinstance(d, Packet):
+				if not self.testing:
+					print(str(d.raw))
+				else:
+					TEST['c_print'][1] = True
+			elif d.kind == MsgKind.TERM:
 				self.alive = False
 				printM('Exiting.', self.sender)
 				sys.exit()
-			elif 'ALARM' in str(d):
+			elif d.kind == MsgKind.ALARM:
 				pass
 			else:
 				if not self.testing:
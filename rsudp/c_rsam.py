@@ -1,16 +1,74 @@
 import sys, os, time
+import struct
 import socket as s
-from datetime import timedelta
-import statistics
-from rsudp import printM, printW, printE
-from rsudp import helpers
+import numpy as np
+from rsudp import printM, printW, printE, helpers
 import rsudp.raspberryshake as rs
+from rsudp.dsp import DeconvStage, IntervalStats, BandAmplitudes
+from rsudp.trends import Trend, trend_path
 from rsudp import COLOR
 from rsudp.test import TEST
 
 # set the terminal text color to green
 COLOR['current'] = COLOR['green']
 
+RSAM_MAGIC = b'RSAM'
+_HEAD = struct.Struct('<4sBBBxd8s')
+
+
+def pack_rsam(stn, end, results, bands=()):
+	'''
+	.. versionadded:: 2.3.0
+
+	Packs the results of one interval for all channels into one datagram
+	(the ``'BINARY'`` forwarding format of :py:class:`RSAM`).
+	All numbers are little-endian. The datagram is :py:data:`RSAM_MAGIC`, a
+	format version byte (1), the number of channels and of bands (one
+	byte each), a pad byte, the end time of the interval (float64 seconds
+	since 1970-01-01 00:00:00Z) and the station name (8 bytes, padded with
+	zeros), followed by the low and high corner of each band (float32), and
+	for each channel its name (4 bytes, padded with zeros) and its mean,
+	median, minimum, maximum and band amplitudes (float32).
+
+	:param str stn: station name
+	:param float end: end time of the interval
+	:param list results: ``(cha, [mean, median, min, max], ssam)`` for each channel, where ``ssam`` has one amplitude per band
+	:param list bands: ``[freqmin, freqmax]`` pairs
+	:rtype: bytes
+	'''
+	out = [_HEAD.pack(RSAM_MAGIC, 1, len(results), len(bands), float(end), stn.encode('ascii'))]
+	out.append(np.asarray(bands, dtype='<f4').tobytes())
+	for cha, rsam, ssam in results:
+		out.append(struct.pack('<4s', cha.encode('ascii')))
+		out.append(np.asarray(list(rsam) + list(ssam), dtype='<f4').tobytes())
+	return b''.join(out)
+
+
+def unpack_rsam(data):
+	'''
+	.. versionadded:: 2.3.0
+
+	Reads a datagram made by :py:func:`pack_rsam`.
+
+	:param bytes data: the datagram
+	:rtype: dict
+	:return: ``station``, ``end``, ``bands`` and ``channels`` (a dict of channel name to ``rsam`` and ``ssam`` lists)
+	:raise ValueError: if the datagram is not an RSAM datagram
+	'''
+	if data[:4] != RSAM_MAGIC:
+		raise ValueError('not an RSAM datagram')
+	magic, version, nch, nbands, end, stn = _HEAD.unpack_from(data)
+	pos = _HEAD.size
+	bands = np.frombuffer(data, dtype='<f4', count=2*nbands, offset=pos).reshape(-1, 2).tolist()
+	pos += 8 * nbands
+	channels = {}
+	for i in range(nch):
+		cha = data[pos:pos+4].rstrip(b'\x00').decode('ascii')
+		vals = np.frombuffer(data, dtype='<f4', count=4+nbands, offset=pos+4).tolist()
+		channels[cha] = {'rsam': vals[:4], 'ssam': vals[4:]}
+		pos += 4 + 4 * (4 + nbands)
+	return {'station': stn.rstrip(b'\x00').decode('ascii'), 'end': end, 'bands': bands, 'channels': channels}
+
 class RSAM(rs.ConsumerThread):
 	"""
 	.. versionadded:: 1.0.1
@@ -19,21 +77,42 @@ class RSAM(rs.ConsumerThread):
 	If debugging is enabled and ``"quiet"`` is set to ``true``,
 	RSAM is printed to the console every ``"interval"`` seconds,
 	and optionally forwarded to an IP address and port specified by ``"fwaddr"`` and
-	``"fwport"`` with packets formatted as either JSON, "lite", or CSV.
+	``"fwport"`` with packets formatted as either JSON, "lite", CSV, or binary.
+
+	.. versionchanged:: 2.3.0
+
+		Each packet is added to running interval statistics
+		(see :py:class:`rsudp.dsp.IntervalStats`) and RSAM is computed
+		only when an interval is complete. Intervals are aligned to
+		multiples of ``interval`` seconds of data time (e.g. each minute
+		for a 60 second interval), and results are reported for the time
+		the interval ends.
+
+		A list of channels computes RSAM for each of them in one thread,
+		and ``bands`` adds spectral amplitudes (SSAM) in frequency bands,
+		computed for all channels with one FFT per interval
+		(see :py:class:`rsudp.dsp.BandAmplitudes`).
+
+		With ``archive``, the results are also kept on disk, rolled up
+		into coarser tiers, as one :py:class:`rsudp.trends.Trend` per channel.
 
 	:param queue.Queue q: queue of data and messages sent by :class:`rsudp.c_consumer.Consumer`.
 	:param bool quiet: ``True`` to suppress printing of RSAM analysis live to the console, ``False`` otherwise.
 	:param float interval: window of time in seconds to apply RSAM analysis.
-	:param str cha: listening channel (defaults to [S,E]HZ)
+	:param cha: listening channel (defaults to [S,E]HZ), or a list of channels (see :py:func:`rsudp.helpers.set_channels`)
+	:type cha: str or list
 	:param str deconv: ``'VEL'``, ``'ACC'``, ``'GRAV'``, ``'DISP'``, or ``'CHAN'``
 	:param str fwaddr: Specify a forwarding address to send RSAM in a UDP packet
 	:param str fwport: Specify a forwarding port to send RSAM in a UDP packet
-	:param str fwformat: Specify a format for the forwarded packet: ``'LITE'``, ``'JSON'``, or ``'CSV'``
+	:param str fwformat: Specify a format for the forwarded packet: ``'LITE'``, ``'JSON'``, ``'CSV'`` (one packet per channel), or ``'BINARY'`` (one packet per interval, see :py:func:`pack_rsam`)
+	:param list bands: ``[freqmin, freqmax]`` pairs in Hz to compute spectral amplitudes in
+	:param str archive: directory to keep the RSAM trends in (see :py:mod:`rsudp.trends`), or ``False``
+	:raise ValueError: if a trend in ``archive`` was written with another interval, other bands or other units
 	"""
 
 	def __init__(self, q=False, interval=5, cha='HZ', deconv=False,
 				 fwaddr=False, fwport=False, fwformat='LITE', quiet=False,
-				 testing=False,
+				 testing=False, bands=None, archive=False,
 				 *args, **kwargs):
 		"""
 		Initializes the RSAM analysis thread.
@@ -52,15 +131,37 @@ class RSAM(rs.ConsumerThread):
 		self.default_ch = 'HZ'
 		self.args = args
 		self.kwargs = kwargs
-		self.raw = rs.Stream()
-		self.stream = rs.Stream()
 		self.units = 'counts'
 
 		self._set_deconv(deconv)
 
-		self._set_channel(cha)
+		if isinstance(cha, str):
+			self._set_channel(cha)
+			self.chans = [self.cha]
+		else:
+			self.chans = []
+			helpers.set_channels(self, cha)
+			self.cha = self.chans[0]
+		self.channels = self.chans		# only these channels' data is delivered
+		self.kinds = ['DATA']
+		self.deconvolvers = {}
+		if self.deconv:
+			# deconvolved continuously as packets arrive
+			stage = DeconvStage(self.deconv, rs.sps, sender=self.sender)
+			self.deconvolvers = {c: stage(c) for c in self.chans}
+		self.stats = {c: IntervalStats(self.interval, rs.sps) for c in self.chans}
+		self.bands = bands or []
+		self.ssam = BandAmplitudes(rs.sps, round(self.interval * rs.sps), self.bands) if self.bands else None
+		self.pending = {}	# results of each channel for intervals not yet reported
+		self.trends = {}
+		if archive:
+			self.trends = {c: Trend(trend_path(archive, self.stn, c), self.interval, self.bands, self.units)
+						   for c in self.chans}
 
 		self.rsam = [1, 1, 1]
+		self.results = []	# (cha, rsam, ssam) for each channel in the last interval
+		self.end = None		# end time of the interval of the last result
+		self.count = 0		# results so far
 
 		if q:
 			self.queue = q
@@ -132,54 +233,76 @@ class RSAM(rs.ConsumerThread):
 
 	def _getq(self):
 		"""
-		Reads data from the queue and updates the stream.
+		Reads data from the queue and adds it to the interval statistics.
 
 		:rtype: bool
-		:return: Returns ``True`` if stream is updated, otherwise ``False``.
+		:return: Returns ``True`` if the packet was from an RSAM channel, otherwise ``False``.
 		"""
 		d = self.queue.get(True, timeout=None)
 		self.queue.task_done()
-		if self.cha in str(d):
-			self.raw = rs.update_stream(stream=self.raw, d=d, fill_value='latest')
-			return True
-		elif 'TERM' in str(d):
+		if isinstance(d, rs.Packet):
+			if d.cha in self.stats:
+				self._update(d)
+				return True
+			return False
+		elif d.kind == rs.MsgKind.TERM:
 			self.alive = False
+			for trend in self.trends.values():
+				trend.close()
 			printM('Exiting.', self.sender)
 			sys.exit()
 		else:
 			return False
 
 
-	def _deconvolve(self):
+	def _update(self, d):
 		"""
-		Deconvolves the stream associated with this class.
-		"""
-		if self.deconv:
-			helpers.deconvolve(self)
+		Adds a data packet (deconvolved, if set) to its channel's interval
+		statistics, and reports each interval once every channel has
+		completed it.
 
-
-	def _subloop(self):
+		:param rsudp.raspberryshake.Packet d: data packet of an RSAM channel
 		"""
-		Gets the queue and figures out whether or not the specified channel is in the packet.
+		t, data = d.time, d.data
+		if d.cha in self.deconvolvers:
+			data = self.deconvolvers[d.cha](data)
+			t -= self.deconvolvers[d.cha].delay / rs.sps
+		latest = None
+		for end, rsam, samples in self.stats[d.cha](t, data):
+			if not self.deconv:
+				# counts are whole numbers
+				rsam[2], rsam[3] = int(rsam[2]), int(rsam[3])
+			self.pending.setdefault(end, {})[d.cha] = (rsam, samples)
+			latest = end
+		if latest is not None:
+			for end in sorted(self.pending):
+				# an interval is reported when all channels have completed it,
+				# or without the missing ones once a later interval is complete
+				if (len(self.pending[end]) == len(self.chans)) or (end < latest):
+					self._report(end, self.pending.pop(end))
+
+
+	def _report(self, end, got):
 		"""
-		while True:
-			if self.queue.qsize() > 0:
-				self._getq()			# get recent packets
-			else:
-				if self._getq():		# is this the specified channel? if so break
-					break
-
+		Computes the band amplitudes of an interval for all its channels at once,
+		then forwards and prints the results.
 
-	def _rsam(self):
+		:param float end: end time of the interval
+		:param dict got: ``(rsam, samples)`` of each channel that completed the interval
 		"""
-		Run the RSAM analysis
-		"""
-		arr = [abs(el) for el in self.stream[0].data]
-		meanv = statistics.mean(arr)
-		medianv = statistics.median(arr)
-		minv = min(arr)
-		maxv = max(arr)
-		self.rsam = [meanv, medianv, minv, maxv]
+		chans = [c for c in self.chans if c in got]
+		ssam = self.ssam([got[c][1] for c in chans]).tolist() if self.ssam else [[]] * len(chans)
+		self.results = [(c, got[c][0], a) for c, a in zip(chans, ssam)]
+		self.rsam = self.results[0][1]
+		self.end = end
+		self._forward_rsam()
+		self._archive_rsam()
+		self._print_rsam()
+		if self.count == 0:
+			printM('RSAM analysis up and running normally.', self.sender)
+			if self.testing:
+				TEST['c_rsam'][1] = True
+		self.count += 1
 
 
 	def _print_rsam(self):
@@ -187,35 +310,62 @@ class RSAM(rs.ConsumerThread):
 		Print the current RSAM analysis
 		"""
 		if not self.quiet:
-			msg = '%s Current RSAM: mean %s median %s min %s max %s' % (
-				(self.stream[0].stats.starttime + timedelta(seconds=
-															len(self.stream[0].data) * self.stream[0].stats.delta)).strftime('%Y-%m-%d %H:%M:%S'),
-				self.rsam[0],
-				self.rsam[1],
-				self.rsam[2],
-				self.rsam[3]
-			)
-			printM(msg, self.sender)
+			for cha, rsam, ssam in self.results:
+				msg = '%s Current RSAM: mean %s median %s min %s max %s' % (
+					time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.end)),
+					rsam[0],
+					rsam[1],
+					rsam[2],
+					rsam[3]
+				)
+				if len(self.chans) > 1:
+					msg += ' on %s' % cha
+				if ssam:
+					msg += ' SSAM %s' % ' '.join('%s-%s Hz: %.6g' % (b[0], b[1], a) for b, a in zip(self.bands, ssam))
+				printM(msg, self.sender)
+
+	def _archive_rsam(self):
+		"""
+		Adds the results to the channels' trends, if there is an archive.
+		If the archive can not be written to, it is given up on.
+		"""
+		try:
+			for cha, rsam, ssam in self.results:
+				if cha in self.trends:
+					self.trends[cha].append(self.end, rsam, ssam)
+		except OSError as e:
+			printE('Could not write to the RSAM archive, no longer archiving: %s' % (e), self.sender)
+			self.trends = {}
 
 	def _forward_rsam(self):
 		"""
 		Send the RSAM analysis via UDP to another destination in a lightweight format
+		(one datagram per channel), or in the binary format (one datagram for all channels).
+		Band amplitudes are added to the end of the lightweight formats.
 		"""
 		if self.sock:
-			msg = 'stn:%s|ch:%s|mean:%s|med:%s|min:%s|max:%s' % (self.stn, self.cha, self.rsam[0], self.rsam[1], self.rsam[2], self.rsam[3])
-			if self.fwformat is 'JSON':
-				msg = '{"station":"%s","channel":"%s","mean":%s,"median":%s,"min":%s,"max":%s}' \
-					  % (self.stn, self.cha, self.rsam[0], self.rsam[1], self.rsam[2], self.rsam[3])
-			elif self.fwformat is 'CSV':
-				msg = '%s,%s,%s,%s,%s,%s' \
-					  % (self.stn, self.cha, self.rsam[0], self.rsam[1], self.rsam[2], self.rsam[3])
-			packet = bytes(msg, 'utf-8')
-			self.sock.sendto(packet, (self.fwaddr, self.fwport))
+			if self.fwformat == 'BINARY':
+				self.sock.sendto(pack_rsam(self.stn, self.end, self.results, self.bands), (self.fwaddr, self.fwport))
+				return
+			for cha, rsam, ssam in self.results:
+				msg = 'stn:%s|ch:%s|mean:%s|med:%s|min:%s|max:%s' % (self.stn, cha, rsam[0], rsam[1], rsam[2], rsam[3])
+				if ssam:
+					msg += '|ssam:%s' % ','.join('%s' % a for a in ssam)
+				if self.fwformat == 'JSON':
+					msg = '{"station":"%s","channel":"%s","mean":%s,"median":%s,"min":%s,"max":%s%s}' \
+						  % (self.stn, cha, rsam[0], rsam[1], rsam[2], rsam[3],
+							 (',"ssam":[%s]' % ','.join('%s' % a for a in ssam)) if ssam else '')
+				elif self.fwformat == 'CSV':
+					msg = '%s,%s,%s,%s,%s,%s' \
+						  % (self.stn, cha, rsam[0], rsam[1], rsam[2], rsam[3])
+					msg += ''.join(',%s' % a for a in ssam)
+				packet = bytes(msg, 'utf-8')
+				self.sock.sendto(packet, (self.fwaddr, self.fwport))
 
 
 	def run(self):
 		"""
-		Reads data from the queue and executes self.codefile if it sees an ``ALARM`` message.
+		Reads data from the queue and reports RSAM at the end of each interval.
 		Quits if it sees a ``TERM`` message.
 		"""
 		if self.fwaddr and self.fwport:
@@ -223,47 +373,13 @@ class RSAM(rs.ConsumerThread):
 			socket_type = s.SOCK_DGRAM if os.name in 'nt' else s.SOCK_DGRAM | s.SO_REUSEADDR
 			self.sock = s.socket(s.AF_INET, socket_type)
 
-		n = 0
-		next_int = time.time() + self.interval
-
-		wait_pkts = self.interval / (rs.tf / 1000)
-
-		while n > 3:
-			self.getq()
-			n += 1
-
-		n = 0
+		printM('Starting RSAM analysis with interval=%s on station=%s channel=%s forward=%s' %
+			   (self.interval, self.stn, ','.join(self.chans), self.fwaddr),
+			   self.sender)
+		if self.bands:
+			printM('Computing spectral amplitudes in bands %s' % (self.bands), self.sender)
+		if self.trends:
+			printM('Archiving RSAM trends in %s' % (os.path.dirname(self.trends[self.cha].path)), self.sender)
 		while True:
-			self._subloop()
-
-			self.raw = rs.copy(self.raw)	# necessary to avoid memory leak
-			self.stream = self.raw.copy()
-			self._deconvolve()
-
-			if n > wait_pkts:
-				# if the trigger is activated
-				obstart = self.stream[0].stats.endtime - timedelta(seconds=self.interval)	# obspy time
-				self.raw = self.raw.slice(starttime=obstart)		# slice the stream to the specified length (seconds variable)
-				self.stream = self.stream.slice(starttime=obstart)	# slice the stream to the specified length (seconds variable)
-
-				# run rsam analysis
-				if time.time() > next_int:
-					self._rsam()
-					self.stream = rs.copy(self.stream)  # prevent mem leak
-					self._forward_rsam()
-					self._print_rsam()
-					next_int = time.time() + self.interval
-
-			elif n == 0:
-				printM('Starting RSAM analysis with interval=%s on station=%s channel=%s forward=%s' %
-					   (self.interval, self.stn, self.cha, self.fwaddr),
-					   self.sender)
-			elif n == wait_pkts:
-				printM('RSAM analysis up and running normally.', self.sender)
-				if self.testing:
-					TEST['c_rsam'][1] = True
-			else:
-				pass
-
-			n += 1
+			self._getq()
 			sys.stdout.flush()
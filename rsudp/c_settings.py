@@ -82,6 +82,13 @@ class Settings(dict):
         settings["settings"]["station"] = "Z0000"
         settings["settings"]["output_dir"] = "output_dir"
         settings["settings"]["debug"] = True
+        settings["settings"]["rcvbuf"] = 1048576
+        settings["settings"]["inventory_ttl"] = 86400
+        settings["settings"]["overflow"] = {}
+        settings["settings"]["processes"] = []
+        settings["settings"]["engine"] = "threads"
+        settings["settings"]["multicast_group"] = ""
+        settings["settings"]["multicast_interface"] = ""
 
         # printdata section
         settings["printdata"] = {}
@@ -91,6 +98,7 @@ class Settings(dict):
         settings["write"] = {}
         settings["write"]["enabled"] = False
         settings["write"]["channels"] = ["all"]
+        settings["write"]["record_length"] = 512
 
         # plot section
         settings["plot"] = {}
@@ -122,6 +130,11 @@ class Settings(dict):
         settings["forward"]["channels"] = ["all"]
         settings["forward"]["fwd_data"] = True
         settings["forward"]["fwd_alarms"] = False
+        settings["forward"]["format"] = "text"
+        settings["forward"]["latency"] = 1.0
+        settings["forward"]["derive"] = None
+        settings["forward"]["multicast_ttl"] = 1
+        settings["forward"]["multicast_interface"] = ""
 
         # alert section
         settings["alert"] = {}
@@ -181,6 +194,8 @@ class Settings(dict):
         settings["rsam"]["interval"] = 10
         settings["rsam"]["deconvolve"] = False
         settings["rsam"]["units"] = "VEL"
+        settings["rsam"]["bands"] = []
+        settings["rsam"]["archive"] = False
 
         if verbose:
             print('By default output_dir is set to %s' % output_dir)
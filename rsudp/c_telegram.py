@@ -1,4 +1,4 @@
-import os, sys, time, asyncio
+import os, sys, asyncio
 from telegram import Bot
 from rsudp import printM, printW, printE, helpers
 import rsudp.raspberryshake as rs
@@ -12,6 +12,9 @@ class Telegrammer(rs.ConsumerThread):
         self.queue = q
         self.sender = sender
         self.alive = True
+        self.channels = []
+        self.kinds = ['ALARM', 'IMGPATH']
+        self.overflow = 'coalesce'
         self.send_images = send_images
         self.token = token
         self.chat_id = chat_id
@@ -36,7 +39,9 @@ class Telegrammer(rs.ConsumerThread):
     def getq(self):
         d = self.queue.get()
         self.queue.task_done()
-        if 'TERM' in str(d):
+        if isinstance(d, rs.Packet):
+            return False
+        elif d.kind == rs.MsgKind.TERM:
             self.alive = False
             printM('Exiting.', self.sender)
             self.loop.stop()
@@ -61,7 +66,7 @@ class Telegrammer(rs.ConsumerThread):
             printE(f'Could not send alert - {e}', sender=self.sender)
             try:
                 printE('Waiting 5 seconds and trying to send again...', sender=self.sender, spaces=True)
-                time.sleep(5)
+                await asyncio.sleep(5)
                 if not self.testing:
                     await self.telegram.send_message(chat_id=self.chat_id, text=message)
                 else:
@@ -92,7 +97,7 @@ class Telegrammer(rs.ConsumerThread):
         except Exception as e:
             printE(f'Could not send image - {e}', sender=self.sender)
             try:
-                time.sleep(5)
+                await asyncio.sleep(5)
                 with open(imgpath, 'rb') as image:
                     printM(f'Retrying upload of image: {imgpath}', sender=self.sender)
                     await self.telegram.send_photo(chat_id=self.chat_id, photo=image)
@@ -100,15 +105,40 @@ class Telegrammer(rs.ConsumerThread):
             except Exception as e2:
                 printE(f'Final failure to send image - {e2}', sender=self.sender)
 
+    async def handle(self, d):
+        '''
+        .. versionadded:: 2.3.0
+
+        Sends a message for an ``ALARM`` message or an image for an ``IMGPATH``
+        message. :py:meth:`run` calls this on the module's own event loop;
+        with the asyncio engine (:py:class:`rsudp.aio.Engine`) it is awaited
+        on the engine's loop instead of running in a thread.
+
+        :param d: queue item
+        :type d: rsudp.raspberryshake.Packet or rsudp.raspberryshake.Message
+        '''
+        if isinstance(d, rs.Packet):
+            return
+
+        elif d.kind == rs.MsgKind.TERM:
+            self.alive = False
+            printM('Exiting.', self.sender)
+            self.loop.close()
+
+        elif d.kind == rs.MsgKind.ALARM:
+            await self._when_alarm(d)
+
+        elif d.kind == rs.MsgKind.IMGPATH:
+            try:
+                await asyncio.wait_for(self._when_img(d), timeout=5)
+            except asyncio.TimeoutError:
+                printE('Image send timed out.', sender=self.sender)
+
     def run(self):
         while True:
             d = self.getq()
 
-            if 'ALARM' in str(d):
-                self.loop.run_until_complete(self._when_alarm(d))
+            if not d:
+                continue
 
-            elif 'IMGPATH' in str(d):
-                try:
-                    self.loop.run_until_complete(asyncio.wait_for(self._when_img(d), timeout=5))
-                except asyncio.TimeoutError:
-                    printE('Image send timed out.', sender=self.sender)
+            self.loop.run_until_complete(self.handle(d))
@@ -1,5 +1,6 @@
 import sys, os
 import rsudp.raspberryshake as rs
+from rsudp.ringbuffer import StreamBuffer
 from rsudp import printM, printW, helpers
 from rsudp import ms_path
 import rsudp.test as t
@@ -48,6 +49,7 @@ class Testing(rs.ConsumerThread):
 
 		self.stream = rs.Stream()
 		self.cha = rs.chns
+		self.buffer = StreamBuffer(seconds=30, chans=self.cha, fill_value='latest')
 
 		printW('Starting test consumer.', sender=self.sender, announce=False)
 
@@ -64,12 +66,12 @@ class Testing(rs.ConsumerThread):
 
 	def _getd(self):
 		'''
-		Reads data from the queue and updates the stream.
+		Reads data from the queue and writes it to the channel buffers.
 		'''
 		d = self._getq()
 
-		if rs.getCHN(d) in self.cha:
-			self.stream = rs.update_stream(stream=self.stream, d=d, fill_value='latest')
+		if isinstance(d, rs.Packet):
+			self.buffer.update(d)
 		else:
 			self._messagetests(d)
 
@@ -82,9 +84,11 @@ class Testing(rs.ConsumerThread):
 
 		'''
 
-		if rs.getCHN(d) in self.cha:
-			self.stream = rs.update_stream(stream=self.stream, d=d, fill_value='latest')
-			t.TEST['x_processing'][1] = True
+		if isinstance(d, rs.Packet) and (d.cha in self.cha):
+			self.buffer.update(d)
+			self.stream = self.buffer.stream()
+			if len(self.stream) > 0:
+				t.TEST['x_processing'][1] = True
 
 	def _messagetests(self, d):
 		'''
@@ -95,24 +99,24 @@ class Testing(rs.ConsumerThread):
 
 		'''
 		global IMGPATH
-		if 'TERM' in str(d):
+		if d.kind == rs.MsgKind.TERM:
 			printM('Got TERM message...', sender=self.sender)
 			t.TEST['x_TERM'][1] = True
 			self.alive = False
 	
-		elif 'ALARM' in str(d):
+		elif d.kind == rs.MsgKind.ALARM:
 			printM('Got ALARM message with time %s' % (
 				   helpers.fsec(helpers.get_msg_time(d))
 				   ), sender=self.sender)
 			t.TEST['x_ALARM'][1] = True
 
-		elif 'RESET' in str(d):
+		elif d.kind == rs.MsgKind.RESET:
 			printM('Got RESET message with time %s' % (
 				   helpers.fsec(helpers.get_msg_time(d))
 				   ), sender=self.sender)
 			t.TEST['x_RESET'][1] = True
 
-		elif 'IMGPATH' in str(d):
+		elif d.kind == rs.MsgKind.IMGPATH:
 			printM('Got IMGPATH message with time %s' % (
 				   helpers.fsec(helpers.get_msg_time(d))
 				   ), sender=self.sender)
@@ -134,7 +138,12 @@ class Testing(rs.ConsumerThread):
 		'''
 		if rs.inv:
 			t.TEST['n_inventory'][1] = True
-		self._datatests(self._getq())
+		d = self._getq()
+		if isinstance(d, rs.Packet):
+			self._datatests(d)
+		else:
+			# e.g. TERM before any data, when the station profile did not match
+			self._messagetests(d)
 
 
 		while self.alive:
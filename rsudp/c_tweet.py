@@ -1,5 +1,6 @@
 import os, sys
 import time
+import asyncio
 import rsudp.raspberryshake as rs
 from rsudp import printM, printW, printE, helpers
 from rsudp.test import TEST
@@ -72,6 +73,9 @@ class Tweeter(rs.ConsumerThread):
 		self.queue = q
 		self.sender = 'Tweeter'
 		self.alive = True
+		self.channels = []
+		self.kinds = ['ALARM', 'IMGPATH']
+		self.overflow = 'coalesce'
 		self.tweet_images = tweet_images
 		self.testing = testing
 		self.fmt = '%Y-%m-%d %H:%M:%S.%f'
@@ -110,7 +114,9 @@ class Tweeter(rs.ConsumerThread):
 		d = self.queue.get()
 		self.queue.task_done()
 
-		if 'TERM' in str(d):
+		if isinstance(d, rs.Packet):
+			return False
+		elif d.kind == rs.MsgKind.TERM:
 			self.alive = False
 			printM('Exiting.', self.sender)
 			sys.exit()
@@ -216,6 +222,32 @@ class Tweeter(rs.ConsumerThread):
 		
 		self.last_message = message
 
+	async def handle(self, d):
+		'''
+		.. versionadded:: 2.3.0
+
+		Tweets a message for an ``ALARM`` or ``IMGPATH`` message when the
+		module runs on the event loop of the :py:class:`rsudp.aio.Engine`
+		instead of in a thread. Twython waits for the network, so the
+		tweet is sent from a worker thread (:py:func:`asyncio.to_thread`)
+		while the loop carries on.
+
+		:param d: queue item
+		:type d: rsudp.raspberryshake.Packet or rsudp.raspberryshake.Message
+		'''
+		if isinstance(d, rs.Packet):
+			return
+
+		elif d.kind == rs.MsgKind.TERM:
+			self.alive = False
+			printM('Exiting.', self.sender)
+
+		elif d.kind == rs.MsgKind.ALARM:
+			await asyncio.to_thread(self._when_alarm, d)
+
+		elif d.kind == rs.MsgKind.IMGPATH:
+			await asyncio.to_thread(self._when_img, d)
+
 	def run(self):
 		"""
 		Reads data from the queue and tweets a message if it sees an ALARM or IMGPATH message
@@ -223,8 +255,11 @@ class Tweeter(rs.ConsumerThread):
 		while True:
 			d = self.getq()
 
-			if 'ALARM' in str(d):
+			if not d:
+				continue
+
+			elif d.kind == rs.MsgKind.ALARM:
 				self._when_alarm(d)
 
-			elif 'IMGPATH' in str(d):
+			elif d.kind == rs.MsgKind.IMGPATH:
 				self._when_img(d)
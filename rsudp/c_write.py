@@ -1,14 +1,44 @@
 import sys, os
 import time
+import math
 import threading
-from datetime import timedelta
-from obspy import UTCDateTime
+from queue import Empty
 import rsudp.raspberryshake as rs
+from rsudp.ringbuffer import StreamBuffer
+from rsudp.mseed import RecordWriter, RECLEN
 from rsudp import printM, printW, printE, helpers
 from rsudp.test import TEST
 
 class Write(rs.ConsumerThread):
-	def __init__(self, q, data_dir, testing=False, debug=False, cha='all'):
+	'''
+	A consumer that writes the data of some or all channels to day files
+	of STEIM2 miniSEED in ``data_dir/data``.
+
+	.. versionchanged:: 2.3.0
+
+		Each channel has a streaming encoder (see
+		:py:class:`rsudp.mseed.RecordWriter`) and a day file that stays
+		open. Data is passed to the encoders a few seconds behind the
+		newest packet, so that late packets are still put in their
+		place, and full records are appended as soon as they fill.
+		Partly filled records are only written at a gap, at the end of a
+		day (in data time), and at shutdown.
+
+		Items are taken off the queue in batches (see :py:meth:`getq`)
+		without pausing, and data is written each time the newest data
+		is :py:data:`interval` seconds (of data time) past what has been
+		written plus the lag, so a backlog is written as fast as it is read.
+
+	:param queue.Queue q: queue of data and messages sent by :class:`rsudp.c_consumer.Consumer`
+	:param str data_dir: output directory
+	:param bool testing: whether or not testing is active
+	:param bool debug: whether to print each write
+	:param cha: channels to write, or ``'all'``
+	:type cha: str or list
+	:param int reclen: length of the miniSEED records in bytes
+	:raise ValueError: if ``reclen`` is not a power of two from 128 to 65536
+	'''
+	def __init__(self, q, data_dir, testing=False, debug=False, cha='all', reclen=RECLEN):
 		super().__init__()
 		self.sender = 'Write'
 		self.alive = True
@@ -36,9 +66,24 @@ class Write(rs.ConsumerThread):
 		helpers.set_channels(self, cha)
 
 		printM('Writing channels: %s' % self.chans, self.sender)
+		# holds data until it is written; must be longer than the write interval plus the 5 s lag
+		self.buffer = StreamBuffer(seconds=60, chans=self.chans, fill_value=None)
+		self.channels = self.chans		# only these channels' data is delivered
+		self.kinds = ['DATA']
+		self.written = None		# time up to which (exclusive) data has been written
+		self.since = None		# time of the first packet
+		self.newest = None		# time just after the newest sample
+		self.interval = 10		# seconds of data between writes
+		self.lag = 5			# seconds behind the newest sample to write up to
+		self.max_batch = 256	# most items to take off the queue at once
+		self.writing = False	# whether run() has started writing
 		self.numchns = rs.numchns
 		self.stime = 1 / rs.sps
 		self.inv = rs.inv
+		self.writers = {c: RecordWriter(rs.net, rs.stn, '00', c, rs.sps, reclen) for c in self.chans}
+		self.files = {}			# open day file of each channel
+		self.days = {}			# day (in days since 1970) of each channel's open file
+		self.records = 0		# records written
 
 		self.seen_channels = {}
 		self.expected_channels = set(self.chans)
@@ -47,25 +92,51 @@ class Write(rs.ConsumerThread):
 		printM('Starting.', self.sender)
 
 	def getq(self):
-		d = self.queue.get(True, timeout=None)
-		self.queue.task_done()
-
-		if 'TERM' in str(d):
-			self.alive = False
-			printM('Exiting.', self.sender)
-			sys.exit()
-		elif str(d.decode('UTF-8')).split(' ')[0] in ['ALARM', 'RESET', 'IMGPATH']:
-			return False
-		else:
-			channel = rs.getCHN(d)		
-			if channel in self.chans:
-				self.seen_channels[channel] = time.time()
-				self.stream = rs.update_stream(self.stream, d, fill_value=None)
-			if self.expected_channels.issubset(self.seen_channels):
-				self.channel_event.set()
-				return True
-			else:
-				return False
+		'''
+		Waits for an item on the queue, then takes every other item already
+		waiting (up to :py:data:`max_batch`) and handles them in order
+		(see :py:meth:`_take`).
+
+		:rtype: bool
+		:return: whether all the channels to write have been seen
+		'''
+		batch = [self.queue.get(True, timeout=None)]
+		try:
+			while len(batch) < self.max_batch:
+				batch.append(self.queue.get_nowait())
+		except Empty:
+			pass
+		for d in batch:
+			self.queue.task_done()
+			self._take(d)
+		return self.expected_channels.issubset(self.seen_channels)
+
+	def _take(self, d):
+		'''
+		Adds a data packet to the buffer, and writes once the newest data is
+		:py:data:`interval` seconds past what has been written plus the lag.
+		Writes the rest and quits if the item is a ``TERM`` message.
+
+		:param d: data packet or message
+		'''
+		if not isinstance(d, rs.Packet):
+			if d.kind == rs.MsgKind.TERM:
+				self.alive = False
+				self.close()
+				printM('Exiting.', self.sender)
+				sys.exit()
+			return
+		if d.cha in self.chans:
+			self.seen_channels[d.cha] = time.time()
+			self.buffer.update(d)
+			end = d.time + len(d.data) * self.stime
+			self.newest = end if self.newest is None else max(self.newest, end)
+			self.since = d.time if self.since is None else self.since
+			since = self.since if self.written is None else self.written
+			if self.writing and (self.newest - since >= self.interval + self.lag):
+				self.write()
+		if self.expected_channels.issubset(self.seen_channels):
+			self.channel_event.set()
 
 	def wait_for_all_channels(self, timeout=10.0):
 		"""
@@ -95,54 +166,94 @@ class Write(rs.ConsumerThread):
 		return True
 
 	def set_sps(self):
-		if len(self.stream) > 0:
-			self.sps = self.stream[0].stats.sampling_rate
-
-	def elapse(self, new=False):
-		self.st = UTCDateTime.now()
-		self.y, self.m, self.d = self.st.year, self.st.month, self.st.day
-		self.j = self.st.strftime('%j')
-		self.newday = UTCDateTime(self.y, self.m, self.d, 0, 0) + timedelta(days=1.1)
-		self.newday = UTCDateTime(self.newday.year, self.newday.month, self.newday.day, 0, 0)
-		self.last = self.newday if new else self.st
-
-	def slicestream(self):
-		self.stream.slice(starttime=self.last)
-
-	def _tracewrite(self, t):
-		enc = 'STEIM2'
-		if isinstance(t.data, rs.np.ma.masked_array):
-			t.data = t.data.filled(fill_value=0)
-		outfile = f'{self.outdir}/{t.stats.network}.{t.stats.station}.00.{t.stats.channel}.D.{self.y}.{self.j}'
+		if len(self.buffer) > 0:
+			self.sps = self.buffer.sps
+
+	def _open(self, cha, day):
+		'''
+		Flushes the channel's encoder to its open day file, and opens
+		(or goes on appending to) the file of another day.
+
+		:param str cha: channel
+		:param int day: days since 1970-01-01
+		'''
+		if cha in self.files:
+			self._emit(cha, self.writers[cha].flush())
+			self.files[cha].close()
+		outfile = f'{self.outdir}/{rs.net}.{rs.stn}.00.{cha}.D.{time.strftime("%Y.%j", time.gmtime(day * 86400))}'
 		if outfile not in self.outfiles:
 			self.outfiles.append(outfile)
-		if os.path.exists(outfile):
-			with open(outfile, 'ab') as fh:
-				t.write(fh, format='MSEED', encoding=enc)
-				if self.debug:
-					printM(f'{len(t.data)} records to {outfile}', self.sender)
-		else:
-			t.write(outfile, format='MSEED', encoding=enc)
-			if self.debug:
-				printM(f'{len(t.data)} records to new file {outfile}', self.sender)
-
-	def write(self, stream=False):
-		if not stream:
-			self.last = self.stream[0].stats.endtime - timedelta(seconds=5)
-			stream = self.stream.copy().slice(endtime=self.last, nearest_sample=False)
-		for t in stream:
-			self._tracewrite(t)
+		if self.debug:
+			printM(f'{"Appending to" if os.path.exists(outfile) else "New file"} {outfile}', self.sender)
+		self.files[cha] = open(outfile, 'ab')
+		self.days[cha] = day
+
+	def _emit(self, cha, records):
+		'''
+		Appends records to the channel's day file.
+		'''
+		if records:
+			self.files[cha].write(b''.join(records))
+			self.files[cha].flush()
+			self.records += len(records)
+
+	def _add(self, cha, t, data):
+		'''
+		Passes continuous samples of a channel to its encoder, splitting them at midnight.
+		'''
+		while len(data):
+			day = math.floor(t / 86400 + 1e-9)
+			if self.days.get(cha) != day:
+				self._open(cha, day)
+			# samples before the next midnight
+			k = math.ceil(((day + 1) * 86400 - t) * self.buffer[cha].sps - 1e-3)
+			self._emit(cha, self.writers[cha].add(t, data[:k]))
+			data = data[k:]
+			t += k / self.buffer[cha].sps
+
+	def write(self, end=None):
+		'''
+		Passes the data of each channel from where the last write ended up
+		to ``end`` to the encoders, leaving out gaps.
+
+		:param float end: data time to write up to (default: :py:data:`lag` seconds before the newest sample)
+		'''
+		if end is None:
+			end = max(self.buffer[c].endtime() for c in self.buffer.channels()) - self.lag
+		for cha in self.buffer.channels():
+			data, gaps, t = self.buffer[cha].slice(self.written, end)
+			if not len(data):
+				continue
+			# runs of samples between gaps
+			edges = [0] + (rs.np.flatnonzero(rs.np.diff(gaps)) + 1).tolist() + [len(data)]
+			for a, b in zip(edges[:-1], edges[1:]):
+				if not gaps[a]:
+					self._add(cha, t + a / self.buffer[cha].sps, data[a:b])
+		self.written = end
 		if self.testing:
 			TEST['c_write'][1] = True
 
+	def close(self):
+		'''
+		Writes the rest of the data, flushes the encoders and closes the day files.
+		'''
+		if len(self.buffer):
+			self.write(end=max(self.buffer[c].endtime() for c in self.buffer.channels()) + 1)
+		for cha in list(self.files):
+			self._emit(cha, self.writers[cha].flush())
+			self.files[cha].close()
+		self.files = {}
+		printM(f'Wrote {self.records} miniSEED records.', self.sender)
+
 	def run(self):
-		self.elapse()
 		self.wait_for_all_channels(timeout=10)
 
-		if len(self.stream) == 0:
+		if len(self.buffer) == 0:
 			printE("Stream is still empty after waiting for all channels!", self.sender)
 			return
 
+		self.stream = self.buffer.stream()
+
 		self.set_sps()
 		printM(f'miniSEED output directory: {self.outdir}', self.sender)
 
@@ -153,34 +264,8 @@ class Write(rs.ConsumerThread):
 
 		printM(f'Beginning miniSEED output.\nConfigured: {self.chans} - Now writing: {sorted(self.seen_channels.keys())}', self.sender)
 
-		wait_pkts = (self.numchns * 10) / (rs.tf / 1000)
-		n = 0
-
+		self.writing = True
 		while True:
-			while True:
-				if self.queue.qsize() > 0:
-					self.getq()
-					time.sleep(0.01)
-					n += 1
-				else:
-					self.getq()
-					n += 1
-					break
-
-			if n >= wait_pkts:
-				now = UTCDateTime.now()
-				if self.newday < now:
-					self.write(self.stream.slice(endtime=self.newday, nearest_sample=False))
-					self.stream = self.stream.slice(starttime=self.newday, nearest_sample=False)
-					self.elapse(new=True)
-				else:
-					self.write()
-					self.stream = self.stream.slice(starttime=self.last, nearest_sample=False)
-
-				self.stream = rs.copy(self.stream)
-				n = 0
-
-				self.getq()
-				time.sleep(0.01)
+			self.getq()
 			sys.stdout.flush()
 			sys.stderr.flush()
\ No newline at end of file
@@ -4,33 +4,38 @@ import getopt
 import time
 import json
 import traceback
+import importlib
 from queue import Queue
 from rsudp import printM, printW, printE, default_loc, init_dirs, settings_loc, add_debug_handler, start_logging
-from rsudp import COLOR
+from rsudp import COLOR, resource_path
 import rsudp.helpers as H
 import rsudp.test as T
 import rsudp.raspberryshake as rs
-from rsudp.packetize import packetize
+from rsudp.bus import Bus, POLICIES
 from rsudp.c_consumer import Consumer
 from rsudp.p_producer import Producer
-from rsudp.c_printraw import PrintRaw
-from rsudp.c_write import Write
-from rsudp.c_plots import Plot, PlotAlert, MPL
-from rsudp.c_plot_controller import PlotsController
-from rsudp.c_forward import Forward
-from rsudp.c_alert import Alert
-from rsudp.c_alertsound import AlertSound
-from rsudp.c_custom import Custom
-from rsudp.c_tweet import Tweeter
-from rsudp.c_telegram import Telegrammer
-from rsudp.c_rsam import RSAM
-from rsudp.c_testing import Testing
-from rsudp.t_testdata import TestData
 from rsudp.c_settings import Settings
-import pkg_resources as pr
 
-
-DESTINATIONS, THREADS = [], []
+# the module each settings section runs in, imported only if the section is enabled
+MODULES = {
+	'printdata': 'rsudp.c_printraw',
+	'write': 'rsudp.c_write',
+	'plot': 'rsudp.c_plots',
+	'forward': 'rsudp.c_forward',
+	'alert': 'rsudp.c_alert',
+	'alertsound': 'rsudp.c_alertsound',
+	'custom': 'rsudp.c_custom',
+	'tweets': 'rsudp.c_tweet',
+	'telegram': 'rsudp.c_telegram',
+	'rsam': 'rsudp.c_rsam',
+}
+
+
+BUS, THREADS = Bus(), []
+OVERFLOW = {}		# overflow policies from the settings, by settings section
+PROCESSES = []		# settings sections whose consumers run in separate processes
+RING = None			# shared memory ring for those consumers (see rsudp.shm)
+ENGINE = 'threads'	# 'threads' (Producer and Consumer threads) or 'asyncio' (see rsudp.aio)
 PROD = False
 CONTROLLER = False
 TELEGRAM = False
@@ -39,7 +44,7 @@ WRITER = False
 SOUND = False
 TESTING = False
 TESTQUEUE = False
-TESTFILE = pr.resource_filename('rsudp', os.path.join('test', 'testdata'))
+TESTFILE = resource_path('test', 'testdata')
 SENDER = 'Main'
 
 def handler(sig, frame):
@@ -58,6 +63,13 @@ def _xit(code=0):
 		TESTQUEUE.put(b'ENDTEST')
 	for thread in THREADS:
 		del thread
+	if rs.inv:
+		printM('Instrument response cache: %s' % (rs.responses), sender=SENDER)
+	for sub in BUS.subscriptions:
+		printM('%s queue: %s' % (sub.name, sub), sender=SENDER)
+	if RING:
+		printM('Shared memory ring: %s' % (RING), sender=SENDER)
+		RING.close()
 	
 	printM('Shutdown successful.', sender=SENDER)
 	print()
@@ -78,25 +90,89 @@ def test_mode(mode=None):
 	return TESTING
 
 
+def load(section):
+	'''
+	.. versionadded:: 2.3.0
+
+	Imports the consumer module of a settings section
+	(see :py:data:`MODULES`). Modules are imported the first time their
+	section is enabled rather than when the client starts, so that the
+	time and memory taken by modules that are not used (and by their
+	dependencies, such as matplotlib for the plot) are not spent.
+
+	.. code-block:: python
+
+		>>> load('alert').Alert
+		<class 'rsudp.c_alert.Alert'>
+
+	:param str section: the name of the settings section, e.g. ``'alert'``
+	:return: the module
+	'''
+	return importlib.import_module(MODULES[section])
+
+
+def mk_c(section, name, **kwargs):
+	'''
+	.. versionadded:: 2.3.0
+
+	Makes the consumer of a settings section. If the section is listed in
+	the ``"processes"`` setting, the consumer runs in a separate process
+	behind a :py:class:`rsudp.shm.ProcessConsumer` thread, and gets its
+	data from the shared memory ring (:py:data:`RING`) that the Producer
+	writes to. Otherwise it is an ordinary consumer thread.
+
+	.. code-block:: python
+
+		>>> mk_c('write', 'Write', q=mk_q(), data_dir=output_dir, cha='all')
+		<Write(Thread-1, initial)>
+
+	:param str section: the name of the settings section, e.g. ``'alert'``
+	:param str name: the name of the consumer class in the section's module (see :py:data:`MODULES`)
+	:param kwargs: the arguments of the consumer class
+	:rtype: rsudp.raspberryshake.ConsumerThread
+	'''
+	if section in PROCESSES:
+		global RING
+		from rsudp.shm import PacketRing, ProcessConsumer
+		if not RING:
+			RING = PacketRing()
+		q = kwargs.pop('q')
+		return ProcessConsumer(MODULES[section], name, q, kwargs, ring=RING, testing=TESTING)
+	return getattr(load(section), name)(**kwargs)
+
+
 def mk_q():
 	'''
-	Makes a queue and appends it to the :py:data:`destinations`
-	variable to be passed to the master consumer thread
-	:py:class:`rsudp.c_consumer.Consumer`.
+	Makes a subscription to the :py:data:`BUS` that the master consumer
+	thread :py:class:`rsudp.c_consumer.Consumer` publishes to.
+	It receives everything until :py:func:`mk_p` narrows it down
+	to what the sub-consumer asks for.
 
-	:rtype: queue.Queue
+	:rtype: rsudp.bus.Subscription
 	:return: Returns the queue to pass to the sub-consumer.
 	'''
-	q = Queue(rs.qsize)
-	DESTINATIONS.append(q)
-	return q
+	return BUS.subscribe(maxsize=rs.qsize)
 
-def mk_p(proc):
+def mk_p(proc, section=None):
 	'''
-	Appends a process to the list of threads to start and stop.
+	Appends a process to the list of threads to start and stop,
+	and subscribes its queue to the channels and kinds of message
+	it asks for with the overflow policy it asks for, unless the
+	``"overflow"`` setting names another one for its settings section
+	(see :py:class:`rsudp.raspberryshake.ConsumerThread`), and connects
+	it to the bus so that it can send urgent messages.
 
 	:param threading.Thread proc: The process thread to append to the list of threads.
+	:param str section: the settings section the process was set up from, if any
 	'''
+	queue = getattr(proc, 'queue', None)
+	if queue in BUS.subscriptions:
+		queue.name = proc.sender
+		queue.subscribe(channels=getattr(proc, 'channels', None),
+						kinds=getattr(proc, 'kinds', None))
+		queue.set_policy(OVERFLOW.get(section) or getattr(proc, 'overflow', 'block'))
+		# lets the consumer send ALARM and RESET messages straight to the others
+		proc.bus = BUS
 	THREADS.append(proc)
 
 
@@ -104,19 +180,31 @@ def start():
 	'''
 	Start Consumer, Threads, and Producer.
 	'''
-	global PROD, CONTROLLER, THREADS, DESTINATIONS
-	# master queue and consumer
-	queue = Queue(rs.qsize)
-	cons = Consumer(queue, DESTINATIONS, testing=TESTING)
-	cons.start()
+	global PROD, CONTROLLER, THREADS
+	if ENGINE == 'asyncio':
+		from rsudp.aio import Engine
+		# the engine receives, publishes, and runs some consumers on its event loop
+		PROD = queue = Engine(BUS, THREADS, testing=TESTING, ring=RING)
+		for thread in THREADS:
+			if thread not in PROD.consumers:
+				thread.start()
+		PROD.start()
+	else:
+		# master queue and consumer
+		queue = Queue(rs.qsize)
+		cons = Consumer(queue, BUS, testing=TESTING)
+		cons.start()
 
-	for thread in THREADS:
-		thread.start()
+		for thread in THREADS:
+			thread.start()
 
-	PROD = Producer(queue, THREADS, testing=TESTING)
-	PROD.start()
+		PROD = Producer(queue, THREADS, testing=TESTING, ring=RING)
+		PROD.start()
 
-	if CONTROLLER and MPL:
+	wall, cpu, rss = H.process_stats()
+	printM('Started in %s s (%s s CPU time) using %s MB of memory.' % (wall, cpu, rss), sender=SENDER)
+
+	if CONTROLLER:
 		# give the controller the master queue
 		# so that it can issue a TERM signal if closed
 		CONTROLLER.master_queue = queue
@@ -131,21 +219,67 @@ def start():
 	PROD.stop = True
 
 
+def reconfigure(settings):
+	'''
+	.. versionadded:: 2.3.0
+
+	Gets ready to start over after the data stream turned out not to match
+	the saved station profile: waits for the consumers to finish, forgets
+	them, and discovers the data stream again
+	(see :py:func:`rsudp.raspberryshake.rediscover`).
+
+	:param dict settings: settings dictionary (see :ref:`defaults` for guidance)
+	'''
+	global BUS, PROD, CONTROLLER
+	for thread in THREADS:
+		if thread.is_alive():
+			thread.join(10)
+	BUS = Bus()
+	THREADS.clear()
+	PROD = False
+	CONTROLLER = False
+	printM('Starting over with the data stream as it is now...', sender=SENDER)
+	rs.rediscover(settings=settings)
+
+
 def run(settings, debug):
 	'''
 	Main setup function. Takes configuration values and passes them to
 	the appropriate threads and functions.
+	If the data stream does not match the saved station profile, the
+	consumers are stopped and set up again for the data stream as it
+	is (see :py:func:`reconfigure`).
 
 	:param dict settings: settings dictionary (see :ref:`defaults` for guidance)
 	:param bool debug: whether or not to show debug output (should be turned off if starting as daemon)
 	'''
-	global CONTROLLER, SOUND
+	global CONTROLLER
 	# handler for the exit signal
 	signal.signal(signal.SIGINT, handler)
+	OVERFLOW.update(settings['settings'].get('overflow') or {})
+	for section, policy in OVERFLOW.items():
+		if policy not in POLICIES:
+			printE('Unknown overflow policy "%s" for %s in settings file (must be one of: %s)'
+				   % (policy, section, ', '.join(POLICIES)), sender=SENDER)
+			_xit(1)
+	global ENGINE
+	ENGINE = settings['settings'].get('engine', 'threads')
+	if ENGINE not in ('threads', 'asyncio'):
+		printE('Unknown engine "%s" in settings file (must be "threads" or "asyncio")' % (ENGINE), sender=SENDER)
+		_xit(1)
+	if settings['settings'].get('processes'):
+		from rsudp.shm import SECTIONS
+		for section in settings['settings']['processes']:
+			if section in SECTIONS:
+				PROCESSES.append(section)
+			else:
+				printW('%s cannot run in a separate process (only %s can); running it as a thread.'
+					   % (section, ', '.join(SECTIONS)), sender=SENDER)
 
 	if TESTING:
 		global TESTQUEUE
 		# initialize the test data to read information from file and put it on the port
+		from rsudp.t_testdata import TestData
 		TESTQUEUE = Queue()		# separate from client library because this is not downstream of the producer
 		tdata = TestData(q=TESTQUEUE, data_file=TESTFILE, port=settings['settings']['port'])
 		tdata.start()
@@ -164,27 +298,56 @@ def run(settings, debug):
 					sender=SENDER, spaces=True)
 			_xit(1)
 
+	while True:
+		setup(settings, debug)
+		# start the producer, consumer, and activated modules
+		start()
+		if not rs.reconfigure:
+			break
+		reconfigure(settings)
+
+	CONTROLLER = False
+	if not TESTING:
+		_xit()
+	else:
+		printW('Client has exited, ending tests...', sender=SENDER, announce=False)
+
 
+def setup(settings, debug):
+	'''
+	.. versionadded:: 2.3.0
+
+	Makes the consumers that the settings enable, for the data stream
+	that :py:func:`rsudp.raspberryshake.initRSlib` found.
+
+	:param dict settings: settings dictionary (see :ref:`defaults` for guidance)
+	:param bool debug: whether or not to show debug output
+	'''
+	global CONTROLLER, SOUND
 	output_dir = settings['settings']['output_dir']
 
 
 	if settings['printdata']['enabled']:
 		# set up queue and process
 		q = mk_q()
-		prnt = PrintRaw(q, testing=TESTING)
-		mk_p(prnt)
+		prnt = load('printdata').PrintRaw(q, testing=TESTING)
+		mk_p(prnt, 'printdata')
 
 	if settings['write']['enabled']:
 		global WRITER
 		# set up queue and process
 		cha = settings['write']['channels']
 		q = mk_q()
-		WRITER = Write(q=q, data_dir=output_dir,
-					   cha=cha, testing=TESTING)
-		mk_p(WRITER)
+		try:
+			WRITER = mk_c('write', 'Write', q=q, data_dir=output_dir,
+						  cha=cha, testing=TESTING, reclen=settings['write'].get('record_length', 512))
+		except ValueError as e:
+			printE('Error in write section of settings file: %s' % (e), sender=SENDER)
+			_xit(1)
+		mk_p(WRITER, 'write')
 
 	plotter = None
-	if settings['plot']['enabled'] and MPL:
+	if settings['plot']['enabled'] and load('plot').MPL:
 		while True:
 			if rs.numchns == 0:
 				time.sleep(0.01)
@@ -223,11 +386,11 @@ def run(settings, debug):
 		else:
 			deconv = False
 
-		plotter_cls = Plot
+		plotter_cls = load('plot').Plot
 		s_line_color = "b"
 		e_line_color = "r"
 		if settings["alert"]["on_plot"] == "on-main":
-			plotter_cls = PlotAlert
+			plotter_cls = load('plot').PlotAlert
 			s_line_color = settings["alert"]["on_plot_start_line_color"]
 			e_line_color = settings["alert"]["on_plot_end_line_color"]
 		plotter = plotter_cls(cha=cha, seconds=sec, spectrogram=spec,
@@ -248,19 +411,22 @@ def run(settings, debug):
 		cha = settings['forward']['channels']
 		fwd_data = settings['forward']['fwd_data']
 		fwd_alarms = settings['forward']['fwd_alarms']
+		fmt = settings['forward'].get('format', 'text')
+		latency = settings['forward'].get('latency', 1.0)
+		derive = settings['forward'].get('derive', None)
 		# set up queue and process
-		if len(addr) == len(port):
-			printM('Initializing %s Forward threads' % (len(addr)), sender=SENDER)
-			for i in range(len(addr)):
-				q = mk_q()
-				forward = Forward(num=i, addr=addr[i], port=int(port[i]), cha=cha,
-								  fwd_data=fwd_data, fwd_alarms=fwd_alarms,
-								  q=q, testing=TESTING)
-				mk_p(forward)
-		else:
-			printE('List length mismatch: %s addresses and %s ports in forward section of settings file' % (
-										len(addr), len(port)), sender=SENDER)
+		try:
+			dests = load('forward').destinations(addr, port, cha=cha, fwd_data=fwd_data, fwd_alarms=fwd_alarms,
+												 fmt=fmt, latency=latency, derive=derive)
+			printM('Initializing Forward thread for %s destinations' % (len(dests)), sender=SENDER)
+			q = mk_q()
+			forward = load('forward').Forward(dests=dests, q=q, testing=TESTING,
+											  ttl=settings['forward'].get('multicast_ttl', 1),
+											  interface=settings['forward'].get('multicast_interface', ''))
+		except (ValueError, TypeError) as e:
+			printE('Error in forward section of settings file: %s' % (e), sender=SENDER)
 			_xit(1)
+		mk_p(forward, 'forward')
 
 	alert_plotter = None
 	if settings['alert']['enabled']:
@@ -282,14 +448,14 @@ def run(settings, debug):
 
 		# set up queue and process
 		q = mk_q()
-		alrt = Alert(sta=sta, lta=lta, duration=duration, thresh=thresh, reset=reset, bp=bp,
-					 cha=cha, debug=debug, q=q, testing=TESTING,
-					 deconv=deconv)
-		mk_p(alrt)
+		alrt = mk_c('alert', 'Alert', sta=sta, lta=lta, duration=duration, thresh=thresh, reset=reset, bp=bp,
+					cha=cha, debug=debug, q=q, testing=TESTING,
+					deconv=deconv)
+		mk_p(alrt, 'alert')
 		if settings['plot']['enabled'] and settings["alert"]["on_plot"] == "separate":
 			s_line_color = settings["alert"]["on_plot_start_line_color"]
 			e_line_color = settings["alert"]["on_plot_end_line_color"]
-			alert_plotter = PlotAlert(cha=cha, seconds=sec, spectrogram=False,
+			alert_plotter = load('plot').PlotAlert(cha=cha, seconds=sec, spectrogram=False,
 									  fullscreen=False, kiosk=False, deconv=deconv,
 									  screencap=False, alert=False, filter_waveform=filter_waveform,
 									  filter_spectrogram=filter_spectrogram, filter_highpass=filter_highpass,
@@ -301,13 +467,14 @@ def run(settings, debug):
 	if settings['alertsound']['enabled']:
 		soundloc = os.path.expanduser(os.path.expanduser(settings['alertsound']['mp3file']))
 		if soundloc in ['doorbell', 'alarm', 'beeps', 'sonar']:
-			soundloc = pr.resource_filename('rsudp', os.path.join('rs_sounds', '%s.mp3' % soundloc))
+			soundloc = resource_path('rs_sounds', '%s.mp3' % soundloc)
 
 		q = mk_q()
-		alsnd = AlertSound(q=q, testing=TESTING, soundloc=soundloc)
-		mk_p(alsnd)
+		alsnd = load('alertsound').AlertSound(q=q, testing=TESTING, soundloc=soundloc)
+		mk_p(alsnd, 'alertsound')
 
-	if settings['plot']['enabled'] and MPL:
+	if plotter:
+		from rsudp.c_plot_controller import PlotsController
 		pq = mk_q()
 		sec = settings['plot']['duration']
 		refresh_interval = settings['plot']['refresh_interval']
@@ -316,6 +483,10 @@ def run(settings, debug):
 			plots.append(alert_plotter)
 		for num in range(0, len(plots)):
 			plots[num].figure_num = num + 1
+		pq.name = 'Plot'
+		pq.subscribe(channels=set().union(*(plot.chans for plot in plots)),
+					 kinds=['DATA', 'ALARM', 'RESET'])
+		pq.set_policy(OVERFLOW.get('plot') or 'block')
 		CONTROLLER = PlotsController(pq, plots, seconds=sec, refresh_interval=refresh_interval)
 
 	runcustom = False
@@ -340,8 +511,8 @@ def run(settings, debug):
 	if runcustom:
 		# set up queue and process
 		q = mk_q()
-		cstm = Custom(q=q, codefile=f, win_ovr=win_ovr, testing=TESTING)
-		mk_p(cstm)
+		cstm = load('custom').Custom(q=q, codefile=f, win_ovr=win_ovr, testing=TESTING)
+		mk_p(cstm, 'custom')
 
 
 	if settings['tweets']['enabled']:
@@ -354,10 +525,10 @@ def run(settings, debug):
 		extra_text = settings['tweets']['extra_text']
 
 		q = mk_q()
-		TWITTER = Tweeter(q=q, consumer_key=consumer_key, consumer_secret=consumer_secret,
+		TWITTER = load('tweets').Tweeter(q=q, consumer_key=consumer_key, consumer_secret=consumer_secret,
 						access_token=access_token, access_token_secret=access_token_secret,
 						tweet_images=tweet_images, extra_text=extra_text, testing=TESTING)
-		mk_p(TWITTER)
+		mk_p(TWITTER, 'tweets')
 
 	if settings['telegram']['enabled']:
 		global TELEGRAM
@@ -370,10 +541,10 @@ def run(settings, debug):
 		for chat_id in chat_ids:
 			sender = "Telegram id %s" % (chat_id)
 			q = mk_q()
-			TELEGRAM = Telegrammer(q=q, token=token, chat_id=chat_id,
+			TELEGRAM = load('telegram').Telegrammer(q=q, token=token, chat_id=chat_id,
 								   send_images=send_images, extra_text=extra_text,
 								   sender=sender, upload_timeout=upload_timeout, testing=TESTING)
-			mk_p(TELEGRAM)
+			mk_p(TELEGRAM, 'telegram')
 
 	if settings['rsam']['enabled']:
 		# put settings in namespace
@@ -393,11 +564,19 @@ def run(settings, debug):
 
 		# set up queue and process
 		q = mk_q()
-		rsam = RSAM(q=q, interval=interval, cha=cha, deconv=deconv,
-					fwaddr=fwaddr, fwport=fwport, fwformat=fwformat,
-					quiet=quiet, testing=TESTING)
+		bands = settings['rsam'].get('bands', [])
+		archive = False
+		if settings['rsam'].get('archive', False):
+			archive = os.path.join(os.path.expanduser(settings['settings']['output_dir']), 'rsam')
+		try:
+			rsam = mk_c('rsam', 'RSAM', q=q, interval=interval, cha=cha, deconv=deconv,
+						fwaddr=fwaddr, fwport=fwport, fwformat=fwformat,
+						quiet=quiet, testing=TESTING, bands=bands, archive=archive)
+		except ValueError as e:
+			printE('Error in rsam section of settings file: %s' % (e), sender=SENDER)
+			_xit(1)
 
-		mk_p(rsam)
+		mk_p(rsam, 'rsam')
 
 
 	# start additional modules here!
@@ -408,21 +587,12 @@ def run(settings, debug):
 
 	if TESTING:
 		# initialize test consumer
+		from rsudp.c_testing import Testing
 		q = mk_q()
 		test = Testing(q=q)
 		mk_p(test)
 
 
-	# start the producer, consumer, and activated modules
-	start()
-
-	CONTROLLER = False
-	if not TESTING:
-		_xit()
-	else:
-		printW('Client has exited, ending tests...', sender=SENDER, announce=False)
-
-
 def main():
 	'''
 	Loads settings to start the main client.
@@ -564,6 +734,7 @@ default settings and the data file at
 %s
 ''' % (TESTFILE)
 
+	from rsudp.packetize import packetize
 	test_mode(True)
 	settings = Settings.default_settings(verbose=False)
 	settings_are_default = True
@@ -632,8 +803,11 @@ default settings and the data file at
 	T.TEST['p_output_dirs'][1] = init_dirs(os.path.expanduser(settings['settings']['output_dir']))
 	T.TEST['p_data_dir'][1] = T.datadir_permissions(os.path.expanduser(settings['settings']['output_dir']))
 	T.TEST['p_screenshot_dir'][1] = T.ss_permissions(os.path.expanduser(settings['settings']['output_dir']))
+	T.TEST['x_steim2'][1] = T.steim2_roundtrip()
+	T.TEST['x_codec'][1] = T.codec_roundtrip()
+	T.TEST['x_stalta'][1] = T.stalta_stream()
 
-	settings = T.cancel_tests(settings, MPL, plot, quiet)
+	settings = T.cancel_tests(settings, load('plot').MPL if plot else False, plot, quiet)
 
 	try:
 		run(settings, debug=True)
@@ -0,0 +1,304 @@
+import time
+import numpy as np
+
+
+MAGIC = b'\x00RS\x01'
+'''
+The first four bytes of a binary datagram. The first byte can not start
+a text data packet or message, and the last one is the format version.
+'''
+MAX_SIZE = 1400
+'''
+Largest datagram :py:func:`encode_many` and :py:class:`Batcher` make,
+in bytes, so that datagrams are not fragmented on a 1500 byte MTU.
+'''
+
+
+def is_encoded(DP):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param bytes DP: bytes received on the port
+	:rtype: bool
+	:return: ``True`` if the datagram is in the binary format (see :py:func:`encode`)
+	'''
+	return DP[:4] == MAGIC
+
+
+def _uvarint(n):
+	'''
+	Encodes one unsigned integer as a varint.
+	'''
+	out = bytearray()
+	while n >= 0x80:
+		out.append((n & 0x7f) | 0x80)
+		n >>= 7
+	out.append(n)
+	return out
+
+
+def _read_uvarint(buf, pos):
+	'''
+	Reads one varint from ``buf`` at ``pos``.
+
+	:return: the value and the position after it
+	'''
+	n, shift = 0, 0
+	while True:
+		b = buf[pos]
+		pos += 1
+		n |= (b & 0x7f) << shift
+		if b < 0x80:
+			return n, pos
+		shift += 7
+
+
+def _zigzag(n):
+	return (n << 1) ^ (n >> 63)
+
+
+def _unzigzag(n):
+	return (n >> 1) ^ -(n & 1)
+
+
+def _varints(v):
+	'''
+	Encodes an array of unsigned integers as varints, all at once.
+
+	:param numpy.ndarray v: values as :py:class:`numpy.uint64`
+	:rtype: bytes
+	'''
+	if not len(v):
+		return b''
+	n = np.ones(len(v), dtype=np.int64)
+	for k in range(1, 10):
+		more = v >= np.uint64(1 << (7 * k))
+		if not more.any():
+			break
+		n += more
+	ends = np.cumsum(n)
+	starts = ends - n
+	out = np.empty(ends[-1], dtype=np.uint8)
+	for k in range(int(n.max())):
+		sel = n > k
+		b = (v[sel] >> np.uint64(7 * k)) & np.uint64(0x7f)
+		b |= (n[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+		out[starts[sel] + k] = b
+	return out.tobytes()
+
+
+def _read_varints(buf, pos, count):
+	'''
+	Reads ``count`` varints from ``buf`` at ``pos``, all at once.
+
+	:return: the values as :py:class:`numpy.uint64`, and the position after them
+	:raise ValueError: if there are fewer than ``count`` varints
+	'''
+	if not count:
+		return np.zeros(0, dtype=np.uint64), pos
+	b = np.frombuffer(buf, dtype=np.uint8, offset=pos)
+	ends = np.flatnonzero(b < 0x80)[:count]
+	if len(ends) < count:
+		raise ValueError('datagram ends before its %s samples' % count)
+	stop = int(ends[-1]) + 1
+	starts = np.r_[0, ends[:-1] + 1]
+	shift = (np.arange(stop) - np.repeat(starts, ends - starts + 1)) * 7
+	vals = (b[:stop].astype(np.uint64) & np.uint64(0x7f)) << shift.astype(np.uint64)
+	return np.add.reduceat(vals, starts), pos + stop
+
+
+def encode(packets):
+	'''
+	.. versionadded:: 2.3.0
+
+	Encodes data packets of one or more channels into one binary datagram.
+	Each packet keeps its own channel, time (to the millisecond), and
+	samples, so :py:func:`decode` gives back the same packets.
+	The samples of each packet are stored as the difference from the
+	sample before (the first as itself), zigzag encoded so that small
+	negative differences stay small, as varints of 7 bits per byte.
+	Seismic data changes little from one sample to the next, so most
+	samples take one or two bytes instead of the six or seven of the text
+	format.
+
+	The datagram is :py:data:`MAGIC`, then varints for the time of the first
+	packet in milliseconds, the number of channels, each channel name (its
+	length and then its characters), the number of packets, and for each
+	packet its channel number, its time difference to the first packet
+	(zigzag encoded) and its number of samples, and then the samples of
+	all the packets.
+
+	:param list packets: :py:class:`rsudp.raspberryshake.Packet` objects (or anything with ``cha``, ``time`` and ``data``)
+	:rtype: bytes
+	'''
+	out = bytearray(MAGIC)
+	ms = [int(round(p.time * 1000)) for p in packets]
+	base = ms[0] if ms else 0
+	chas = list(dict.fromkeys(p.cha for p in packets))
+	index = {c: i for i, c in enumerate(chas)}
+	out += _uvarint(base)
+	out += _uvarint(len(chas))
+	for c in chas:
+		name = c.encode('ascii')
+		out += _uvarint(len(name)) + name
+	out += _uvarint(len(packets))
+	for p, t in zip(packets, ms):
+		out += _uvarint(index[p.cha])
+		out += _uvarint(_zigzag(t - base))
+		out += _uvarint(len(p.data))
+	if packets:
+		samples = np.concatenate([np.asarray(p.data, dtype=np.int64) for p in packets])
+		d = np.diff(samples, prepend=0)
+		starts = np.cumsum([0] + [len(p.data) for p in packets[:-1]])
+		d[starts[starts < len(d)]] = samples[starts[starts < len(d)]]
+		out += _varints(((d << 1) ^ (d >> 63)).astype(np.uint64))
+	return bytes(out)
+
+
+def encode_many(packets, max_size=MAX_SIZE):
+	'''
+	.. versionadded:: 2.3.0
+
+	Encodes data packets into as few datagrams of at most ``max_size``
+	bytes as it can, splitting the packets in two until each part fits
+	(a packet that is too big on its own still gets a datagram of its own).
+
+	:param list packets: data packets
+	:param int max_size: largest datagram in bytes
+	:rtype: list
+	:return: list of datagrams (bytes)
+	'''
+	if not packets:
+		return []
+	dp = encode(packets)
+	if (len(dp) <= max_size) or (len(packets) == 1):
+		return [dp]
+	half = len(packets) // 2
+	return encode_many(packets[:half], max_size) + encode_many(packets[half:], max_size)
+
+
+def decode(DP):
+	'''
+	.. versionadded:: 2.3.0
+
+	Decodes a binary datagram made by :py:func:`encode`.
+
+	:param bytes DP: the datagram
+	:rtype: list
+	:return: list of ``(cha, time, data)`` tuples, one per packet, with ``data`` as :py:class:`numpy.int32`
+	:raise ValueError: if the datagram is not in the binary format or is cut short
+	'''
+	if not is_encoded(DP):
+		raise ValueError('not a binary datagram')
+	try:
+		pos = len(MAGIC)
+		base, pos = _read_uvarint(DP, pos)
+		nchas, pos = _read_uvarint(DP, pos)
+		chas = []
+		for i in range(nchas):
+			n, pos = _read_uvarint(DP, pos)
+			chas.append(DP[pos:pos+n].decode('ascii'))
+			pos += n
+		npackets, pos = _read_uvarint(DP, pos)
+		heads = []
+		for i in range(npackets):
+			c, pos = _read_uvarint(DP, pos)
+			t, pos = _read_uvarint(DP, pos)
+			n, pos = _read_uvarint(DP, pos)
+			heads.append((chas[c], (base + _unzigzag(t)) / 1000, n))
+	except IndexError:
+		raise ValueError('datagram ends in its header')
+	counts = [n for c, t, n in heads]
+	zz, pos = _read_varints(DP, pos, sum(counts))
+	d = (zz >> np.uint64(1)).astype(np.int64) ^ -(zz & np.uint64(1)).astype(np.int64)
+	# each packet's first sample is stored as itself, so its running sum starts over
+	c = np.cumsum(d)
+	out, o = [], 0
+	for cha, t, n in heads:
+		seg = c[o:o+n]
+		if o:
+			seg = seg - c[o-1]
+		out.append((cha, t, seg.astype(np.int32)))
+		o += n
+	return out
+
+
+def to_text(cha, t, data):
+	'''
+	.. versionadded:: 2.3.0
+
+	Writes a data packet in the text format the Raspberry Shake sends,
+	e.g. ``b"{'EHZ', 1582315130.292, 14168, 14927}"``.
+
+	:param str cha: channel name
+	:param float t: time of the first sample
+	:param data: the samples
+	:rtype: bytes
+	'''
+	return ("{'%s', %.3f, %s}" % (cha, t, ', '.join(map(str, np.asarray(data).tolist())))).encode('utf-8')
+
+
+class Batcher():
+	'''
+	.. versionadded:: 2.3.0
+
+	Collects data packets for one destination and encodes them into
+	binary datagrams (see :py:func:`encode`) once the oldest has waited
+	``latency`` seconds, or sooner if the datagram would otherwise grow past
+	``max_size`` bytes. Aggregating several channels and several packet
+	intervals in one datagram saves the per-datagram overhead (the
+	header, and 28 bytes of UDP/IP headers) as well as datagrams.
+
+	:param float latency: longest time in seconds a packet waits before it is sent
+	:param int max_size: largest datagram in bytes
+	'''
+	def __init__(self, latency=1.0, max_size=MAX_SIZE):
+		self.latency = max(0.0, float(latency))
+		self.max_size = max_size
+		self.packets = []
+		self.since = 0.0
+		self.size = 0
+
+	def add(self, p, now=None):
+		'''
+		Adds a packet.
+
+		:param rsudp.raspberryshake.Packet p: data packet
+		:param float now: :py:func:`time.monotonic` time
+		:rtype: list
+		:return: datagrams to send now (the ones that would have grown too big)
+		'''
+		now = time.monotonic() if now is None else now
+		out = []
+		# a rough guess of two bytes a sample and eight for the packet's header
+		size = 8 + 2 * len(p.data)
+		if self.packets and (self.size + size > self.max_size):
+			out = self.flush()
+		if not self.packets:
+			self.since = now
+		self.packets.append(p)
+		self.size += size
+		return out
+
+	def wait(self, now=None):
+		'''
+		:param float now: :py:func:`time.monotonic` time
+		:rtype: float or None
+		:return: seconds until the oldest packet is due, ``0`` if it is overdue, or ``None`` if there are no packets
+		'''
+		if not self.packets:
+			return None
+		now = time.monotonic() if now is None else now
+		return max(0.0, self.since + self.latency - now)
+
+	def flush(self):
+		'''
+		Encodes the packets collected so far and forgets them.
+
+		:rtype: list
+		:return: datagrams to send
+		'''
+		out = encode_many(self.packets, self.max_size)
+		self.packets = []
+		self.size = 0
+		return out
@@ -0,0 +1,917 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import iirfilter, zpk2sos, sosfilt, sosfilt_zi, lfilter, firwin
+from rsudp import printW, codec
+import rsudp.raspberryshake as rs
+
+
+@lru_cache(maxsize=32)
+def sos_design(filt, sps, freqmin=0, freqmax=0, freq=0, corners=4, sender='dsp'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Designs a Butterworth filter in second-order sections the same way
+	:py:meth:`obspy.core.trace.Trace.filter` does for ``'bandpass'``,
+	``'highpass'`` and ``'lowpass'``, so that filtering data in chunks
+	with :py:class:`rsudp.dsp.SosFilter` gives the same result as filtering
+	it all at once with obspy.
+
+	Designs are cached, so asking for the same filter again
+	(for another channel or another consumer) costs nothing.
+	The returned array is shared, so it must not be modified.
+
+	:param str filt: ``'bandpass'``, ``'highpass'``, or ``'lowpass'``
+	:param float sps: sampling rate of the data
+	:param float freqmin: low corner of a bandpass filter
+	:param float freqmax: high corner of a bandpass filter
+	:param float freq: corner of a highpass or lowpass filter
+	:param int corners: filter order
+	:param str sender: the name of the class using the filter, for warnings
+	:rtype: numpy.ndarray
+	:return: second-order sections (see :py:func:`scipy.signal.sosfilt`)
+	'''
+	fe = 0.5 * sps
+	if filt == 'bandpass':
+		low, high = freqmin / fe, freqmax / fe
+		if high - 1.0 > -1e-6:
+			printW('Selected high corner frequency (%s) of bandpass is at or above '
+				   'Nyquist (%s). Applying a high-pass instead.' % (freqmax, fe), sender)
+			return sos_design('highpass', sps, freq=freqmin, corners=corners, sender=sender)
+		if low > 1:
+			raise ValueError('Selected low corner frequency is above Nyquist.')
+		z, p, k = iirfilter(corners, [low, high], btype='band', ftype='butter', output='zpk')
+	elif filt == 'highpass':
+		f = freq / fe
+		if f > 1:
+			raise ValueError('Selected corner frequency is above Nyquist.')
+		z, p, k = iirfilter(corners, f, btype='highpass', ftype='butter', output='zpk')
+	elif filt == 'lowpass':
+		f = freq / fe
+		if f > 1:
+			f = 1.0
+			printW('Selected corner frequency is above Nyquist. '
+				   'Setting Nyquist as high corner.', sender)
+		z, p, k = iirfilter(corners, f, btype='lowpass', ftype='butter', output='zpk')
+	else:
+		raise ValueError('Unknown filter type: %s' % filt)
+	return zpk2sos(z, p, k)
+
+
+class SosFilter():
+	'''
+	.. versionadded:: 2.3.0
+
+	A causal IIR filter that keeps its state between calls,
+	so that data can be filtered one packet at a time.
+	Filtering consecutive chunks gives the same output as filtering
+	the whole series at once with :py:func:`scipy.signal.sosfilt`
+	(and therefore :py:meth:`obspy.core.trace.Trace.filter` with ``zerophase=False``).
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import sos_design, SosFilter
+		>>> f = SosFilter(sos_design('bandpass', 100, freqmin=0.8, freqmax=9))
+		>>> y = f(packet_data)
+
+	:param numpy.ndarray sos: second-order sections (see :py:func:`rsudp.dsp.sos_design`)
+	:param bool settle: if ``True``, settle the filter on the first sample it sees (see :py:func:`settle`)
+	'''
+	def __init__(self, sos, settle=False):
+		self.sos = sos
+		self.settle_first = settle
+		self.reset()
+
+	def reset(self):
+		'''
+		Resets the filter state to zero (the state obspy starts from).
+		'''
+		self.zi = np.zeros((self.sos.shape[0], 2))
+		self.started = False
+
+	def settle(self, x0):
+		'''
+		Sets the filter state to the steady state for a constant input ``x0``.
+		Useful to avoid a step response when starting on data with a large offset.
+
+		:param float x0: the input value to settle on
+		'''
+		self.zi = sosfilt_zi(self.sos) * x0
+
+	def __call__(self, x):
+		'''
+		Filters the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		:return: the filtered samples (float64)
+		'''
+		x = np.asarray(x, dtype=np.float64)
+		if not self.started and len(x):
+			self.started = True
+			if self.settle_first:
+				self.settle(x[0])
+		y, self.zi = sosfilt(self.sos, x, zi=self.zi)
+		return y
+
+
+class FilterStage():
+	'''
+	.. versionadded:: 2.3.0
+
+	A reusable filter stage for :py:func:`rsudp.ringbuffer.StreamBuffer.derive`.
+	The filter is designed once (see :py:func:`sos_design`) and each call
+	returns a new :py:class:`SosFilter` for one channel, so that every
+	channel carries its own state from packet to packet.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import FilterStage
+		>>> from rsudp.ringbuffer import StreamBuffer
+		>>> raw = StreamBuffer(seconds=30)
+		>>> filtered = raw.derive(FilterStage('bandpass', 100, freqmin=0.7, freqmax=2.0))
+		>>> # each raw.update(d) now also writes continuously filtered data to filtered
+
+	:param str filt: ``'bandpass'``, ``'highpass'``, or ``'lowpass'``
+	:param float sps: sampling rate of the data
+	:param float freqmin: low corner of a bandpass filter
+	:param float freqmax: high corner of a bandpass filter
+	:param float freq: corner of a highpass or lowpass filter
+	:param int corners: filter order
+	:param bool settle: whether to settle each channel's filter on its first sample, avoiding a startup transient
+	:param str sender: the name of the class using the filter, for warnings
+	'''
+	def __init__(self, filt, sps, freqmin=0, freqmax=0, freq=0, corners=4,
+				 settle=False, sender='dsp'):
+		self.sos = sos_design(filt, float(sps), freqmin=freqmin, freqmax=freqmax,
+							  freq=freq, corners=int(corners), sender=sender)
+		self.settle = settle
+
+	def __call__(self, cha=None):
+		'''
+		Returns a new filter for one channel.
+
+		:param str cha: channel name (all channels get the same filter)
+		:rtype: rsudp.dsp.SosFilter
+		'''
+		return SosFilter(self.sos, settle=self.settle)
+
+
+class StaLta():
+	'''
+	.. versionadded:: 2.3.0
+
+	A streaming version of :py:func:`obspy.signal.trigger.recursive_sta_lta`.
+	The STA and LTA accumulators are kept between calls, so each packet
+	only costs work proportional to its length.
+	Feeding a series in chunks gives the same characteristic function,
+	to floating point precision, as running
+	:py:func:`obspy.signal.trigger.recursive_sta_lta` over the whole series,
+	including zeros for the first ``nlta`` samples while the LTA warms up.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import StaLta
+		>>> s = StaLta(nsta=600, nlta=3000)
+		>>> c = s(packet_data)
+
+	:param int nsta: length of the short term average in samples
+	:param int nlta: length of the long term average in samples
+	'''
+	def __init__(self, nsta, nlta):
+		self.nsta = int(nsta)
+		self.nlta = int(nlta)
+		self.csta = 1. / self.nsta
+		self.clta = 1. / self.nlta
+		self.reset()
+
+	def reset(self):
+		'''
+		Resets the accumulators. The next sample is treated as the first.
+		'''
+		self.sta = 0.
+		self.lta = 1e-99	# avoid zero division, as obspy does
+		self.n = 0			# number of samples seen
+
+	def __call__(self, x):
+		'''
+		Computes the STA/LTA ratio for the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		:return: the STA/LTA characteristic function for each new sample
+		'''
+		sq = np.square(np.asarray(x, dtype=np.float64))
+		out = np.zeros(len(sq))
+		skip = 1 if (self.n == 0) else 0	# obspy starts from the second sample
+		if len(sq) > skip:
+			sta = lfilter([self.csta], [1., self.csta - 1.], sq[skip:],
+						  zi=[(1. - self.csta) * self.sta])[0]
+			lta = lfilter([self.clta], [1., self.clta - 1.], sq[skip:],
+						  zi=[(1. - self.clta) * self.lta])[0]
+			self.sta, self.lta = sta[-1], lta[-1]
+			out[skip:] = sta / lta
+		# zero the warmup period
+		warm = self.nlta - self.n
+		if warm > 0:
+			out[:warm] = 0.
+		self.n += len(sq)
+		return out
+
+
+_INVERSE = {}
+
+
+def inverse_response(response, sps, nfft, output='VEL', pre_filt=None, water_level=4.5):
+	'''
+	.. versionadded:: 2.3.0
+
+	Evaluates the inverse of an instrument response on the frequency
+	grid of a real FFT of length ``nfft``, the same way
+	:py:meth:`obspy.core.trace.Trace.remove_response` does:
+	the response is evaluated with
+	:py:meth:`obspy.core.inventory.response.Response.get_evalresp_response`,
+	inverted with a water level, and multiplied by a cosine taper
+	between the ``pre_filt`` corner frequencies.
+
+	Evaluating a response is expensive, so the result is cached per
+	response object, sampling rate, FFT length and set of parameters.
+	The returned array is shared, so it must not be modified.
+
+	:param obspy.core.inventory.response.Response response: the instrument response
+	:param float sps: sampling rate of the data
+	:param int nfft: FFT length
+	:param str output: ``'DISP'``, ``'VEL'``, or ``'ACC'``
+	:param list pre_filt: four corner frequencies of the frequency domain taper, or ``None``
+	:param float water_level: water level in dB below the maximum of the response
+	:rtype: numpy.ndarray
+	:return: complex spectrum of length ``nfft // 2 + 1``
+	'''
+	pf = tuple(pre_filt) if pre_filt else None
+	key = (id(response), float(sps), int(nfft), output, pf, water_level)
+	if key not in _INVERSE:
+		from obspy.signal.invsim import cosine_sac_taper, invert_spectrum
+		spec, freqs = response.get_evalresp_response(1. / sps, int(nfft), output=output)
+		invert_spectrum(spec, water_level)
+		if pf:
+			spec *= cosine_sac_taper(freqs, flimit=pf)
+		# keep a reference to the response so that its id is not reused
+		_INVERSE[key] = (response, spec)
+	return _INVERSE[key][1]
+
+
+
+def inverse_fir(spec, tolerance=1e-5):
+	'''
+	.. versionadded:: 2.3.0
+
+	Turns an inverse response spectrum (see :py:func:`inverse_response`)
+	into a finite impulse response filter that can be applied to a stream.
+	The zero-phase impulse response is cut to the shortest window around
+	zero time that keeps all but a ``tolerance`` fraction of its energy.
+	The part before zero time is what makes the filter non-causal,
+	so its length is the delay the filter introduces.
+
+	:param numpy.ndarray spec: complex spectrum on a real FFT grid
+	:param float tolerance: fraction of the impulse response energy that may be discarded
+	:rtype: tuple
+	:return: the filter taps (:py:class:`numpy.ndarray`) and the delay in samples (:py:class:`int`)
+	'''
+	h = np.fft.irfft(spec)
+	nfft = len(h)
+	e = np.square(h)
+	limit = tolerance * e.sum() / 2.
+	# energy left over beyond each lag, after and before zero time
+	after = np.cumsum(e[:nfft // 2][::-1])[::-1]
+	before = np.cumsum(e[nfft // 2:])
+	post = max(int(np.argmax(np.append(after < limit, True))), 1)
+	pre = int(np.argmax(np.append(before[::-1] < limit, True)))
+	taps = np.concatenate((h[nfft-pre:], h[:post]))
+	if spec[0] == 0:
+		# cutting the response off leaves a little gain at zero frequency,
+		# which would let through some of the large offset of raw counts
+		w = np.hanning(len(taps) + 2)[1:-1]
+		taps -= w * taps.sum() / w.sum()
+	return taps, pre
+
+
+class FirFilter():
+	'''
+	.. versionadded:: 2.3.0
+
+	A finite impulse response filter that filters data one packet at a
+	time by overlap-save fast convolution.
+	New samples are collected into blocks of at least ``block`` samples,
+	and each full block is filtered with one transform of fixed length,
+	so the cost per sample does not depend on the size of the packets.
+	To return as many samples as it is given, the filter holds back one
+	block of output, which adds the block length to its ``delay``.
+
+	:param numpy.ndarray taps: the filter taps
+	:param int delay: the delay the taps introduce, in samples
+	:param bool settle: if ``True``, start as if the first sample had been constant forever
+	:param int block: the smallest number of samples to filter at once (defaults to the number of taps)
+	'''
+	def __init__(self, taps, delay=0, settle=True, block=None):
+		self.taps = np.asarray(taps, dtype=np.float64)
+		m = len(self.taps) - 1
+		self.nfft = 1 << (m + (block or len(self.taps)) - 1).bit_length()
+		# whatever room the transform has beyond the history is used for new samples
+		self.block = self.nfft - m
+		self.spectrum = np.fft.rfft(self.taps, self.nfft)
+		self.delay = delay + self.block
+		self.settle_first = settle
+		self.reset()
+
+	def reset(self):
+		'''
+		Clears the stored input and output. The next sample is treated as the first.
+		'''
+		self.history = None
+		self.pending = np.zeros(0)
+		self.out = np.zeros(0)
+
+	def __call__(self, x):
+		'''
+		Filters the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		:return: the filtered samples (float64), ``delay`` samples behind the input
+		'''
+		x = np.asarray(x, dtype=np.float64)
+		if not len(x):
+			return x
+		m = len(self.taps) - 1
+		if self.history is None:
+			x0 = x[0] if self.settle_first else 0.
+			self.history = np.full(m, x0)
+			# the output for the block held back before the first sample
+			self.out = np.full(self.block, x0 * self.taps.sum())
+		self.pending = np.concatenate((self.pending, x))
+		y = [self.out]
+		while len(self.pending) >= self.block:
+			seg = np.concatenate((self.history, self.pending[:self.block]))
+			self.history = seg[len(seg)-m:]
+			self.pending = self.pending[self.block:]
+			y.append(np.fft.irfft(np.fft.rfft(seg) * self.spectrum, self.nfft)[m:])
+		y = np.concatenate(y)
+		self.out = y[len(x):]
+		return y[:len(x)]
+
+
+class Differentiator():
+	'''
+	.. versionadded:: 2.3.0
+
+	Streaming time derivative using central differences,
+	as :py:func:`numpy.gradient` does in the interior of an array.
+	Each output sample needs the input sample after it,
+	so the output is one sample behind the input.
+
+	:param float sps: sampling rate of the data
+	'''
+	def __init__(self, sps):
+		self.scale = sps / 2.
+		self.delay = 1
+		self.reset()
+
+	def reset(self):
+		'''
+		Clears the stored input. The next sample is treated as the first.
+		'''
+		self.last = None
+
+	def __call__(self, x):
+		'''
+		Differentiates the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		'''
+		x = np.asarray(x, dtype=np.float64)
+		if not len(x):
+			return x
+		if self.last is None:
+			self.last = np.full(2, x[0])
+		ext = np.concatenate((self.last, x))
+		self.last = ext[-2:]
+		return (ext[2:] - ext[:-2]) * self.scale
+
+
+class Integrator():
+	'''
+	.. versionadded:: 2.3.0
+
+	Streaming time integral. A plain running sum of a deconvolved signal
+	wanders off without bound, and a window-based integration removes that
+	with a demean or detrend, which a stream cannot do;
+	instead the integral leaks back to zero with a time constant
+	of one period of the frequency ``corner``, which acts as a
+	first-order high-pass filter below that frequency.
+
+	:param float sps: sampling rate of the data
+	:param float corner: frequency below which the integral is suppressed
+	'''
+	def __init__(self, sps, corner=0.1):
+		self.dt = 1. / sps
+		self.leak = np.exp(-2. * np.pi * corner / sps)
+		self.delay = 0
+		self.reset()
+
+	def reset(self):
+		'''
+		Resets the integral to zero.
+		'''
+		self.zi = np.zeros(1)
+
+	def __call__(self, x):
+		'''
+		Integrates the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		'''
+		y, self.zi = lfilter([self.dt], [1., -self.leak],
+							 np.asarray(x, dtype=np.float64), zi=self.zi)
+		return y
+
+
+class Chain():
+	'''
+	.. versionadded:: 2.3.0
+
+	Runs chunks of data through a list of streaming processors in turn.
+	The delay of the chain is the sum of the delays of its processors.
+	An empty chain returns its input as float64.
+
+	:param list procs: processors (callables that take and return arrays of the same length)
+	'''
+	def __init__(self, procs=None):
+		self.procs = procs or []
+		self.delay = sum(getattr(p, 'delay', 0) for p in self.procs)
+
+	def __call__(self, x):
+		x = np.asarray(x, dtype=np.float64)
+		for p in self.procs:
+			x = p(x)
+		return x
+
+
+class Scale():
+	'''
+	.. versionadded:: 2.3.0
+
+	Multiplies data by a constant.
+
+	:param float factor: the constant
+	'''
+	def __init__(self, factor):
+		self.factor = factor
+		self.delay = 0
+
+	def __call__(self, x):
+		return np.asarray(x, dtype=np.float64) * self.factor
+
+
+VEL_CHANNELS = ['EHE', 'EHN', 'EHZ', 'SHZ']
+ACC_CHANNELS = ['ENE', 'ENN', 'ENZ']
+
+
+class DeconvStage():
+	'''
+	.. versionadded:: 2.3.0
+
+	A streaming instrument deconvolution stage, usable by itself or with
+	:py:func:`rsudp.ringbuffer.StreamBuffer.derive`.
+	Each call returns a processor (a :py:class:`Chain`) for one channel
+	that removes the instrument response and converts to the requested units.
+
+	The response of each channel is taken from
+	:py:data:`rsudp.raspberryshake.inv` and evaluated once
+	(see :py:func:`inverse_response`) with the same ``pre_filt`` and
+	water level that :py:func:`rsudp.helpers.deconvolve` uses.
+	It is removed to the channel's native units (velocity for geophone
+	channels, acceleration for accelerometer channels) by a
+	:py:class:`FirFilter`, then converted to other units with a
+	:py:class:`Differentiator`, one or two :py:class:`Integrator` s,
+	or a :py:class:`Scale` by :py:data:`rsudp.raspberryshake.g`.
+	Channels without a response (e.g. the Boom's ``HDF``) pass through in counts.
+
+	The output of a processor lags its input by the processor's
+	``delay`` (up to about half a minute: the leading part of the
+	inverse filter plus one block of the :py:class:`FirFilter`), which :py:class:`rsudp.ringbuffer.StreamBuffer`
+	accounts for when timestamping derived data.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import DeconvStage
+		>>> from rsudp.ringbuffer import StreamBuffer
+		>>> raw = StreamBuffer(seconds=30)
+		>>> vel = raw.derive(DeconvStage('VEL', 100))
+
+	:param str deconv: ``'VEL'``, ``'ACC'``, ``'GRAV'``, ``'DISP'``, or ``'CHAN'``
+	:param float sps: sampling rate of the data
+	:param list pre_filt: corner frequencies of the frequency domain taper (defaults to ``[0.1, 0.6, 0.95*sps, sps]``)
+	:param float water_level: water level in dB
+	:param float tolerance: fraction of the inverse filter's energy that may be cut off (see :py:func:`inverse_fir`)
+	:param str sender: the name of the class using the stage, for warnings
+	'''
+	def __init__(self, deconv, sps, pre_filt=None, water_level=4.5,
+				 tolerance=1e-5, sender='dsp'):
+		self.deconv = deconv
+		self.sps = float(sps)
+		self.pre_filt = pre_filt or [0.1, 0.6, 0.95*self.sps, self.sps]
+		self.water_level = water_level
+		self.tolerance = tolerance
+		self.sender = sender
+		# long enough to resolve the low corner of the taper
+		self.nfft = 1 << int(np.ceil(np.log2(8 * self.sps / self.pre_filt[0])))
+
+	def native(self, cha):
+		'''
+		Returns the units the response of a channel is removed to.
+
+		:param str cha: channel name
+		:rtype: str or bool
+		:return: ``'VEL'``, ``'ACC'``, or ``False`` if the channel is not deconvolved
+		'''
+		if not self.deconv:
+			return False
+		if cha in VEL_CHANNELS:
+			return 'VEL'
+		if cha in ACC_CHANNELS:
+			return 'ACC'
+		return False
+
+	def units(self, cha):
+		'''
+		Returns the units of the output of a channel, as set by
+		:py:func:`rsudp.helpers.deconvolve` in ``trace.stats.units``.
+
+		:param str cha: channel name
+		:rtype: str
+		'''
+		native = self.native(cha)
+		if not native:
+			return ' counts'
+		return rs.UNITS[native if (self.deconv == 'CHAN') else self.deconv][0]
+
+	def __call__(self, cha):
+		'''
+		Returns a new deconvolution processor for one channel.
+
+		:param str cha: channel name
+		:rtype: rsudp.dsp.Chain
+		'''
+		native = self.native(cha)
+		if not native:
+			return Chain()
+		response = rs.get_response('%s.%s.00.%s' % (rs.net, rs.stn, cha), sender=self.sender)
+		if response is None:
+			return Chain()
+		spec = inverse_response(response, self.sps, self.nfft, output=native,
+								pre_filt=self.pre_filt, water_level=self.water_level)
+		taps, delay = inverse_fir(spec, self.tolerance)
+		procs = [FirFilter(taps, delay)]
+		target = native if (self.deconv == 'CHAN') else self.deconv
+		if native == 'VEL':
+			if target in ('ACC', 'GRAV'):
+				procs.append(Differentiator(self.sps))
+			elif target == 'DISP':
+				procs.append(Integrator(self.sps, self.pre_filt[0]))
+		else:
+			if target in ('VEL', 'DISP'):
+				procs.append(Integrator(self.sps, self.pre_filt[0]))
+			if target == 'DISP':
+				procs.append(Integrator(self.sps, self.pre_filt[0]))
+		if target == 'GRAV':
+			procs.append(Scale(1. / rs.g))
+		return Chain(procs)
+
+
+class Decimator():
+	'''
+	.. versionadded:: 2.3.0
+
+	Lowers the sampling rate by an integer ``factor`` one chunk at a time,
+	with a linear phase anti-alias FIR filter that passes 80% of the new
+	Nyquist frequency. Only the samples that are kept are computed (each as
+	the dot product of the taps with the input before it), which costs the
+	same as a polyphase filter bank, and the input tail and the position of
+	the next kept sample carry over between calls, so any chunk length gives
+	the same output as decimating the whole series at once.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import Decimator
+		>>> d = Decimator(10)
+		>>> y = d(packet_data)	# about one sample for every ten
+
+	:param int factor: the decimation factor
+	:param int numtaps: filter length (``20 * factor + 1`` by default)
+	:param bool settle: if ``True``, start as if the first sample had been constant forever
+	'''
+	def __init__(self, factor, numtaps=None, settle=True):
+		self.factor = int(factor)
+		if self.factor < 1:
+			raise ValueError('Decimation factor must be at least 1, not %s' % factor)
+		if self.factor == 1:
+			self.taps = np.ones(1)
+		else:
+			self.taps = firwin(numtaps or (20 * self.factor + 1), 0.8 / self.factor, window='hamming')
+		self.delay = (len(self.taps) - 1) // 2	# in input samples
+		self.settle_first = settle
+		self.reset()
+
+	def reset(self):
+		'''
+		Clears the stored input. The next sample is treated as the first.
+		'''
+		self.history = None
+		self.skip = 0		# input samples before the next kept one
+
+	def __call__(self, x):
+		'''
+		Decimates the next chunk of data.
+
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		:return: the kept samples (float64), ``delay`` input samples behind the input
+		'''
+		x = np.asarray(x, dtype=np.float64)
+		if not len(x):
+			return x
+		m = len(self.taps) - 1
+		if self.history is None:
+			self.history = np.full(m, x[0] if self.settle_first else 0.)
+		block = np.concatenate((self.history, x))
+		idx = np.arange(m + self.skip, len(block), self.factor)
+		y = np.lib.stride_tricks.sliding_window_view(block, m + 1)[idx - m] @ self.taps[::-1]
+		self.skip = m + self.skip + len(idx) * self.factor - len(block)
+		self.history = block[len(block)-m:]
+		return y
+
+
+class BlockRms():
+	'''
+	.. versionadded:: 2.3.0
+
+	The root mean square of consecutive blocks of ``n`` samples, one chunk
+	at a time (an RMS envelope at ``1/n`` of the input rate). Samples that
+	do not fill a block yet are kept for the next call.
+
+	:param int n: block length in samples
+	'''
+	def __init__(self, n):
+		self.n = max(1, int(n))
+		self.delay = 0
+		self.reset()
+
+	def reset(self):
+		'''
+		Forgets the samples of an unfinished block.
+		'''
+		self.rest = np.zeros(0)
+
+	def __call__(self, x):
+		'''
+		:param numpy.ndarray x: the new samples
+		:rtype: numpy.ndarray
+		:return: the RMS of each block completed by these samples
+		'''
+		x = np.concatenate((self.rest, np.asarray(x, dtype=np.float64)))
+		k = len(x) - len(x) % self.n
+		self.rest = x[k:]
+		return np.sqrt(np.mean(np.square(x[:k].reshape(-1, self.n)), axis=1))
+
+
+DERIVE_KEYS = ('bandpass', 'decimate', 'envelope')
+
+
+class DerivedStream():
+	'''
+	.. versionadded:: 2.3.0
+
+	Turns the data packets of one channel into the packets of a derived
+	stream, described by a dict with any of these keys, applied in this order:
+
+	- ``"bandpass": [freqmin, freqmax]`` band-limits the data (see :py:class:`SosFilter`)
+	- ``"decimate": factor`` lowers the sampling rate by an integer factor (see :py:class:`Decimator`)
+	- ``"envelope": sps`` gives the RMS of the data over blocks, at about ``sps`` samples per second (see :py:class:`BlockRms`); without ``"bandpass"``, a 0.1 Hz highpass removes the offset first
+
+	Output packets are timed by their first sample, with the delay of the
+	decimation filter taken off so they line up with the input, and their
+	samples are rounded to integers. Because the output rate does not
+	divide into input packets evenly, output packets can hold different
+	numbers of samples (or none, in which case ``None`` is returned).
+	A gap in the input starts the stream over.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import DerivedStream
+		>>> env = DerivedStream({'bandpass': [1, 10], 'envelope': 1}, sps=100)
+		>>> env(packet)		# a packet with one sample every second, or None
+
+	:param dict spec: the derivation
+	:param float sps: sampling rate of the input
+	:raise ValueError: if the derivation has unknown keys or impossible values
+	'''
+	def __init__(self, spec, sps):
+		unknown = set(spec) - set(DERIVE_KEYS)
+		if unknown:
+			raise ValueError('Unknown derived stream setting(s) %s (must be among %s)'
+							 % (sorted(unknown), list(DERIVE_KEYS)))
+		self.spec = spec
+		self.sps = float(sps)
+		self.reset()
+
+	def reset(self):
+		'''
+		Builds the processing chain from the start.
+		'''
+		procs, rate, lag = [], self.sps, 0.
+		if 'bandpass' in self.spec:
+			freqmin, freqmax = self.spec['bandpass']
+			procs.append(SosFilter(sos_design('bandpass', self.sps, freqmin=freqmin, freqmax=freqmax,
+											  sender='DerivedStream'), settle=True))
+		elif 'envelope' in self.spec:
+			procs.append(SosFilter(sos_design('highpass', self.sps, freq=0.1), settle=True))
+		if int(self.spec.get('decimate', 1)) > 1:
+			d = Decimator(self.spec['decimate'])
+			procs.append(d)
+			lag = d.delay / self.sps
+			rate /= d.factor
+		if 'envelope' in self.spec:
+			if float(self.spec['envelope']) <= 0:
+				raise ValueError('Envelope rate must be positive, not %s' % self.spec['envelope'])
+			b = BlockRms(round(rate / float(self.spec['envelope'])))
+			procs.append(b)
+			rate /= b.n
+		self.chain = Chain(procs)
+		self.rate = rate
+		self.lag = lag
+		self.t = None		# time of the next output sample
+		self.next = None	# expected time of the next input packet
+
+	def __call__(self, p):
+		'''
+		:param rsudp.raspberryshake.Packet p: the next data packet of the channel
+		:rtype: rsudp.raspberryshake.Packet or None
+		:return: the derived samples completed by this packet, if any
+		'''
+		if (self.next is not None) and (abs(p.time - self.next) > 0.5 / self.sps):
+			self.reset()
+		self.next = p.time + len(p.data) / self.sps
+		if self.t is None:
+			self.t = p.time - self.lag
+		y = self.chain(p.data)
+		if not len(y):
+			return None
+		data = np.round(y).astype(np.int32)
+		out = rs.Packet(p.cha, self.t, data, codec.to_text(p.cha, self.t, data))
+		self.t += len(y) / self.rate
+		return out
+
+
+class IntervalStats():
+	'''
+	.. versionadded:: 2.3.0
+
+	The mean, median, minimum and maximum of the absolute value of a
+	series over consecutive intervals of ``interval`` seconds, aligned to
+	multiples of ``interval`` since 1970-01-01 00:00:00Z (so a 60 second
+	interval ends on each minute), fed one packet at a time.
+	The samples of the current interval are copied into a preallocated
+	array as they arrive; the statistics are computed, with an exact
+	median, only when the interval is complete, i.e. when a sample at or
+	after its end arrives. The samples of the interval are returned with
+	the statistics, for other measurements (such as spectral amplitudes)
+	over the same interval. Intervals are placed by the times of the samples
+	rather than by the clock of the computer, so a backlog of data gives
+	the same results as live data. The interval that is under way when the
+	first sample arrives is not reported, since it is incomplete.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import IntervalStats
+		>>> stats = IntervalStats(10, sps=100)
+		>>> for end, (mean, median, lo, hi), samples in stats(packet.time, packet.data):
+		...     print(end, mean)
+
+	:param float interval: interval length in seconds
+	:param float sps: sampling rate of the data
+	'''
+	def __init__(self, interval, sps):
+		self.interval = float(interval)
+		self.sps = float(sps)
+		self.buf = np.empty(int(np.ceil(self.interval * self.sps)) + int(self.sps) + 1)
+		self.edge = None	# end of the current interval
+		self.n = 0			# samples in the current interval
+		self.whole = False	# whether the current interval has data from its start
+
+	def _start(self, t):
+		'''
+		Starts the interval that contains time ``t``.
+		'''
+		start = np.floor(t / self.interval + 1e-6) * self.interval
+		self.edge = start + self.interval
+		self.whole = (t - start) < 1. / self.sps
+		self.n = 0
+
+	def _result(self):
+		'''
+		:rtype: list
+		:return: mean, median, minimum and maximum of the current interval
+		'''
+		a = np.abs(self.buf[:self.n])
+		return [float(a.mean()), float(np.median(a)), float(a.min()), float(a.max())]
+
+	def __call__(self, t, x):
+		'''
+		Adds the next packet of samples.
+
+		:param float t: time of the first sample
+		:param numpy.ndarray x: the samples
+		:rtype: list
+		:return: ``(end, [mean, median, min, max], samples)`` for each interval completed by these samples, where ``end`` is the time the interval ends and ``samples`` is a copy of the interval's samples
+		'''
+		x = np.asarray(x, dtype=np.float64)
+		out = []
+		if self.edge is None and len(x):
+			self._start(t)
+		while len(x):
+			# samples before the end of the current interval
+			k = int(min(len(x), max(0, np.ceil((self.edge - t) * self.sps - 1e-3))))
+			if self.n + k > len(self.buf):
+				self.buf = np.resize(self.buf, self.n + k)
+			self.buf[self.n:self.n+k] = x[:k]
+			self.n += k
+			if k == len(x):
+				break
+			if self.whole and self.n:
+				out.append((float(self.edge), self._result(), self.buf[:self.n].copy()))
+			x = x[k:]
+			t = t + k / self.sps
+			if t < self.edge + self.interval:
+				self.edge += self.interval
+				self.whole = True
+				self.n = 0
+			else:
+				# a gap of more than an interval
+				self._start(t)
+		return out
+
+
+class BandAmplitudes():
+	'''
+	.. versionadded:: 2.3.0
+
+	Spectral amplitudes in frequency bands (SSAM) for several channels at
+	once. The intervals of all channels are stacked into one 2-D array and
+	transformed with a single :py:func:`numpy.fft.rfft` along the sample
+	axis, after removing each row's mean and applying a Hann window.
+	The amplitude spectrum is scaled so that a sine wave of amplitude
+	``a`` gives a peak of about ``a``, and the amplitude of a band is the
+	mean over the frequency bins inside it, taken for all bands and
+	channels at once as one matrix product.
+
+	.. code-block:: python
+
+		>>> from rsudp.dsp import BandAmplitudes
+		>>> ssam = BandAmplitudes(100, 1000, [[0.5, 1], [1, 5], [5, 10]])
+		>>> ssam([ehz_samples, ehn_samples, ehe_samples])	# 3 channels x 3 bands
+
+	:param float sps: sampling rate of the data
+	:param int n: samples in an interval (rows that are shorter are padded with their mean, longer ones are cut)
+	:param list bands: ``[freqmin, freqmax]`` pairs in Hz
+	:raise ValueError: if a band has no frequency bin in it
+	'''
+	def __init__(self, sps, n, bands):
+		self.sps = float(sps)
+		self.n = int(n)
+		self.bands = [[float(lo), float(hi)] for lo, hi in bands]
+		self.window = np.hanning(self.n)
+		self.scale = 2. / self.window.sum()
+		freqs = np.fft.rfftfreq(self.n, 1. / self.sps)
+		self.matrix = np.zeros((len(freqs), len(self.bands)))
+		for j, (lo, hi) in enumerate(self.bands):
+			inside = (freqs >= lo) & (freqs < hi)
+			if not inside.any():
+				raise ValueError('Band %s-%s Hz has no frequencies at %s sps over %s samples'
+								 % (lo, hi, self.sps, self.n))
+			self.matrix[inside, j] = 1. / inside.sum()
+
+	def __call__(self, rows):
+		'''
+		:param list rows: the samples of each channel over the same interval
+		:rtype: numpy.ndarray
+		:return: band amplitudes, one row per channel and one column per band
+		'''
+		x = np.empty((len(rows), self.n))
+		for i, r in enumerate(rows):
+			k = min(len(r), self.n)
+			x[i, :k] = r[:k]
+			x[i, k:] = r[:k].mean() if k else 0.
+		x -= x.mean(axis=1, keepdims=True)
+		spec = np.abs(np.fft.rfft(x * self.window, axis=1)) * self.scale
+		return spec @ self.matrix
@@ -1,6 +1,8 @@
+import rsudp
 import rsudp.raspberryshake as rs
 from rsudp import COLOR, printM, printW
-import os
+import os, sys
+import time
 import json
 
 
@@ -133,9 +135,51 @@ def conn_stats(TESTING=False):
 			   sender=s, announce=False)
 
 
-def msg_alarm(event_time):
+def process_stats():
 	'''
-	This function constructs the ``ALARM`` message as a bytes object.
+	.. versionadded:: 2.3.0
+
+	Measures how long this process has been running, how much CPU time it
+	has used, and how much memory it currently has resident. On Linux the
+	process start time and resident set size are read from ``/proc``,
+	so the wall time includes starting the interpreter and importing
+	modules. On other systems the wall time is measured from when rsudp
+	was imported and the memory figure is the peak resident size (or
+	``None`` where it is not available).
+
+	.. code-block:: python
+
+		>>> process_stats()
+		(1.43, 1.21, 61.8)
+
+	:rtype: tuple
+	:return: wall time (s), CPU time (s), resident memory (MB)
+	'''
+	wall, rss = time.time() - rsudp.START_TIME, None
+	cpu = time.process_time()
+	try:
+		with open('/proc/self/stat') as f:
+			# the process name may contain spaces, so split after it
+			started = int(f.read().rsplit(')', 1)[1].split()[19])
+		with open('/proc/uptime') as f:
+			uptime = float(f.read().split()[0])
+		wall = uptime - started / os.sysconf('SC_CLK_TCK')
+		with open('/proc/self/statm') as f:
+			rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1048576
+	except (OSError, ValueError, IndexError, AttributeError):
+		try:
+			import resource
+			maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+			# kilobytes on Linux, bytes on macOS
+			rss = maxrss / (1048576 if sys.platform == 'darwin' else 1024)
+		except ImportError:
+			pass
+	return round(wall, 2), round(cpu, 2), round(rss, 1) if rss else rss
+
+
+def msg_alarm(event_time, **payload):
+	'''
+	This function constructs the ``ALARM`` message.
 	Currently this is only used by :py:class:`rsudp.p_producer.Producer`
 	to construct alarm queue messages.
 
@@ -145,19 +189,26 @@ def msg_alarm(event_time):
 
 		>>> from obspy import UTCDateTime
 		>>> ti = UTCDateTime(2020, 1, 1, 0, 0, 0, 599000, precision=3)
-		>>> msg_alarm(ti)
-		b'ALARM 2020-01-01T00:00:00.599Z'
-
-	:param obspy.core.utcdatetime.UTCDateTime event_time: the datetime object to serialize and convert to bytes
-	:rtype: bytes
+		>>> msg_alarm(ti, cha='EHZ', stalta=2.13)
+		Message(ALARM, 1577836800599000000, cha='EHZ', stalta=2.13)
+		>>> msg_alarm(ti, cha='EHZ', stalta=2.13).to_bytes()
+		b'ALARM 2020-01-01T00:00:00.599Z cha=EHZ stalta=2.13'
+
+	.. versionchanged:: 2.3.0
+		Returns a :py:class:`rsudp.raspberryshake.Message` instead of bytes,
+		and takes optional payload items.
+
+	:param obspy.core.utcdatetime.UTCDateTime event_time: the time of the event
+	:param payload: other details to send with the message, e.g. ``cha='EHZ'``
+	:rtype: rsudp.raspberryshake.Message
 	:return: the ``ALARM`` message, ready to be put on the queue
 	'''
-	return b'ALARM %s' % bytes(str(event_time), 'utf-8')
+	return rs.Message.at(rs.MsgKind.ALARM, event_time, **payload)
 
 
-def msg_reset(reset_time):
+def msg_reset(reset_time, **payload):
 	'''
-	This function constructs the ``RESET`` message as a bytes object.
+	This function constructs the ``RESET`` message.
 	Currently this is only used by :py:class:`rsudp.p_producer.Producer`
 	to construct reset queue messages.
 
@@ -167,19 +218,24 @@ def msg_reset(reset_time):
 
 		>>> from obspy import UTCDateTime
 		>>> ti = UTCDateTime(2020, 1, 1, 0, 0, 0, 599000, precision=3)
-		>>> msg_reset(ti)
+		>>> msg_reset(ti).to_bytes()
 		b'RESET 2020-01-01T00:00:00.599Z'
 
-	:param obspy.core.utcdatetime.UTCDateTime reset_time: the datetime object to serialize and convert to bytes
-	:rtype: bytes
+	.. versionchanged:: 2.3.0
+		Returns a :py:class:`rsudp.raspberryshake.Message` instead of bytes,
+		and takes optional payload items.
+
+	:param obspy.core.utcdatetime.UTCDateTime reset_time: the time of the reset
+	:param payload: other details to send with the message, e.g. ``stalta=3.5``
+	:rtype: rsudp.raspberryshake.Message
 	:return: the ``RESET`` message, ready to be put on the queue
 	'''
-	return b'RESET %s' % bytes(str(reset_time), 'utf-8')
+	return rs.Message.at(rs.MsgKind.RESET, reset_time, **payload)
 
 
 def msg_imgpath(event_time, figname):
 	'''
-	This function constructs the ``IMGPATH`` message as a bytes object.
+	This function constructs the ``IMGPATH`` message.
 	Currently this is only used by :py:class:`rsudp.c_plot.Plot`
 	to construct queue messages containing timestamp and saved image path.
 
@@ -190,31 +246,36 @@ def msg_imgpath(event_time, figname):
 		>>> from obspy import UTCDateTime
 		>>> ti = UTCDateTime(2020, 1, 1, 0, 0, 0, 599000, precision=3)
 		>>> path = '/home/pi/rsudp/screenshots/test.png'
-		>>> msg_imgpath(ti, path)
+		>>> msg_imgpath(ti, path).to_bytes()
 		b'IMGPATH 2020-01-01T00:00:00.599Z /home/pi/rsudp/screenshots/test.png'
 
-	:param obspy.core.utcdatetime.UTCDateTime event_time: the datetime object to serialize and convert to bytes
+	.. versionchanged:: 2.3.0
+		Returns a :py:class:`rsudp.raspberryshake.Message` instead of bytes.
+
+	:param obspy.core.utcdatetime.UTCDateTime event_time: the time of the event
 	:param str figname: the figure path as a string
-	:rtype: bytes
+	:rtype: rsudp.raspberryshake.Message
 	:return: the ``IMGPATH`` message, ready to be put on the queue
 	'''
-	return b'IMGPATH %s %s' % (bytes(str(event_time), 'utf-8'), bytes(str(figname), 'utf-8'))
+	return rs.Message.at(rs.MsgKind.IMGPATH, event_time, path=str(figname))
 
 
 def msg_term():
 	'''
-	This function constructs the simple ``TERM`` message as a bytes object.
+	This function constructs the simple ``TERM`` message.
 
 	.. code-block:: python
 
-		>>> msg_term()
+		>>> msg_term().to_bytes()
 		b'TERM'
 
+	.. versionchanged:: 2.3.0
+		Returns a :py:class:`rsudp.raspberryshake.Message` instead of bytes.
 
-	:rtype: bytes
+	:rtype: rsudp.raspberryshake.Message
 	:return: the ``TERM`` message
 	'''
-	return b'TERM'
+	return rs.Message(rs.MsgKind.TERM)
 
 
 def get_msg_time(msg):
@@ -230,16 +291,17 @@ def get_msg_time(msg):
 		>>> ti = UTCDateTime(2020, 1, 1, 0, 0, 0, 599000, precision=3)
 		>>> path = '/home/pi/rsudp/screenshots/test.png'
 		>>> msg = msg_imgpath(ti, path)
-		>>> msg
-		b'IMGPATH 2020-01-01T00:00:00.599Z /home/pi/rsudp/screenshots/test.png'
 		>>> get_msg_time(msg)
 		UTCDateTime(2020, 1, 1, 0, 0, 0, 599000)
 
-	:param bytes msg: the bytes-formatted queue message to decode
+	:param msg: the queue message
+	:type msg: rsudp.raspberryshake.Message or bytes
 	:rtype: obspy.core.utcdatetime.UTCDateTime
 	:return: the time embedded in the message
 	'''
-	return rs.UTCDateTime.strptime(msg.decode('utf-8').split(' ')[1], '%Y-%m-%dT%H:%M:%S.%fZ')
+	if not isinstance(msg, rs.Message):
+		msg = rs.Message.from_bytes(msg)
+	return msg.time
 
 
 def get_msg_path(msg):
@@ -254,16 +316,17 @@ def get_msg_path(msg):
 		>>> ti = UTCDateTime(2020, 1, 1, 0, 0, 0, 599000, precision=3)
 		>>> path = '/home/pi/rsudp/screenshots/test.png'
 		>>> msg = msg_imgpath(ti, path)
-		>>> msg
-		b'IMGPATH 2020-01-01T00:00:00.599Z /home/pi/rsudp/screenshots/test.png'
 		>>> get_msg_path(msg)
 		'/home/pi/rsudp/screenshots/test.png'
 
-	:param bytes msg: the bytes-formatted queue message to decode
+	:param msg: the queue message
+	:type msg: rsudp.raspberryshake.Message or bytes
 	:rtype: str
 	:return: the path embedded in the message
 	'''
-	return msg.decode('utf-8').split(' ')[2]
+	if not isinstance(msg, rs.Message):
+		msg = rs.Message.from_bytes(msg)
+	return msg.path
 
 
 def deconv_vel_inst(self, trace, output):
@@ -0,0 +1,244 @@
+import time
+import struct
+import numpy as np
+
+
+RECLEN = 512
+'''
+Default length of the miniSEED records :py:class:`RecordWriter` makes, in bytes.
+'''
+
+# Steim2 data words, most differences first: (differences, bits each, nibble, dnib)
+_WORDS = ((7, 4, 3, 2), (6, 5, 3, 1), (5, 6, 3, 0), (4, 8, 1, 0),
+		  (3, 10, 2, 3), (2, 15, 2, 2), (1, 30, 2, 1))
+# a difference d fits in b bits if it is less than 2**(b-1) and at least -2**(b-1)
+_LIMITS = np.array([1 << (w[1] - 1) for w in _WORDS], dtype=np.int64)
+_TAKE = np.array([w[0] for w in _WORDS])
+_BITS = np.array([w[1] for w in _WORDS], dtype=np.int64)
+_NIBBLE = np.array([w[2] for w in _WORDS], dtype=np.int64)
+_DNIB = np.array([w[3] << 30 if w[2] != 1 else 0 for w in _WORDS], dtype=np.int64)
+
+# fixed header, blockette 1000 (Steim2, big-endian, record length), and padding to 64 bytes
+_HEAD = struct.Struct('>6scc5s2s3s2sHHBBBBHHhhBBBBiHHHHBBBB8x')
+
+
+def _rate(sps):
+	'''
+	:return: the sample rate factor and multiplier of the fixed header
+	'''
+	if (sps == int(sps)) and (sps < 32768):
+		return int(sps), 1
+	return int(round(sps * 100)), -100
+
+
+class RecordWriter():
+	'''
+	.. versionadded:: 2.3.0
+
+	A streaming Steim2 miniSEED encoder for one channel. Samples are added
+	as they come (see :py:meth:`add`), differences are packed into Steim2
+	words as soon as the differences that follow can no longer change the
+	choice of word, and a record is returned as soon as its frames are
+	full. Only :py:meth:`flush` makes a partly filled record, so a
+	continuous stream is stored in full records however often samples
+	are added.
+
+	Each word takes as many differences as fit (seven of 4 bits, six of 5,
+	five of 6, four of 8, three of 10, two of 15, or one of 30).
+	Records are big-endian with a 48 byte fixed header, a blockette 1000
+	and data from byte 64, as written by :py:meth:`obspy.core.trace.Trace.write`
+	with ``encoding='STEIM2'``.
+
+	.. code-block:: python
+
+		>>> w = RecordWriter('AM', 'R3BCF', '00', 'EHZ', 100)
+		>>> records = w.add(1582315130.29, data)	# full records so far
+		>>> records += w.flush()					# and the rest
+
+	:param str net: network code
+	:param str stn: station code
+	:param str loc: location code
+	:param str cha: channel code
+	:param float sps: samples per second
+	:param int reclen: record length in bytes, a power of two from 128 to 65536
+	:raise ValueError: if ``reclen`` is not a power of two from 128 to 65536
+	'''
+	def __init__(self, net, stn, loc, cha, sps, reclen=RECLEN):
+		if (reclen < 128) or (reclen > 65536) or (reclen & (reclen - 1)):
+			raise ValueError('the record length must be a power of two from 128 to 65536, not %s' % reclen)
+		self.codes = (stn.encode('ascii').ljust(5), loc.encode('ascii').ljust(2),
+					  cha.encode('ascii').ljust(3), net.encode('ascii').ljust(2))
+		self.sps = float(sps)
+		self.rate = _rate(self.sps)
+		self.reclen = reclen
+		self.frames = (reclen - 64) // 64
+		# where each data word goes: words 3 to 15 of the first frame, then 1 to 15 of the others
+		self.slots = np.array([w for w in range(3, 16)] +
+							  [f * 16 + w for f in range(1, self.frames) for w in range(1, 16)])
+		self.seq = 0			# sequence number of the last record
+		self._new_run()
+
+
+	def _new_run(self):
+		'''
+		Forgets the continuous run of samples, so the next one starts a new record.
+		'''
+		self.t = None				# time of the first sample of the run
+		self.done = 0				# samples of the run in records returned so far
+		self.next = None			# expected time of the next sample added
+		self.last = None			# last sample packed into a word
+		self.samples = np.zeros(0, dtype=np.int64)	# samples not packed yet
+		self._new_record()
+
+
+	def _new_record(self):
+		self.nibbles = []			# nibbles of the words of the current record
+		self.words = []				# words of the current record
+		self.count = 0				# samples in the current record
+		self.first = None			# first sample of the current record
+
+
+	def add(self, t, data):
+		'''
+		Adds samples. If they do not follow on from the samples added
+		before (within half a sample), the record in progress is
+		flushed first, and the new samples start a record of their own.
+		The same is done where two samples differ by more than fits in
+		a Steim2 word (30 bits), since the first sample of a run is
+		stored whole.
+
+		:param float t: time of the first sample in seconds since 1970-01-01 00:00:00Z
+		:param data: the samples
+		:type data: list or numpy.ndarray
+		:rtype: list
+		:return: the records (bytes) filled so far
+		'''
+		out = []
+		data = np.asarray(data, dtype=np.int64)
+		if not len(data):
+			return out
+		if (self.next is not None) and (abs(t - self.next) > 0.5 / self.sps):
+			out += self.flush()
+		# samples that differ too much from the one before them start new runs
+		prev = self.samples[-1] if len(self.samples) else self.last
+		d = np.diff(data, prepend=data[0] if prev is None else prev)
+		jumps = set(np.flatnonzero((d >= _LIMITS[-1]) | (d < -_LIMITS[-1])).tolist())
+		bounds = sorted(jumps | {0}) + [len(data)]
+		for a, b in zip(bounds[:-1], bounds[1:]):
+			if a in jumps:
+				out += self.flush()
+			if self.t is None:
+				self.t = t + a / self.sps
+			self.samples = np.concatenate((self.samples, data[a:b])) if len(self.samples) else data[a:b]
+			out += self._pack(final=False)
+		self.next = t + len(data) / self.sps
+		return out
+
+
+	def flush(self):
+		'''
+		Packs the samples left and returns them in a last record that may
+		not be full, ending the continuous run (at the end of a day
+		file, at a gap, or at shutdown).
+
+		:rtype: list
+		:return: the records (bytes) left, at most one unless samples were waiting to fill several
+		'''
+		out = self._pack(final=True)
+		if self.words:
+			out.append(self._record())
+		self._new_run()
+		return out
+
+
+	def _pack(self, final):
+		'''
+		Packs waiting samples into words, and returns the records that fill up.
+		Unless ``final``, the last six differences wait for the ones after them.
+		'''
+		out = []
+		x = self.samples
+		n = len(x)
+		if not n:
+			return out
+		# the first difference of a run is 0, later ones follow on from the last record
+		d = np.diff(x, prepend=x[0] if self.last is None else self.last)
+		need = np.searchsorted(_LIMITS, np.where(d < 0, ~d, d), side='right')
+		if need.max() >= len(_WORDS):
+			raise ValueError('samples differ by more than fits in a Steim2 word')
+		# the word that would start at each position: the first whose differences all fit
+		kind = np.full(n, len(_WORDS) - 1)
+		most = need
+		for k in range(2, 8):
+			# the most bits needed by the k differences from each position
+			most = np.maximum(most[:-1], need[k-1:])
+			for w in np.flatnonzero(_TAKE == k):
+				fits = np.flatnonzero(most <= w)
+				kind[fits] = np.minimum(kind[fits], w)
+		# the position of each word, following the words from the first position:
+		# word m starts where ``after`` taken m times leads, built up from jumps of powers of two
+		after = np.append(np.minimum(np.arange(n) + _TAKE[kind], n), n)
+		m = np.arange(n)
+		starts = np.zeros(n, dtype=np.intp)
+		jump, b = after, 1
+		while b < n:
+			sel = (m & b) != 0
+			starts[sel] = jump[starts[sel]]
+			jump = jump[jump]
+			b <<= 1
+		stop = n if final else n - 6
+		starts = starts[starts < stop]
+		if not len(starts):
+			return out
+		i = int(after[starts[-1]])
+		kinds = kind[starts]
+		take, bits = _TAKE[kinds], _BITS[kinds]
+		# the differences of each word, the first in the highest bits
+		j = np.arange(7)
+		used = j < take[:,None]
+		shift = np.where(used, (take[:,None] - 1 - j) * bits[:,None], 0)
+		vals = d[np.minimum(starts[:,None] + j, n - 1)] & ((1 << bits) - 1)[:,None]
+		words = ((np.where(used, vals, 0) << shift).sum(axis=1) | _DNIB[kinds]).tolist()
+		nibbles = _NIBBLE[kinds].tolist()
+		ends = (starts + take - 1).tolist()
+		counts = take.tolist()
+		p = 0
+		while p < len(words):
+			if not self.words:
+				self.first = int(x[starts[p]])
+			q = min(len(words), p + len(self.slots) - len(self.words))
+			self.words += words[p:q]
+			self.nibbles += nibbles[p:q]
+			self.count += sum(counts[p:q])
+			self.last = int(x[ends[q-1]])
+			p = q
+			if len(self.words) == len(self.slots):
+				out.append(self._record())
+		self.samples = x[i:]
+		return out
+
+
+	def _record(self):
+		'''
+		Makes a record of the words packed so far, and starts the next one.
+		'''
+		words = np.zeros(self.frames * 16, dtype=np.uint32)
+		nibbles = np.zeros(self.frames * 16, dtype=np.uint32)
+		nibbles[self.slots[:len(self.words)]] = self.nibbles
+		words[self.slots[:len(self.words)]] = self.words
+		words[1] = self.first & 0xffffffff
+		words[2] = self.last & 0xffffffff
+		# each frame's first word holds the nibbles of its 16 words
+		shifts = np.arange(30, -1, -2, dtype=np.uint32)
+		words[::16] = (nibbles.reshape(-1, 16) << shifts).sum(axis=1, dtype=np.uint32)
+
+		t = int(round((self.t + self.done / self.sps) * 10000))
+		tm = time.gmtime(t // 10000)
+		self.seq = self.seq % 999999 + 1
+		head = _HEAD.pack(b'%06d' % self.seq, b'D', b' ', *self.codes,
+						  tm.tm_year, tm.tm_yday, tm.tm_hour, tm.tm_min, tm.tm_sec, 0, t % 10000,
+						  self.count, self.rate[0], self.rate[1], 0, 0, 0, 1, 0, 64, 48,
+						  1000, 0, 11, 1, self.reclen.bit_length() - 1, 0)
+		self.done += self.count
+		self._new_record()
+		return head + words.astype('>u4').tobytes()
@@ -1,4 +1,5 @@
 import sys
+import socket as s
 from threading import Thread
 from rsudp import printM, printW, printE, helpers
 import rsudp.raspberryshake as RS
@@ -9,6 +10,10 @@ class Producer(Thread):
 	'''
 	Data Producer thread (see :ref:`producer-consumer`) which receives data from the port
 	and puts it on the queue to be passed to the master consumer (:py:class:`rsudp.c_consumer.Consumer`).
+	Each pass of the main loop blocks for one datagram, then drains any others
+	that are already waiting in the kernel's receive buffer (up to
+	:py:data:`max_batch`) and puts them on the queue together as a list,
+	so a backlog built up while the computer was busy is absorbed in bulk.
 	The producer also looks for flags in each consumer
 	that indicate whether they are ``alive==False``. If so, the Producer will
 	quit gracefully and put a TERM message on the queue, which should stop all running
@@ -16,9 +21,10 @@ class Producer(Thread):
 
 	:param queue.Queue queue: The master queue, used to pass data to :py:class:`rsudp.c_consumer.Consumer`
 	:param list threads: The list of :py:class:`threading.Thread` s to monitor for status changes
+	:param rsudp.shm.PacketRing ring: shared memory ring to also write data packets to, for consumers running in other processes (see :py:class:`rsudp.shm.ProcessConsumer`)
 	'''
 
-	def __init__(self, queue, threads, testing=False):
+	def __init__(self, queue, threads, testing=False, ring=None):
 		"""
 		Initializing Producer thread. 
 		
@@ -30,30 +36,129 @@ class Producer(Thread):
 		self.threads = threads
 		self.stop = False
 		self.testing = testing
+		self.ring = ring
 
 		self.firstaddr = ''
 		self.blocked = []
+		self.unconfirmed = []		# batches held until the saved station profile is confirmed
+
+		self.max_batch = 256		# most datagrams to take off the socket at once
+		self.largest_batch = 0
+		# non-blocking reads are not available on every platform (e.g. Windows)
+		self.dontwait = getattr(s, 'MSG_DONTWAIT', 0)
 
 		printM('Starting.', self.sender)
 
 
 	def _filter_sender(self, data, addr):
 		'''
-		Filter the message sender and put data on the consumer queue.
+		Filter the message sender.
+
+		:rtype: bool
+		:return: ``True`` if the datagram comes from the first address data was received from, otherwise ``False``
 		'''
 		if self.firstaddr == '':
 			self.firstaddr = addr[0]
 			printM('Receiving UDP data from %s' % (self.firstaddr), self.sender)
 		if (self.firstaddr != '') and (addr[0] == self.firstaddr):
-			self.queue.put(data)
-			if data.decode('utf-8') == 'TERM':
+			if data == b'TERM':
 				RS.producer = False
 				self.stop = True
+			return True
 		else:
 			if addr[0] not in self.blocked:
 				printM('Another IP (%s) is sending UDP data to this port. Ignoring...'
 						% (addr[0]), self.sender)
 				self.blocked.append(addr[0])
+			return False
+
+
+	def _recv_batch(self):
+		'''
+		Waits for a datagram, then reads every other datagram already
+		waiting on the socket without blocking (up to :py:data:`max_batch`).
+
+		:rtype: list
+		:return: list of ``(data, addr)`` tuples
+		'''
+		batch = [RS.sock.recvfrom(4096)]
+		if self.dontwait:
+			try:
+				while len(batch) < self.max_batch:
+					batch.append(RS.sock.recvfrom(4096, self.dontwait))
+			except (BlockingIOError, InterruptedError):
+				pass
+		if len(batch) > max(self.largest_batch, 2 * RS.numchns):
+			printM('Absorbed a backlog of %s datagrams in one read' % len(batch), self.sender)
+		self.largest_batch = max(self.largest_batch, len(batch))
+		return batch
+
+
+	def _put_batch(self, batch):
+		'''
+		Filters the senders of a batch of datagrams, parses the data packets
+		(see :py:func:`rsudp.raspberryshake.parse_packets`), and puts the
+		result on the consumer queue as one list. If there is a shared memory
+		ring, the packets are written to it first. While a saved station
+		profile is being checked, batches are held back until it is confirmed,
+		so that consumers never get data that does not match their settings.
+
+		:param list batch: list of ``(data, addr)`` tuples
+		'''
+		data = [d for d, addr in batch if self._filter_sender(d, addr)]
+		if data:
+			# parse once here so that consumers don't have to
+			packets = RS.parse_packets(data)
+			if RS.profile_check:
+				self.unconfirmed.append((batch, packets))
+				if not self._check_profile(packets):
+					return
+				packets = [p for b, ps in self.unconfirmed for p in ps]
+				self.unconfirmed = []
+			if self.ring:
+				self.ring.write_many(packets)
+			self.queue.put(packets)
+
+
+	def _check_profile(self, packets):
+		'''
+		Feeds data packets to the check of the saved station profile
+		(see :py:class:`rsudp.raspberryshake.ProfileCheck`) until it is done.
+		If the data does not match the profile, the datagrams held back are
+		returned to :py:data:`rsudp.raspberryshake.held` and the Producer
+		stops with :py:data:`rsudp.raspberryshake.reconfigure` set, so that
+		the client discards the profile and discovers the data stream again
+		(see :py:func:`rsudp.raspberryshake.rediscover`), and the consumers
+		it starts then get them.
+
+		:param list packets: parsed data packets
+		:rtype: bool
+		:return: ``True`` once the data is found to match the profile
+		'''
+		for p in packets:
+			if isinstance(p, RS.Packet) and RS.profile_check.feed(p):
+				check = RS.profile_check
+				RS.profile_check = None
+				profile = dict(check.profile, firstaddr=self.firstaddr)
+				if check.matches():
+					printM('Data stream matches the saved station profile.', self.sender)
+					if self.firstaddr != check.profile['firstaddr']:
+						RS.firstaddr = self.firstaddr
+						RS.save_profile(profile, sender=self.sender)
+				else:
+					profile.update(check.found)
+					printW('Data stream does not match the saved station profile '
+						   '(saved: %s channels %s at %s sps, found: %s channels %s at %s sps).'
+						   % (len(check.profile['chns']), check.profile['chns'], check.profile['sps'],
+							  len(profile['chns']), profile['chns'], profile['sps']), self.sender)
+					printW('Stopping to discover the data stream again...', self.sender, spaces=True)
+					RS.held[:0] = [d for b, ps in self.unconfirmed for d in b]
+					self.unconfirmed = []
+					RS.reconfigure = True
+					self.stop = True
+					return False
+				return True
+		return False
 
 
 	def _tasks(self):
@@ -64,14 +169,14 @@ class Producer(Thread):
 			# for each thread here
 			if thread.alarm:
 				# if there is an alarm in a sub thread, send the ALARM message to the queues
-				self.queue.put(helpers.msg_alarm(thread.alarm))
+				self.queue.put(helpers.msg_alarm(thread.alarm, **thread.alarm_info))
 				printM('%s thread has indicated alarm state, sending ALARM message to queues'
 						% thread.sender, sender=self.sender)
 				# now re-arm the trigger
 				thread.alarm = False
 			if thread.alarm_reset:
 				# if there's an alarm_reset flag in a sub thread, send a RESET message
-				self.queue.put(helpers.msg_reset(thread.alarm_reset))
+				self.queue.put(helpers.msg_reset(thread.alarm_reset, **thread.alarm_info))
 				printM('%s thread has indicated alarm reset, sending RESET message to queues'
 						% thread.sender, sender=self.sender)
 				# re-arm the trigger
@@ -88,9 +193,10 @@ class Producer(Thread):
 		plotting, alert triggers, and ground motion calculation.
 		"""
 		RS.producer = True
+		# pass on the data read while discovering the data stream
+		self._put_batch(RS.take_held())
 		while RS.producer:
-			data, addr = RS.sock.recvfrom(4096)
-			self._filter_sender(data, addr)
+			self._put_batch(self._recv_batch())
 			self._tasks()
 			if self.stop:
 				RS.producer = False
@@ -2,34 +2,71 @@ import numpy as np
 import os, platform
 import socket as s
 import signal
-from obspy import UTCDateTime
-from obspy.core.stream import Stream
-from obspy import read_inventory, read
-from obspy.geodetics.flinnengdahl import FlinnEngdahl
-from obspy.core.trace import Trace
-from rsudp import printM, printW, printE
-from requests.exceptions import HTTPError
+import importlib
+import time
+import json
+import calendar
+import ipaddress
+import re
+from datetime import datetime
+from enum import IntEnum
+from io import BytesIO
+import rsudp
+from rsudp import printM, printW, printE, codec
 from threading import Thread
 from . import __version__
 
+# ObsPy is imported the first time one of these is used (see __getattr__)
+OBSPY_NAMES = {'UTCDateTime': 'obspy',
+			   'Stream': 'obspy.core.stream',
+			   'Trace': 'obspy.core.trace',
+			   'read_inventory': 'obspy',
+			   'read': 'obspy',
+			   'FlinnEngdahl': 'obspy.geodetics.flinnengdahl'}
+
+
+def __getattr__(name):
+	'''
+	.. versionadded:: 2.3.0
+
+	Provides the ObsPy classes and functions that consumers use through this
+	module (for example ``rs.UTCDateTime`` or ``rs.Stream``),
+	importing ObsPy the first time one of them is asked for rather than
+	when this module is imported.
+	'''
+	if name in OBSPY_NAMES:
+		value = getattr(importlib.import_module(OBSPY_NAMES[name]), name)
+		globals()[name] = value
+		return value
+	raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
 initd, sockopen = False, False
 qsize = 2048 			# max queue size
 port = 8888				# default listening port
 to = 10					# socket test timeout
 firstaddr = ''			# the first address data is received from
 inv = False				# station inventory
+INVENTORY_URL = 'https://data.raspberryshake.org/fdsnws/station/1/query?network=%s&station=%s&level=resp&nodata=404&format=xml'
 INVWARN = False			# warning when inventory attachment fails
 region = False
 producer = False 		# flag for producer status
 stn = 'Z0000'			# station name
 net = 'AM'				# network (this will always be AM)
 chns = []				# list of channels
+CHANNEL_ORDER = ['EHZ', 'EHN', 'EHE', 'ENZ', 'ENN', 'ENE', 'HDF']	# order channels are listed in
 numchns = 0
 
 tf = None				# transmission frequency in ms
 tr = None				# transmission rate in packets per second
 sps = None				# samples per second
 
+holding = False			# whether getDATA keeps the datagrams it reads
+held = []				# datagrams read while discovering the data stream, for the Producer to pass on
+unpacked = []			# text data packets from a binary datagram that getDATA has not returned yet
+profile_check = None	# checks a saved station profile against incoming data (see ProfileCheck)
+reconfigure = False		# set when the data stream does not match the saved station profile (see rediscover)
+
 # conversion units
 # 		'name',	: ['pretty name', 'unit display']
 UNITS = {'ACC'	: ['Acceleration', 'm/s$^2$'],
@@ -75,24 +112,19 @@ def get_ip():
 		testsock.close()
 	return IP
 
-ip = get_ip()
-
-# construct a socket
-socket_type =  s.SOCK_DGRAM
-sock = s.socket(s.AF_INET, socket_type)
-if platform.system() not in 'Windows':
-    sock.setsockopt(s.SOL_SOCKET, s.SO_REUSEADDR, 1)
+sock = None				# the data socket, created by openSOCK()
 
-def handler(signum, frame, ip=ip):
+def handler(signum, frame, ip=None):
 	'''
 	The signal handler for the nodata alarm.
 
 	:param int signum: signal number
 	:param int frame: frame number
-	:param str ip: the IP of the box this program is running on (i.e. the device the Raspberry Shake should send data to)
+	:param str ip: the IP of the box this program is running on (i.e. the device the Raspberry Shake should send data to; defaults to :py:func:`get_ip`)
 	:raise IOError: on UNIX systems if no data is received
 	'''
 	global port
+	ip = ip or get_ip()
 	printE('No data received in %s seconds; aborting.' % (to), sender='Init')
 	printE('Check that the Shake is forwarding data to:', sender='Init', announce=False, spaces=True)
 	printE('IP address: %s    Port: %s' % (ip, port), sender='Init', announce=False, spaces=True)
@@ -170,11 +202,14 @@ def initRSlib(dport=port, rsstn='Z0000', timeout=10, settings=None):
 		printE('Details - %s' % e)
 
 	initd = True				# if initialization goes correctly, set initd to true
-	openSOCK()					# open a socket
+	rcvbuf = settings.get('settings', {}).get('rcvbuf', 0)
+	group = settings.get('settings', {}).get('multicast_group', '')
+	interface = settings.get('settings', {}).get('multicast_interface', '')
+	openSOCK(rcvbuf=rcvbuf, group=group, interface=interface)		# open a socket
 	printM('Waiting for UDP data on port %s...' % (port), sender)
 	set_params(settings=settings)				# get data and set parameters
 
-def openSOCK(host=''):
+def openSOCK(host='', rcvbuf=0, group='', interface=''):
 	'''
 	.. role:: pycode(code)
 		:language: python
@@ -183,16 +218,29 @@ def openSOCK(host=''):
 	Called by :py:func:`rsudp.raspberryshake.initRSlib`, must be done before :py:func:`rsudp.raspberryshake.set_params`.
 
 	:param str host: self-referential location at which to open a listening port (defaults to :pycode:`''` which resolves to :pycode:`'localhost'`)
+	:param int rcvbuf: requested size of the socket receive buffer in bytes (:pycode:`0` keeps the system default)
+	:param str group: IP multicast group to join, so that data sent to the group on this port is received as well (:pycode:`''` joins none, see :py:func:`join_multicast`)
+	:param str interface: IP address of the network interface to join the group on (:pycode:`''` lets the system choose)
 	:raise IOError: if the library is not initialized (:py:func:`rsudp.raspberryshake.initRSlib`) prior to running this function
-	:raise OSError: if the program cannot bind to the specified port number
+	:raise OSError: if the program cannot bind to the specified port number, or cannot join the multicast group
 
 	'''
-	global sockopen
+	global sockopen, sock
 	sockopen = False
 	if initd:
+		sock = s.socket(s.AF_INET, s.SOCK_DGRAM)
+		if platform.system() not in 'Windows':
+			sock.setsockopt(s.SOL_SOCKET, s.SO_REUSEADDR, 1)
 		HP = '%s:%s' % ('localhost',port)
 		printM("Opening socket on %s (HOST:PORT)"
 				% HP, 'openSOCK')
+		if rcvbuf:
+			try:
+				sock.setsockopt(s.SOL_SOCKET, s.SO_RCVBUF, int(rcvbuf))
+			except Exception as e:
+				printW('Could not set socket receive buffer size: %s' % e, 'openSOCK')
+			printM('Socket receive buffer is %s bytes (requested %s)'
+					% (sock.getsockopt(s.SOL_SOCKET, s.SO_RCVBUF), rcvbuf), 'openSOCK')
 		try:
 			sock.bind((host, port))
 			sockopen = True
@@ -200,9 +248,53 @@ def openSOCK(host=''):
 			printE('Could not bind to port %s. Is another program using it?' % port)
 			printE('Detail: %s' % e, announce=False)
 			raise OSError(e)
+		if group:
+			try:
+				join_multicast(sock, group, interface)
+			except (OSError, ValueError) as e:
+				printE('Could not join multicast group %s: %s' % (group, e), 'openSOCK')
+				raise OSError(e)
+			printM('Joined multicast group %s on %s' % (group, interface or 'the default interface'), 'openSOCK')
 	else:
 		raise IOError("Before opening a socket, you must initialize this raspberryshake library by calling initRSlib(dport=XXXXX, rssta='R0E05') first.")
 
+def is_multicast(addr):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param str addr: an IP address (a host name is never a multicast address)
+	:rtype: bool
+	:return: whether ``addr`` is an IPv4 multicast group address (224.0.0.0 to 239.255.255.255)
+	'''
+	try:
+		return ipaddress.IPv4Address(addr).is_multicast
+	except ValueError:
+		return False
+
+
+def join_multicast(sock, group, interface=''):
+	'''
+	.. versionadded:: 2.3.0
+
+	Joins an IP multicast group on a bound UDP socket, so that it also
+	receives the datagrams sent to the group on its port (for example by a
+	:py:class:`rsudp.c_forward.Forward` sending to the group).
+	Any number of programs on the network can join the same group and get
+	the same stream from one transmission.
+	To try it on one computer, use ``'127.0.0.1'`` as the interface on both ends.
+
+	:param socket.socket sock: the socket
+	:param str group: multicast group address, e.g. ``'239.1.1.1'``
+	:param str interface: IP address of the network interface to join on (``''`` lets the system choose)
+	:raise ValueError: if ``group`` is not a multicast address
+	:raise OSError: if the group can not be joined
+	'''
+	if not is_multicast(group):
+		raise ValueError('%s is not a multicast address' % group)
+	mreq = s.inet_aton(group) + s.inet_aton(interface or '0.0.0.0')
+	sock.setsockopt(s.IPPROTO_IP, s.IP_ADD_MEMBERSHIP, mreq)
+
+
 def set_params(settings=None):
 	'''
 	.. role:: pycode(code)
@@ -214,25 +306,289 @@ def set_params(settings=None):
 	but before :py:func:`rsudp.raspberryshake.getDATA`.
 	Will wait :pycode:`rsudp.raspberryshake.to` seconds for data before raising a no data exception
 	(only available with UNIX socket types).
+
+	If a station profile was saved by an earlier run for the same station and port
+	(see :py:func:`save_profile`), it is used instead and nothing is read from the port,
+	so startup does not have to wait for data. The profile is then checked against
+	the incoming data by the Producer (see :py:class:`ProfileCheck`), and
+	if they do not match, the client calls :py:func:`rediscover`.
+	Otherwise the data stream is discovered from the port, and the datagrams read
+	while doing so are kept in :py:data:`held` to be passed on by the Producer,
+	so that none of them are lost.
+
 	:param dict settings: Dict of settings parameters
 
 	'''
-	global to, firstaddr
+	global to, firstaddr, holding, numchns, profile_check, unpacked
 	if settings is None:
 		settings = {}
+	profile = load_profile()
+	if profile:
+		set_profile(profile)
+		profile_check = ProfileCheck(profile)
+		printM('Using saved station profile, available channels: %s' % chns, 'Init')
+		get_inventory(settings=settings)
+		return
 	if os.name not in 'nt': 	# signal alarm not available on windows
 		signal.signal(signal.SIGALRM, handler)
 		signal.alarm(to)		# alarm time set with timeout value
-	data, (firstaddr, connport) = sock.recvfrom(2048)
+	data, (firstaddr, connport) = sock.recvfrom(4096)
+	held.append((data, (firstaddr, connport)))
+	data = unpack(data)
 	if os.name not in 'nt':
 		signal.alarm(0)			# once data has been received, turn alarm completely off
 	to = 0						# otherwise it erroneously triggers after keyboardinterrupt
-	getTR(getCHNS()[0])
+	holding = True
+	try:
+		getTR(getCHNS()[0])
+	finally:
+		holding = False
 	getSR(tf, data)
-	getTTLCHN()
+	unpacked = []
+	numchns = len(chns)
 	printM('Available channels: %s' % chns, 'Init')
+	save_profile()
 	get_inventory(settings=settings)
 
+
+def get_profile():
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns the parameters of the data stream found by :py:func:`set_params`.
+
+	:rtype: dict
+	:return: the station profile: station name, port, sender address, channels, transmission frequency and rate, and sampling rate
+	'''
+	return {'station': stn, 'port': port, 'firstaddr': firstaddr, 'chns': chns,
+			'tf': tf, 'tr': tr, 'sps': sps}
+
+
+def set_profile(profile):
+	'''
+	.. versionadded:: 2.3.0
+
+	Sets the parameters of the data stream from a station profile
+	(see :py:func:`get_profile`).
+
+	:param dict profile: the station profile
+	'''
+	global firstaddr, chns, numchns, tf, tr, sps
+	firstaddr = profile['firstaddr']
+	chns = list(profile['chns'])
+	numchns = len(chns)
+	tf = profile['tf']
+	tr = profile['tr']
+	sps = profile['sps']
+
+
+def profile_path():
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns the location of the saved station profile, ``<output_dir>/station_profile.json``.
+
+	:rtype: str or bool
+	:return: the path, or ``False`` if the output directory has not been initialized (see :py:func:`rsudp.init_dirs`)
+	'''
+	if not rsudp.output_dir:
+		return False
+	return os.path.join(rsudp.output_dir, 'station_profile.json')
+
+
+def save_profile(profile=None, sender='Init'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Saves a station profile (by default the current one, see :py:func:`get_profile`)
+	so that the next start can skip discovering the data stream.
+	A profile without channels, transmission rate or sampling rate
+	(see :py:func:`is_profile`) is not saved.
+
+	:param dict profile: the station profile
+	:param str sender: the name of the function calling this one
+	'''
+	path = profile_path()
+	if not path:
+		return
+	profile = profile or get_profile()
+	if not is_profile(profile):
+		printW('Not saving a station profile with channels %s, %s packets per second and %s sps'
+			   % (profile.get('chns'), profile.get('tr'), profile.get('sps')), sender)
+		return
+	tmp = '%s.%s.tmp' % (path, os.getpid())
+	try:
+		with open(tmp, 'w') as f:
+			json.dump(profile, f, indent=2)
+		os.replace(tmp, path)
+	except Exception as e:
+		printW('Could not save station profile to %s: %s' % (path, e), sender)
+
+
+def load_profile(sender='Init'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Loads the saved station profile, if there is one for the current
+	station and port. A profile that can not be read or that
+	:py:func:`is_profile` rejects is discarded.
+
+	:param str sender: the name of the function calling this one
+	:rtype: dict or None
+	:return: the station profile, or ``None``
+	'''
+	path = profile_path()
+	if not (path and os.path.exists(path)):
+		return None
+	try:
+		with open(path, 'r') as f:
+			profile = json.load(f)
+		if (profile['station'] != stn) or (profile['port'] != port):
+			return None
+		if is_profile(profile):
+			return profile
+		printW('The station profile %s has no channels, transmission rate or sampling rate' % (path), sender)
+	except Exception as e:
+		printW('Could not read station profile %s: %s' % (path, e), sender)
+	discard_profile(sender=sender)
+	return None
+
+
+def is_profile(profile):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param dict profile: a station profile (see :py:func:`get_profile`)
+	:rtype: bool
+	:return: whether the profile has channels and a transmission rate and sampling rate above zero
+	'''
+	try:
+		return bool(profile['chns']) and (profile['tf'] > 0) and (profile['tr'] > 0) and (profile['sps'] > 0)
+	except (KeyError, TypeError):
+		return False
+
+
+def discard_profile(sender='Init'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Deletes the saved station profile, so that the data stream is discovered again.
+
+	:param str sender: the name of the function calling this one
+	'''
+	path = profile_path()
+	if path and os.path.exists(path):
+		try:
+			os.remove(path)
+			printM('Discarded the station profile %s' % (path), sender)
+		except OSError as e:
+			printW('Could not delete station profile %s: %s' % (path, e), sender)
+
+
+def rediscover(settings=None):
+	'''
+	.. versionadded:: 2.3.0
+
+	Discards the saved station profile and discovers the data stream
+	again from the port (see :py:func:`set_params`), after the data has
+	turned out not to match the profile. The client calls this once its
+	consumers have stopped, then starts new ones for the data stream as
+	it is now, without restarting the program. Datagrams read meanwhile
+	are held for the next Producer, as at startup.
+
+	:param dict settings: Dict of settings parameters
+	'''
+	global reconfigure, profile_check
+	if settings is None:
+		settings = {}
+	discard_profile()
+	reconfigure = False
+	profile_check = None
+	if sock.fileno() == -1:
+		# the asyncio engine closes the socket when it stops
+		opts = settings.get('settings', {})
+		openSOCK(rcvbuf=opts.get('rcvbuf', 0), group=opts.get('multicast_group', ''),
+				 interface=opts.get('multicast_interface', ''))
+	else:
+		sock.setblocking(True)
+	printM('Waiting for UDP data on port %s...' % (port), 'Init')
+	set_params(settings=settings)
+
+
+def take_held():
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns the datagrams read while discovering the data stream
+	(see :py:func:`set_params`) and forgets them.
+
+	:rtype: list
+	:return: list of ``(data, addr)`` tuples
+	'''
+	global held
+	h, held = held, []
+	return h
+
+
+class ProfileCheck():
+	'''
+	.. versionadded:: 2.3.0
+
+	Checks a saved station profile against the data that is actually arriving.
+	The Producer feeds it every data packet until it has seen each channel
+	at least twice, the way :py:func:`getCHNS` and :py:func:`getTR` do when
+	discovering the data stream. It then compares the channels, transmission
+	frequency and sampling rate it found with those in the profile.
+
+	:param dict profile: the station profile (see :py:func:`get_profile`)
+	'''
+	def __init__(self, profile):
+		self.profile = profile
+		self.first = {}		# time of the first packet of each channel
+		self.tf = {}		# time between the first two packets of each channel, in ms
+		self.nsamp = {}		# samples per packet of each channel
+		self.done = False
+		self.found = None
+
+	def feed(self, p):
+		'''
+		Takes note of a data packet.
+
+		:param rsudp.raspberryshake.Packet p: the packet
+		:rtype: bool
+		:return: ``True`` once enough packets have been seen to compare
+		'''
+		if self.done:
+			return True
+		if p.cha not in self.first:
+			self.first[p.cha] = p.time
+			self.nsamp[p.cha] = len(p)
+		elif p.cha not in self.tf:
+			self.tf[p.cha] = (p.time - self.first[p.cha]) * 1000
+		# every channel comes once per transmission, so by the time each
+		# channel seen so far has come twice, all of them have been seen
+		self.done = (len(self.tf) == len(self.first)) and (len(self.first) > 0) and \
+					(max(self.tf.values()) > 0)
+		if self.done:
+			cha = sorted(self.tf)[0]
+			t = self.tf[cha]
+			self.found = {'chns': [c for c in CHANNEL_ORDER if c in self.first] +
+								  sorted(c for c in self.first if c not in CHANNEL_ORDER),
+						  'tf': int(t), 'tr': int(1000 / t),
+						  'sps': int(self.nsamp[cha] * 1000 / t)}
+		return self.done
+
+	def matches(self):
+		'''
+		Whether the data matches the profile. Small differences in the measured
+		transmission frequency (timing jitter) are allowed.
+
+		:rtype: bool
+		'''
+		p, f = self.profile, self.found
+		return (f['chns'] == p['chns']) and (abs(f['tf'] - p['tf']) <= 0.05 * p['tf']) and \
+			   (abs(f['sps'] - p['sps']) <= 0.05 * p['sps'])
+
 def getDATA():
 	'''
 	Read a data packet off the port.
@@ -250,6 +606,10 @@ def getDATA():
 		20027, 20207, 18481, 15916, 13836, 13073, 14462, 17628, 19388}"
 
 
+	A binary datagram from another rsudp (see :py:mod:`rsudp.codec`) is
+	unpacked, and the data packets in it are returned one at a time in the
+	text format.
+
 	:rtype: bytes
 	:return: Returns a data packet as an encoded bytes object.
 
@@ -259,7 +619,12 @@ def getDATA():
 	'''
 	global to, firstaddr
 	if sockopen:
-		return sock.recv(4096)
+		if unpacked:
+			return unpacked.pop(0)
+		data, addr = sock.recvfrom(4096)
+		if holding:
+			held.append((data, addr))
+		return unpack(data)
 	else:
 		if initd:
 			raise IOError("No socket is open. Please open a socket using this library's openSOCK() function.")
@@ -282,10 +647,12 @@ def getCHN(DP):
 		'EHZ'
 
 	:param DP: The Raspberry Shake UDP data packet (:py:func:`rsudp.raspberryshake.getDATA`) to parse channel information from
-	:type DP: bytes
+	:type DP: bytes or rsudp.raspberryshake.Packet
 	:rtype: str
 	:return: Returns the instrument channel as a string.
 	'''
+	if isinstance(DP, Packet):
+		return DP.cha
 	return str(DP.decode('utf-8').split(",")[0][1:]).strip("\'")
 	
 def getTIME(DP):
@@ -310,10 +677,12 @@ def getTIME(DP):
 		UTCDateTime(2020, 2, 21, 19, 58, 50, 292000)
 
 	:param DP: The Raspberry Shake UDP data packet (:py:func:`rsudp.raspberryshake.getDATA`) to parse time information from
-	:type DP: bytes
+	:type DP: bytes or rsudp.raspberryshake.Packet
 	:rtype: float
 	:return: Timestamp in decimal seconds since 1970-01-01 00:00:00Z
 	'''
+	if isinstance(DP, Packet):
+		return DP.time
 	return float(DP.split(b",")[1])
 
 def getSTREAM(DP):
@@ -335,12 +704,303 @@ def getSTREAM(DP):
 		 18481, 15916, 13836, 13073, 14462, 17628, 19388]
 
 	:param DP: The Raspberry Shake UDP data packet (:py:func:`rsudp.raspberryshake.getDATA`) to parse stream information from
-	:type DP: bytes
-	:rtype: list
-	:return: List of data samples in the packet
+	:type DP: bytes or rsudp.raspberryshake.Packet
+	:rtype: list or numpy.ndarray
+	:return: List of data samples in the packet (a :py:class:`numpy.ndarray` if ``DP`` is a :py:class:`rsudp.raspberryshake.Packet`)
 	'''
+	if isinstance(DP, Packet):
+		return DP.data
 	return list(map(int, DP.decode('utf-8').replace('}','').split(',')[2:]))
 
+class Packet():
+	'''
+	.. versionadded:: 2.3.0
+
+	A data packet parsed once by the :py:class:`rsudp.p_producer.Producer`
+	and shared (read-only) by every consumer.
+	Consumers can tell data from messages with
+	``isinstance(d, rs.Packet)`` instead of searching the bytes.
+
+	.. code-block:: python
+
+		>>> import rsudp.raspberryshake as rs
+		>>> rs.initRSlib(dport=8888, rsstn='R3BCF')
+		>>> p = rs.parse_packet(rs.getDATA())
+		>>> p.cha, p.time, p.data[:3]
+		('EHZ', 1582315130.292, array([14168, 14927, 16112], dtype=int32))
+
+	:param str cha: channel name
+	:param float time: time of the first sample in seconds since 1970-01-01 00:00:00Z
+	:param numpy.ndarray data: the samples in the packet as :py:class:`numpy.int32`
+	:param bytes raw: the packet as it was received, for consumers that pass it on
+	'''
+	__slots__ = ('cha', 'time', 'data', 'raw')
+
+	def __init__(self, cha, time, data, raw=b''):
+		self.cha = cha
+		self.time = time
+		self.data = data
+		self.raw = raw
+
+	def __len__(self):
+		return len(self.data)
+
+	def __repr__(self):
+		return 'Packet(%r, %r, %s samples)' % (self.cha, self.time, len(self.data))
+
+
+class MsgKind(IntEnum):
+	'''
+	.. versionadded:: 2.3.0
+
+	The kinds of :py:class:`rsudp.raspberryshake.Message`.
+	``TEXT`` is any other message, kept as it was received.
+	'''
+	TEXT = 0
+	ALARM = 1
+	RESET = 2
+	IMGPATH = 3
+	TERM = 4
+
+
+class Message():
+	'''
+	.. versionadded:: 2.3.0
+
+	A control message (``ALARM``, ``RESET``, ``IMGPATH`` or ``TERM``)
+	passed to consumers alongside :py:class:`rsudp.raspberryshake.Packet` objects.
+	Consumers tell messages apart by their :py:class:`MsgKind`
+	(``d.kind == rs.MsgKind.ALARM``) rather than by searching text, and
+	read the time (:py:attr:`ns`, :py:attr:`time`) and any other details
+	(:py:attr:`payload`, e.g. channel, STA/LTA ratio or image path)
+	without parsing it.
+
+	:py:meth:`to_bytes` gives the text form that rsudp has always sent,
+	followed by any other payload items as ``key=value`` words,
+	and :py:meth:`from_bytes` reads it back. The image path of an
+	``IMGPATH`` message (``payload['path']``), and any text after ``TERM``
+	(``payload['text']``, e.g. ``TERM SELF``), come before those words and
+	may contain spaces. ``str(message)`` is the same text, so code that
+	looks for ``'ALARM' in str(d)`` still works.
+
+	.. code-block:: python
+
+		>>> import rsudp.raspberryshake as rs
+		>>> m = rs.Message(rs.MsgKind.ALARM, 1577836800599000000, cha='EHZ', stalta=1.93)
+		>>> m.to_bytes()
+		b'ALARM 2020-01-01T00:00:00.599Z cha=EHZ stalta=1.93'
+		>>> rs.Message.from_bytes(m.to_bytes()).payload
+		{'cha': 'EHZ', 'stalta': 1.93}
+
+	:py:attr:`sent` is the :py:func:`time.monotonic_ns` time at which the
+	message was published as urgent (see :py:meth:`rsudp.bus.Bus.publish_urgent`),
+	used to measure how long delivery takes. It is not part of the bytes form.
+
+	:param MsgKind kind: the kind of message
+	:param int ns: the time the message refers to, in nanoseconds since 1970-01-01 00:00:00Z
+	:param payload: other details, e.g. ``cha='EHZ'``, ``stalta=1.93`` or ``path='/home/pi/event.png'``
+	'''
+	__slots__ = ('kind', 'ns', 'payload', 'sent')
+	FREE = {MsgKind.IMGPATH: 'path', MsgKind.TERM: 'text'}	# payload item written as free text, by kind
+	KEYVAL = re.compile(r'^\w+=')
+
+	def __init__(self, kind, ns=0, **payload):
+		self.kind = MsgKind(kind)
+		self.ns = int(ns)
+		self.payload = payload
+		self.sent = 0
+
+	@classmethod
+	def at(cls, kind, t, **payload):
+		'''
+		Makes a message from a time in seconds.
+
+		:param MsgKind kind: the kind of message
+		:param t: the time the message refers to
+		:type t: float or obspy.core.utcdatetime.UTCDateTime
+		:param payload: other details
+		:rtype: rsudp.raspberryshake.Message
+		'''
+		ns = t.ns if hasattr(t, 'ns') else round(float(t) * 1e9)
+		return cls(kind, ns, **payload)
+
+	@property
+	def time(self):
+		'''
+		:rtype: obspy.core.utcdatetime.UTCDateTime
+		:return: the time the message refers to
+		'''
+		from obspy import UTCDateTime
+		return UTCDateTime(ns=self.ns)
+
+	@property
+	def path(self):
+		'''
+		:rtype: str or None
+		:return: the image path of an ``IMGPATH`` message
+		'''
+		return self.payload.get('path')
+
+	def to_bytes(self):
+		'''
+		:rtype: bytes
+		:return: the message as sent over the network, e.g. ``b'ALARM 2020-01-01T00:00:00.599Z'``
+		'''
+		if self.kind == MsgKind.TEXT:
+			return self.payload.get('text', '').encode('utf-8')
+		words = [self.kind.name]
+		if self.kind != MsgKind.TERM:
+			s, ns = divmod(self.ns, 1000000000)
+			words.append('%s.%03dZ' % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(s)), ns // 1000000))
+		free = self.FREE.get(self.kind)
+		if free in self.payload:
+			words.append(str(self.payload[free]))
+		words += ['%s=%s' % (k, v) for k, v in self.payload.items() if k != free]
+		return ' '.join(words).encode('utf-8')
+
+	@classmethod
+	def from_bytes(cls, msg):
+		'''
+		Reads a message from its text form (see :py:meth:`to_bytes`).
+		Text that is not a known kind of message becomes a
+		``TEXT`` message with the text in ``payload['text']``.
+
+		:param bytes msg: the message as sent over the network
+		:rtype: rsudp.raspberryshake.Message
+		'''
+		text = msg.decode('utf-8', 'replace')
+		words = text.split(' ')
+		try:
+			kind = MsgKind[words[0]]
+			ns, payload = 0, {}
+			if kind != MsgKind.TERM:
+				dt = datetime.strptime(words[1], '%Y-%m-%dT%H:%M:%S.%fZ')
+				ns = calendar.timegm(dt.timetuple()) * 1000000000 + dt.microsecond * 1000
+			rest = words[1:] if kind == MsgKind.TERM else words[2:]
+			# free text (such as an image path with spaces) runs up to the first key=value word
+			n = next((i for i, word in enumerate(rest) if cls.KEYVAL.match(word)), len(rest))
+			free, rest = ' '.join(rest[:n]), rest[n:]
+			if free and (kind in cls.FREE):
+				payload[cls.FREE[kind]] = free
+			elif free or (kind == MsgKind.IMGPATH):
+				raise ValueError('unexpected text in %s message' % kind.name)
+			for word in rest:
+				k, v = word.split('=', 1)
+				for conv in (int, float, str):
+					try:
+						payload[k] = conv(v)
+						break
+					except ValueError:
+						pass
+			if kind == MsgKind.TEXT:
+				raise KeyError(kind)
+			return cls(kind, ns, **payload)
+		except (KeyError, IndexError, ValueError):
+			return cls(MsgKind.TEXT, text=text)
+
+	def __str__(self):
+		return self.to_bytes().decode('utf-8')
+
+	def __repr__(self):
+		return 'Message(%s, %s%s)' % (self.kind.name, self.ns,
+				''.join(', %s=%r' % i for i in self.payload.items()))
+
+
+def is_data(DP):
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns ``True`` if the bytes look like a Raspberry Shake data packet
+	rather than a message like ``TERM``.
+
+	:param bytes DP: bytes received on the port
+	:rtype: bool
+	'''
+	return DP[:2] == b"{'"
+
+
+def unpack(DP):
+	'''
+	.. versionadded:: 2.3.0
+
+	Passes text datagrams through. For a binary datagram
+	(see :py:mod:`rsudp.codec`), returns the first data packet in it in the
+	text format and keeps the rest for :py:func:`getDATA` to return next.
+
+	:param bytes DP: bytes received on the port
+	:rtype: bytes
+	'''
+	if not codec.is_encoded(DP):
+		return DP
+	texts = [codec.to_text(*p) for p in codec.decode(DP)]
+	unpacked.extend(texts[1:])
+	return texts[0]
+
+
+def parse_packet(DP):
+	'''
+	.. versionadded:: 2.3.0
+
+	Parses a single Raspberry Shake UDP data packet into a
+	:py:class:`rsudp.raspberryshake.Packet`.
+
+	:param bytes DP: The Raspberry Shake UDP data packet (:py:func:`rsudp.raspberryshake.getDATA`)
+	:rtype: rsudp.raspberryshake.Packet
+	'''
+	i = DP.index(b',')
+	vals = np.fromstring(DP[i+1:DP.rindex(b'}')], dtype=np.float64, sep=',')
+	return Packet(DP[2:i-1].decode('utf-8'), float(vals[0]),
+				  vals[1:].astype(np.int32), DP)
+
+
+def parse_packets(DPs):
+	'''
+	.. versionadded:: 2.3.0
+
+	Parses a batch of datagrams at once. The numeric part of every data
+	packet in the batch is decoded by a single :py:func:`numpy.fromstring`
+	call, and each :py:class:`rsudp.raspberryshake.Packet` gets a view
+	into the result. A binary datagram from another rsudp
+	(see :py:mod:`rsudp.codec`) becomes the data packets it holds.
+	Anything else (see :py:func:`is_data`) is returned as a
+	:py:class:`rsudp.raspberryshake.Message`.
+
+	:param list DPs: list of datagrams (bytes)
+	:rtype: list
+	:return: list of :py:class:`rsudp.raspberryshake.Packet` and/or :py:class:`rsudp.raspberryshake.Message`, in the same order as ``DPs``
+	'''
+	out = list(DPs)
+	idx, chas, bodies, counts = [], [], [], []
+	binary = False
+	for n, DP in enumerate(DPs):
+		if codec.is_encoded(DP):
+			binary = True
+			try:
+				out[n] = [Packet(cha, t, data, codec.to_text(cha, t, data)) for cha, t, data in codec.decode(DP)]
+			except ValueError as e:
+				printW('Could not decode a binary datagram: %s' % e, 'parse_packets')
+				out[n] = []
+		elif is_data(DP):
+			i = DP.index(b',')
+			body = DP[i+1:DP.rindex(b'}')]
+			idx.append(n)
+			chas.append(DP[2:i-1].decode('utf-8'))
+			bodies.append(body)
+			counts.append(body.count(b',') + 1)
+		else:
+			out[n] = Message.from_bytes(DP)
+	if idx:
+		vals = np.fromstring(b','.join(bodies), dtype=np.float64, sep=',')
+		ints = vals.astype(np.int32)
+		o = 0
+		for n, cha, c in zip(idx, chas, counts):
+			out[n] = Packet(cha, float(vals[o]), ints[o+1:o+c], DPs[n])
+			o += c
+	if binary:
+		out = [p for x in out for p in (x if isinstance(x, list) else [x])]
+	return out
+
+
 def getTR(chn):				# DP transmission rate in msecs
 	'''
 	Get the transmission rate in milliseconds between consecutive packets from the same channel.
@@ -429,8 +1089,7 @@ def getCHNS():
 	:return: The list of channels being sent to the port (from the single IP address sending data)
 	'''
 	global chns
-	chdict = {'EHZ': False, 'EHN': False, 'EHE': False,
-			  'ENZ': False, 'ENN': False, 'ENE': False, 'HDF': False}
+	chdict = {ch: False for ch in CHANNEL_ORDER}
 	firstCHN = ''
 	done = False
 	sim = 0
@@ -478,14 +1137,146 @@ def getTTLCHN():
 	return numchns
 
 
+def inventory_path():
+	'''
+	.. versionadded:: 2.3.0
+
+	Returns the location of the station's cached StationXML inventory,
+	``<output_dir>/inventory/<net>.<stn>.xml``.
+
+	:rtype: str or bool
+	:return: the path, or ``False`` if the output directory has not been initialized (see :py:func:`rsudp.init_dirs`)
+	'''
+	if not rsudp.output_dir:
+		return False
+	return os.path.join(rsudp.output_dir, 'inventory', '%s.%s.xml' % (net, stn))
+
+
+def _set_inventory(inventory, sender='get_inventory'):
+	'''
+	Makes an inventory the one used by the library
+	and caches its responses (see :py:class:`ResponseCache`).
+	'''
+	global inv, region
+	from obspy.geodetics.flinnengdahl import FlinnEngdahl
+	responses.fill(inventory, sender=sender)
+	region = FlinnEngdahl().get_region(inventory[0][-1].longitude, inventory[0][-1].latitude)
+	inv = inventory
+
+
+def fetch_inventory(url, path=False, timeout=30):
+	'''
+	.. versionadded:: 2.3.0
+
+	Downloads a StationXML inventory from ``url``, which may be an FDSN
+	web service query, any other ``http(s)://`` address, or a ``file://`` URL.
+	If ``path`` is a cached copy, the download is conditional: the request
+	carries an ``If-Modified-Since`` header with the time of the cached copy,
+	and nothing is downloaded if the server answers ``304 Not Modified``
+	or reports a ``Last-Modified`` time that is not newer than the cached copy.
+	A new inventory is validated and then atomically moved into place,
+	so a failed or partial download never replaces a good cached copy.
+
+	:param str url: where to get the inventory
+	:param path: where the inventory is cached, or ``False`` for no cache
+	:type path: str or bool
+	:param float timeout: network timeout in seconds
+	:rtype: obspy.core.inventory.inventory.Inventory or None
+	:return: the new inventory, or ``None`` if the cached copy is up to date
+	'''
+	from email.utils import formatdate, parsedate_to_datetime
+	from urllib.request import Request, urlopen
+	from urllib.error import HTTPError
+	from obspy import read_inventory
+	headers = {'User-Agent': 'rsudp/%s' % __version__}
+	cached = os.path.getmtime(path) if (path and os.path.exists(path)) else None
+	if cached:
+		headers['If-Modified-Since'] = formatdate(cached, usegmt=True)
+	data = None
+	try:
+		with urlopen(Request(url, headers=headers), timeout=timeout) as r:
+			modified = r.headers.get('Last-Modified')
+			if not (cached and modified and
+					(parsedate_to_datetime(modified).timestamp() <= cached)):
+				data = r.read()
+	except HTTPError as e:
+		if not (cached and e.code == 304):
+			raise
+	if data is None:
+		os.utime(path)		# checked, so the cached copy is fresh again
+		return None
+	if not path:
+		return read_inventory(BytesIO(data))
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	tmp = '%s.%s.tmp' % (path, os.getpid())
+	try:
+		with open(tmp, 'wb') as f:
+			f.write(data)
+		inventory = read_inventory(tmp)
+		os.replace(tmp, path)
+	finally:
+		if os.path.exists(tmp):
+			os.remove(tmp)
+	return inventory
+
+
+def refresh_inventory(url, path, sender='refresh_inventory'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Conditionally refreshes the cached inventory (see :py:func:`fetch_inventory`)
+	and, if it has changed, makes the new one the one used by the library.
+	Errors are printed and the inventory in use is kept.
+
+	:param str url: where to get the inventory
+	:param str path: where the inventory is cached
+	:param str sender: the name of the function calling this one
+	:rtype: bool
+	:return: ``True`` if the check succeeded, otherwise ``False``
+	'''
+	try:
+		inventory = fetch_inventory(url, path)
+	except Exception as e:
+		printW('Could not refresh the cached inventory, will keep using it. Detail: %s' % e, sender)
+		return False
+	if inventory is None:
+		printM('Cached inventory is up to date.', sender)
+	else:
+		_set_inventory(inventory, sender=sender)
+		printM('Updated the cached inventory from %s' % url, sender)
+	return True
+
+
+def _refresh_loop(url, path, ttl):
+	'''
+	Refreshes the cached inventory whenever it is older than ``ttl`` seconds.
+	Runs in a background thread started by :py:func:`get_inventory`.
+	'''
+	while True:
+		age = time.time() - os.path.getmtime(path) if os.path.exists(path) else ttl
+		if age >= ttl:
+			refresh_inventory(url, path)
+			# try again later if the check failed
+			age = time.time() - os.path.getmtime(path) if os.path.exists(path) else 0
+		time.sleep(max(ttl - age, 60))
+
+
 def get_inventory(sender='get_inventory', settings=None):
 	'''
 	.. role:: pycode(code)
 		:language: python
 
-	Downloads the station inventory from the Raspberry Shake FDSN and stores
+	Gets the station inventory from the Raspberry Shake FDSN (or the
+	``"inventory_url"`` setting) and stores
 	it as an :py:class:`obspy.core.inventory.inventory.Inventory` object which is available globally.
 
+	The inventory is cached on disk (see :py:func:`inventory_path`).
+	If there is a cached copy, it is used right away and startup does not
+	wait for the network; a background thread checks for a newer version
+	whenever the cached copy is older than the ``"inventory_ttl"`` setting
+	(in seconds) and swaps it in if there is one (see :py:func:`refresh_inventory`).
+	Only when there is no cached copy is the inventory downloaded before continuing.
+
 	In this example, we get the R940D station inventory from the Raspberry Shake FDSN:
 
 	.. code-block:: python
@@ -512,6 +1303,8 @@ def get_inventory(sender='get_inventory', settings=None):
 	:return: The inventory of the Raspberry Shake station in the :pycode:`rsudp.raspberryshake.stn` variable.
 	'''
 	global inv, stn, region
+	from obspy import read_inventory
+	from urllib.error import HTTPError
 	if settings is None:
 		settings = {}
 	sender = 'get_inventory'
@@ -520,14 +1313,25 @@ def get_inventory(sender='get_inventory', settings=None):
 				sender)
 		inv = False
 	else:
+		inventory_url = settings.get("settings", {}).get("inventory_url", None) or INVENTORY_URL
+		url = inventory_url % (net, stn)
+		ttl = settings.get("settings", {}).get("inventory_ttl", 86400)
+		path = inventory_path()
+		if path and os.path.exists(path):
+			try:
+				_set_inventory(read_inventory(path), sender=sender)
+				printM('Using cached inventory %s. Station region is %s' % (path, region), sender)
+				Thread(target=_refresh_loop, args=(url, path, ttl), daemon=True).start()
+				return inv
+			except Exception as e:
+				printW('Could not read cached inventory %s, fetching it again. Detail: %s' % (path, e), sender)
 		try:
-			printM('Fetching inventory for station %s.%s from Raspberry Shake FDSN.'
-					% (net, stn), sender)
-			inventory_url = settings["settings"].get("inventory_url", None) or 'https://data.raspberryshake.org/fdsnws/station/1/query?network=%s&station=%s&level=resp&nodata=404&format=xml'
-			url = inventory_url % (net, stn)#, str(UTCDateTime.now()-timedelta(seconds=14400)))
-			inv = read_inventory(url)
-			region = FlinnEngdahl().get_region(inv[0][-1].longitude, inv[0][-1].latitude)
+			printM('Fetching inventory for station %s.%s from %s'
+					% (net, stn, url.split('?')[0]), sender)
+			_set_inventory(fetch_inventory(url, path), sender=sender)
 			printM('Inventory fetch successful. Station region is %s' % (region), sender)
+			if path:
+				Thread(target=_refresh_loop, args=(url, path, ttl), daemon=True).start()
 		except (IndexError, HTTPError):
 			printW('No inventory found for %s. Are you forwarding your Shake data?' % stn, sender)
 			printW('Deconvolution will only be available if data forwarding is on.', sender, spaces=True)
@@ -540,9 +1344,149 @@ def get_inventory(sender='get_inventory', settings=None):
 			printE('Error detail: %s' % e, sender, spaces=True)
 			inv = False
 			region = False
+	if not inv:
+		responses.clear()
 	return inv
 
 
+class ResponseCache():
+	'''
+	.. versionadded:: 2.3.0
+
+	Holds the instrument response of every channel epoch in the inventory,
+	so that looking up a response for a packet is a dictionary access and
+	a comparison of timestamps instead of a walk through the inventory tree.
+	Filled once by :py:func:`get_inventory` and consulted by
+	:py:func:`get_response`. Every trace that is tagged with a response
+	gets a reference to the same cached object.
+
+	The :py:data:`hits` and :py:data:`misses` counters show how many
+	lookups were answered from the cache and how many were not.
+
+	.. code-block:: python
+
+		>>> import rsudp.raspberryshake as rs
+		>>> response = rs.get_response('AM.R3BCF.00.EHZ')
+		>>> print(rs.responses)
+		1 hits, 0 misses (4 channel epochs)
+	'''
+	def __init__(self):
+		self.epochs = {}
+		self.hits = 0
+		self.misses = 0
+
+	def __str__(self):
+		return '%s hits, %s misses (%s channel epochs)' % (
+				self.hits, self.misses, sum(len(e) for e in self.epochs.values()))
+
+	def clear(self):
+		'''
+		Empties the cache and resets the counters.
+		'''
+		self.epochs = {}
+		self.hits = 0
+		self.misses = 0
+
+	def fill(self, inventory, sender='ResponseCache'):
+		'''
+		Replaces the contents of the cache with the responses in an inventory.
+
+		:param obspy.core.inventory.inventory.Inventory inventory: the inventory
+		:param str sender: the name of the function calling this one
+		'''
+		epochs = {}
+		for network in inventory:
+			for station in network:
+				for channel in station:
+					if channel.response is None:
+						continue
+					seed_id = '%s.%s.%s.%s' % (network.code, station.code,
+											   channel.location_code, channel.code)
+					start = float(channel.start_date) if channel.start_date else float('-inf')
+					end = float(channel.end_date) if channel.end_date else float('inf')
+					epochs.setdefault(seed_id, []).append((start, end, channel.response))
+		self.epochs = epochs	# swapped in whole, so lookups from other threads never see it half full
+		printM('Cached instrument responses for %s channel epochs'
+			   % sum(len(e) for e in epochs.values()), sender)
+
+	def get(self, seed_id, t):
+		'''
+		Returns the cached response of a channel at a time.
+
+		:param str seed_id: the SEED id of the channel
+		:param t: the time the response should be valid at
+		:type t: float or obspy.core.utcdatetime.UTCDateTime
+		:rtype: obspy.core.inventory.response.Response or None
+		:return: the response, or ``None`` if no cached epoch covers the time
+		'''
+		t = float(t)
+		for start, end, response in self.epochs.get(seed_id, ()):
+			if start <= t <= end:
+				self.hits += 1
+				return response
+		self.misses += 1
+		return None
+
+
+responses = ResponseCache()		# instrument responses of the inventory
+
+
+def get_response(seed_id, t=None, sender='get_response'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Looks up the instrument response of a channel in
+	:py:data:`rsudp.raspberryshake.inv`, if an inventory is available.
+	Responses are taken from the :py:class:`ResponseCache`;
+	the inventory itself is only searched if the cache has no answer.
+	Prints a warning the first time the response cannot be found.
+
+	:param str seed_id: the SEED id of the channel, e.g. ``'AM.R3BCF.00.EHZ'``
+	:param obspy.core.utcdatetime.UTCDateTime t: the time the response should be valid at (defaults to now)
+	:param str sender: the name of the function or class calling this one
+	:rtype: obspy.core.inventory.response.Response or None
+	:return: the response, or ``None`` if it could not be found
+	'''
+	global INVWARN
+	if inv:
+		from obspy import UTCDateTime
+		t = t or UTCDateTime.now()
+		response = responses.get(seed_id, t)
+		if response is not None:
+			return response
+		try:
+			return inv.get_response(seed_id, t)
+		except Exception as e:
+			if not INVWARN:
+				INVWARN = True
+				printE(e, sender=sender)
+				printE('Could not attach inventory response.', sender=sender)
+				printE('Are you sure you set the station name correctly?', spaces=True, sender=sender)
+				printE('This could indicate a mismatch in the number of data channels', spaces=True, sender=sender)
+				printE('between the inventory and the stream. For example,', spaces=True, sender=sender)
+				printE('if you are receiving RS4D data, please make sure', spaces=True, sender=sender)
+				printE('the inventory you download has 4 channels.', spaces=True, sender=sender)
+	return None
+
+
+def set_response(tr, sender='make_trace'):
+	'''
+	.. versionadded:: 2.3.0
+
+	Attaches the instrument response from :py:data:`rsudp.raspberryshake.inv`
+	to a trace, if an inventory is available (see :py:func:`get_response`).
+
+	:param obspy.core.trace.Trace tr: the trace to attach the response to
+	:param str sender: the name of the function or class calling this one
+	:rtype: obspy.core.trace.Trace
+	:return: the same trace
+	'''
+	response = get_response(tr.id, tr.stats.starttime, sender=sender)
+	if response is not None:
+		tr.stats.response = response
+	return tr
+
+
 def make_trace(d):
 	'''
 	Makes a trace and assigns it some values using a data packet.
@@ -563,7 +1507,7 @@ def make_trace(d):
 	:rtype: obspy.core.trace.Trace
 	:return: A fully formed Trace object to build a Stream with
 	'''
-	global INVWARN
+	from obspy import Trace, UTCDateTime
 	ch = getCHN(d)						# channel
 	if ch:
 		t = getTIME(d)				# unix epoch time since 1970-01-01 00:00:00Z; "timestamp" in obspy
@@ -575,21 +1519,7 @@ def make_trace(d):
 		tr.stats.channel = ch
 		tr.stats.sampling_rate = sps
 		tr.stats.starttime = UTCDateTime(t, precision=3)
-		if inv:
-			try:
-				tr.stats.response = inv.get_response(tr.id, tr.stats.starttime)
-			except Exception as e:
-				if not INVWARN:
-					INVWARN = True
-					printE(e, sender='make_trace')
-					printE('Could not attach inventory response.', sender='make_trace')
-					printE('Are you sure you set the station name correctly?', spaces=True, sender='make_trace')
-					printE('This could indicate a mismatch in the number of data channels', spaces=True, sender='make_trace')
-					printE('between the inventory and the stream. For example,', spaces=True, sender='make_trace')
-					printE('if you are receiving RS4D data, please make sure', spaces=True, sender='make_trace')
-					printE('the inventory you download has 4 channels.', spaces=True, sender='make_trace')
-				else:
-					pass
+		set_response(tr)
 		return tr
 
 
@@ -599,6 +1529,12 @@ def update_stream(stream, d, **kwargs):
 	Returns an updated Stream object with new data, merged down to one trace per available channel.
 	Most sub-consumers call this each time they receive data packets in order to keep their obspy stream current.
 
+	.. note::
+
+		The cost of each call grows with the length of the stream.
+		Sub-consumers that keep a rolling window of data should use
+		:py:class:`rsudp.ringbuffer.StreamBuffer` instead.
+
 	In this example, we make a stream object with some RS 1Dv7 data:
 
 	.. code-block:: python
@@ -661,6 +1597,7 @@ def copy(orig):
 	:return: A low-memory copy of the passed data stream
 
 	"""
+	from obspy import Stream, Trace
 	stream = Stream()
 	for t in range(len(orig)):
 		trace = Trace(data=orig[t].data)
@@ -691,7 +1628,24 @@ class ConsumerThread(Thread):
 		self.sender = 'ConsumerThread'  # module name used in logging
 		self.alarm = False              # the Producer reads this to set the ``ALARM`` state
 		self.alarm_reset = False        # the Producer reads this to set the ``RESET`` state
+		self.alarm_info = {}            # details the Producer sends with ALARM and RESET messages
 		self.alive = True               # this is used to keep the main ``for`` loop running
+		self.channels = None            # channels to receive data from (None = all)
+		self.kinds = None               # kinds of item to receive, e.g. ['DATA', 'ALARM'] (None = all)
+		self.overflow = 'block'         # what to do when the queue is full (see rsudp.bus.Subscription)
+		self.bus = None                 # set by the client; used by announce()
+
+	The client subscribes each consumer's queue (see :py:class:`rsudp.bus.Subscription`)
+	to the ``channels`` and ``kinds`` set when the consumer has been initialized,
+	so a consumer that sets them is only handed what it needs.
+	``TERM`` messages are always delivered.
+	Consumers that can afford to miss items when they fall behind (such as
+	notifiers) should set a dropping ``overflow`` policy, so that they never hold
+	up the others. The ``"overflow"`` setting overrides it.
+
+	A consumer that detects an event should send its ``ALARM`` and ``RESET``
+	messages with :py:meth:`announce`, which delivers them at once instead of
+	waiting for the Producer to notice the ``alarm`` flags.
 
 	For more information on creating your own consumer threads,
 	see :ref:`add_your_own`.
@@ -702,7 +1656,34 @@ class ConsumerThread(Thread):
 		self.sender = 'ConsumerThread'	# used in logging
 		self.alarm = False				# the producer reads this
 		self.alarm_reset = False		# the producer reads this
+		self.alarm_info = {}			# the producer sends this with ALARM and RESET
 		self.alive = True				# this is used to keep the main for loop running
+		self.channels = None			# channels to receive data from (None = all)
+		self.kinds = None				# kinds of item to receive (None = all)
+		self.overflow = 'block'			# what to do when the queue is full
+		self.bus = None					# the client sets this
+
+	def announce(self, msg):
+		'''
+		.. versionadded:: 2.3.0
+
+		Sends an ``ALARM`` or ``RESET`` message to the other consumers right
+		away through the bus (see :py:meth:`rsudp.bus.Bus.publish_urgent`),
+		ahead of any data waiting in their queues.
+		If this consumer is not connected to a bus, the message is left in
+		the :py:data:`alarm` or :py:data:`alarm_reset` flag (and
+		:py:data:`alarm_info`) for the Producer to send as before.
+
+		:param rsudp.raspberryshake.Message msg: the message
+		'''
+		if self.bus:
+			self.bus.publish_urgent(msg)
+		else:
+			self.alarm_info = dict(msg.payload)
+			if msg.kind == MsgKind.RESET:
+				self.alarm_reset = msg.time
+			else:
+				self.alarm = msg.time
 
 
 if __name__ == '__main__':
@@ -0,0 +1,442 @@
+import numpy as np
+import rsudp.raspberryshake as rs
+
+
+class RingBuffer():
+	'''
+	.. versionadded:: 2.3.0
+
+	A preallocated circular buffer holding the most recent ``seconds``
+	of data from a single channel, indexed by sample time.
+
+	Each sample is written twice (at ``i`` and ``i + size``) so that any
+	window ending at the newest sample is a contiguous slice of the
+	underlying array. This means that :py:func:`view` and :py:func:`gaps`
+	return zero-copy numpy views, and the cost of adding a packet is
+	proportional to the number of samples in the packet rather than the
+	length of the window.
+
+	Gap handling follows the ``fill_value`` semantics of
+	:py:meth:`obspy.core.stream.Stream.merge`:
+
+	- ``'latest'`` - gaps are filled with the last sample before the gap
+	- ``None`` - gaps are masked (see :py:func:`gaps`)
+	- a number - gaps are filled with that number
+
+	Packets that arrive late are written back into their place in
+	the buffer as long as they still fall inside the window.
+
+	.. code-block:: python
+
+		>>> from rsudp.ringbuffer import RingBuffer
+		>>> b = RingBuffer(sps=100, seconds=30)
+		>>> b.write(1582315130.292, [14168, 14927, 16112])
+		3
+		>>> b.view()
+		array([14168, 14927, 16112], dtype=int32)
+
+	:param float sps: samples per second of the channel
+	:param float seconds: length of the buffer in seconds
+	:param fill_value: how to fill gaps in the data (see above)
+	:type fill_value: str, int, float, or None
+	:param numpy.dtype dtype: data type of the buffer (defaults to :py:class:`numpy.int32`)
+	'''
+	def __init__(self, sps, seconds, fill_value='latest', dtype=np.int32):
+		self.sps = float(sps)
+		self.delta = 1. / self.sps
+		self.seconds = seconds
+		self.size = max(int(round(seconds * self.sps)), 1)
+		self.fill_value = fill_value
+		self.dtype = dtype
+		self._data = np.zeros(2 * self.size, dtype=dtype)
+		self._gaps = np.zeros(2 * self.size, dtype=bool)
+		self.reset()
+
+	def reset(self):
+		'''
+		Empties the buffer. The next packet written will become the
+		new time reference.
+		'''
+		self._pos = 0			# next write position in [0, size)
+		self.count = 0			# number of samples available
+		self.t0 = None			# time of the reference sample
+		self.next = None		# index of the next expected sample, relative to t0
+
+	def _put(self, p, x, gap=False):
+		'''
+		Writes samples to both halves of the buffer starting at position ``p``.
+		'''
+		n = len(x)
+		e = p + n
+		if e <= self.size:
+			self._data[p:e] = x
+			self._data[p+self.size:e+self.size] = x
+			self._gaps[p:e] = gap
+			self._gaps[p+self.size:e+self.size] = gap
+		else:
+			k = self.size - p
+			self._put(p, x[:k], gap)
+			self._put(0, x[k:], gap)
+
+	def _append(self, x, gap=False):
+		'''
+		Appends samples at the head of the buffer.
+		'''
+		if len(x) > self.size:
+			self.next += len(x) - self.size
+			x = x[-self.size:]
+		self._put(self._pos, x, gap)
+		n = len(x)
+		self._pos = (self._pos + n) % self.size
+		self.count = min(self.count + n, self.size)
+		self.next += n
+
+	def _fill(self, n):
+		'''
+		Fills a gap of ``n`` samples at the head of the buffer.
+		'''
+		if self.fill_value == 'latest':
+			value = self._data[self._pos + self.size - 1] if self.count else 0
+			self._append(np.full(n, value, dtype=self.dtype))
+		elif self.fill_value is None:
+			self._append(np.zeros(n, dtype=self.dtype), gap=True)
+		else:
+			self._append(np.full(n, self.fill_value, dtype=self.dtype))
+
+	def index(self, t):
+		'''
+		Returns the sample index of time ``t`` relative to the buffer's time reference.
+
+		:param float t: time in seconds since 1970-01-01 00:00:00Z
+		:rtype: int
+		'''
+		return int(round((t - self.t0) * self.sps))
+
+	def time(self, i):
+		'''
+		Returns the time of the sample at index ``i``.
+
+		:param int i: sample index relative to the buffer's time reference
+		:rtype: float
+		:return: time in seconds since 1970-01-01 00:00:00Z
+		'''
+		return self.t0 + i / self.sps
+
+	def write(self, t, samples):
+		'''
+		Writes a packet of samples starting at time ``t`` to the buffer.
+
+		:param float t: time of the first sample in seconds since 1970-01-01 00:00:00Z
+		:param samples: the samples to write
+		:type samples: list or numpy.ndarray
+		:rtype: int
+		:return: the number of samples (including gap fill) added to the head of the buffer.
+			Late samples written back into the window are not counted.
+		'''
+		samples = np.asarray(samples, dtype=self.dtype)
+		if self.t0 is None:
+			self.t0 = t
+			self.next = 0
+		i = self.index(t)
+		off = i - self.next
+		added = 0
+		if off >= self.size:
+			# the gap is longer than the buffer, so start over
+			t0 = t
+			self.reset()
+			self.t0, self.next = t0, 0
+		elif off > 0:
+			self._fill(off)
+			added += off
+		elif off < 0:
+			# late or overlapping data: put it back where it belongs
+			k = min(-off, len(samples))
+			j = np.arange(max(self.next - self.count - i, 0), k)
+			if len(j):
+				p = (self._pos - (self.next - (i + j))) % self.size
+				self._data[p] = samples[j]
+				self._data[p + self.size] = samples[j]
+				self._gaps[p] = False
+				self._gaps[p + self.size] = False
+			samples = samples[k:]
+		if len(samples):
+			self._append(samples)
+			added += len(samples)
+		return added
+
+	def view(self, n=None):
+		'''
+		Returns a zero-copy view of the newest ``n`` samples
+		(or all available samples if ``n`` is ``None``).
+		The view is only valid until the next call to :py:func:`write`.
+
+		:param int n: number of samples
+		:rtype: numpy.ndarray
+		'''
+		n = self.count if (n is None) else max(min(n, self.count), 0)
+		e = self._pos + self.size
+		return self._data[e-n:e]
+
+	def gaps(self, n=None):
+		'''
+		Returns a zero-copy boolean view of the newest ``n`` samples
+		which is ``True`` where the data is masked (``fill_value=None`` only).
+
+		:param int n: number of samples
+		:rtype: numpy.ndarray
+		'''
+		n = self.count if (n is None) else max(min(n, self.count), 0)
+		e = self._pos + self.size
+		return self._gaps[e-n:e]
+
+	def starttime(self, n=None):
+		'''
+		Returns the time of the first sample in a window of the newest ``n`` samples.
+
+		:param int n: number of samples
+		:rtype: float
+		'''
+		n = self.count if (n is None) else max(min(n, self.count), 0)
+		return self.time(self.next - n)
+
+	def endtime(self):
+		'''
+		Returns the time of the newest sample in the buffer.
+
+		:rtype: float
+		'''
+		return self.time(self.next - 1)
+
+	def window(self, starttime=None, endtime=None):
+		'''
+		Returns the number of samples and the offset from the head of the
+		buffer of the half-open time window ``[starttime, endtime)``,
+		clipped to the data available in the buffer.
+
+		:param float starttime: start of the window (defaults to the oldest sample)
+		:param float endtime: end of the window (defaults to just after the newest sample)
+		:rtype: tuple
+		:return: ``(n, lag)`` where ``n`` is the number of samples in the window and ``lag`` is the number of newer samples after it
+		'''
+		oldest = self.next - self.count
+		s = oldest if (starttime is None) else min(max(self.index(starttime), oldest), self.next)
+		e = self.next if (endtime is None) else min(max(self.index(endtime), s), self.next)
+		return e - s, self.next - e
+
+	def slice(self, starttime=None, endtime=None):
+		'''
+		Returns a zero-copy view of the data in the half-open time window
+		``[starttime, endtime)`` along with the time of its first sample.
+
+		:param float starttime: start of the window (defaults to the oldest sample)
+		:param float endtime: end of the window (defaults to just after the newest sample)
+		:rtype: tuple
+		:return: ``(data, gaps, starttime)``
+		'''
+		n, lag = self.window(starttime, endtime)
+		e = self._pos + self.size - lag
+		return self._data[e-n:e], self._gaps[e-n:e], self.time(self.next - lag - n)
+
+
+class StreamBuffer():
+	'''
+	.. versionadded:: 2.3.0
+
+	A set of :py:class:`rsudp.ringbuffer.RingBuffer` objects,
+	one per channel, that replaces the
+	:py:func:`rsudp.raspberryshake.update_stream` /
+	:py:func:`rsudp.raspberryshake.copy` cycle in sub-consumers.
+	Data packets are written with :py:func:`update`,
+	and :py:func:`stream` returns an :py:class:`obspy.core.stream.Stream`
+	whose traces are views into the buffers.
+
+	.. code-block:: python
+
+		>>> import rsudp.raspberryshake as rs
+		>>> from rsudp.ringbuffer import StreamBuffer
+		>>> rs.initRSlib(dport=8888, rsstn='R3BCF')
+		>>> b = StreamBuffer(seconds=30, chans=['EHZ'])
+		>>> b.update(rs.getDATA())
+		'EHZ'
+		>>> print(b.stream())
+		1 Trace(s) in Stream:
+		AM.R3BCF.00.EHZ | 2020-02-21T19:58:50.292000Z - 2020-02-21T19:58:50.532000Z | 100.0 Hz, 25 samples
+
+	.. note::
+
+		Traces returned by :py:func:`stream` share memory with the buffer.
+		Copy them (or use ``copy=True``) before modifying their data in place.
+
+	:param float seconds: length of each channel buffer in seconds
+	:param list chans: list of channels to keep (defaults to all channels)
+	:param fill_value: how to fill gaps in the data (see :py:class:`rsudp.ringbuffer.RingBuffer`)
+	:type fill_value: str, int, float, or None
+	:param float sps: samples per second (defaults to :py:data:`rsudp.raspberryshake.sps`)
+	:param numpy.dtype dtype: data type of the buffers (defaults to :py:class:`numpy.int32`)
+	'''
+	def __init__(self, seconds, chans=None, fill_value='latest', sps=None, dtype=np.int32):
+		self.seconds = seconds
+		self.chans = chans
+		self.fill_value = fill_value
+		self.sps = sps or rs.sps
+		self.dtype = dtype
+		self.buffers = {}
+		self.derived = []		# buffers fed from this one (see derive())
+		self.stage = None		# makes per-channel processors if this buffer is derived
+		self._procs = {}
+
+	def __getitem__(self, cha):
+		return self.buffers[cha]
+
+	def __contains__(self, cha):
+		return cha in self.buffers
+
+	def __len__(self):
+		return len(self.buffers)
+
+	def channels(self):
+		'''
+		Returns the sorted list of channels that have data in the buffer.
+
+		:rtype: list
+		'''
+		return sorted(self.buffers)
+
+	def write(self, cha, t, samples):
+		'''
+		Writes samples from a channel to its buffer, creating the buffer if necessary.
+
+		:param str cha: channel name
+		:param float t: time of the first sample in seconds since 1970-01-01 00:00:00Z
+		:param samples: the samples to write
+		:type samples: list or numpy.ndarray
+		:rtype: int
+		:return: the number of samples added to the head of the channel's buffer
+		'''
+		if cha not in self.buffers:
+			self.buffers[cha] = RingBuffer(sps=self.sps, seconds=self.seconds,
+										   fill_value=self.fill_value, dtype=self.dtype)
+		b = self.buffers[cha]
+		n = b.write(t, samples)
+		if n and self.derived:
+			n = min(n, b.count)
+			for child in self.derived:
+				child._feed(cha, b.starttime(n), b.view(n))
+		return n
+
+	def _feed(self, cha, t, samples):
+		'''
+		Runs new samples from the parent buffer through this buffer's
+		per-channel processor and writes the result, shifted back by
+		the processor's delay (if it has one).
+		'''
+		if cha not in self._procs:
+			self._procs[cha] = self.stage(cha)
+		proc = self._procs[cha]
+		return self.write(cha, t - getattr(proc, 'delay', 0) / self.sps, proc(samples))
+
+	def derive(self, stage, seconds=None, dtype=np.float64):
+		'''
+		.. versionadded:: 2.3.0
+
+		Creates a buffer that is continuously fed with the output of a
+		processing stage (for example :py:class:`rsudp.dsp.FilterStage`).
+		Every time samples are added to the head of a channel in this buffer,
+		they are passed through that channel's processor and written to
+		the derived buffer, so the derived data is processed once,
+		continuously, without edge effects at the start of each window.
+		Derived buffers can be chained by deriving from them in turn.
+
+		.. note::
+
+			Late packets that are written back into the middle of this buffer
+			are not passed on, because causal processors cannot go back in time.
+
+		:param stage: a callable that takes a channel name and returns a new processor for that channel. A processor is a callable that takes an array of new samples and returns an array of the same length. If it has a ``delay`` attribute, its output is taken to lag its input by that many samples.
+		:param float seconds: length of the derived buffer (defaults to the length of this one)
+		:param numpy.dtype dtype: data type of the derived buffer
+		:rtype: rsudp.ringbuffer.StreamBuffer
+		:return: the derived buffer
+		'''
+		child = StreamBuffer(seconds=seconds or self.seconds, chans=self.chans,
+							 fill_value='latest', sps=self.sps, dtype=dtype)
+		child.stage = stage
+		self.derived.append(child)
+		return child
+
+	def update(self, d):
+		'''
+		Writes a Raspberry Shake data packet to the buffer
+		of the channel it belongs to.
+
+		:param bytes d: The Raspberry Shake UDP data packet (:py:func:`rsudp.raspberryshake.getDATA`)
+		:rtype: str or bool
+		:return: the channel name if the packet was written, otherwise ``False``
+		'''
+		cha = rs.getCHN(d)
+		if (self.chans is not None) and (cha not in self.chans):
+			return False
+		self.write(cha, rs.getTIME(d), rs.getSTREAM(d))
+		return cha
+
+	def _trace(self, cha, data, gaps, t, copy=False):
+		'''
+		Builds a trace around a buffer view.
+		'''
+		if gaps.any():
+			data = np.ma.masked_array(data, mask=gaps, copy=copy)
+		elif copy:
+			data = data.copy()
+		tr = rs.Trace(data=data)
+		tr.stats.network = rs.net
+		tr.stats.location = '00'
+		tr.stats.station = rs.stn
+		tr.stats.channel = cha
+		tr.stats.sampling_rate = self.sps
+		tr.stats.starttime = rs.UTCDateTime(t, precision=3)
+		rs.set_response(tr, sender='StreamBuffer')
+		return tr
+
+	def trace(self, cha, seconds=None, starttime=None, endtime=None, copy=False):
+		'''
+		Returns a trace containing the newest ``seconds`` of data from a channel,
+		or the data in the half-open window ``[starttime, endtime)``.
+
+		:param str cha: channel name
+		:param float seconds: length of the window in seconds (defaults to the whole buffer)
+		:param starttime: start of the window
+		:type starttime: float or obspy.core.utcdatetime.UTCDateTime
+		:param endtime: end of the window
+		:type endtime: float or obspy.core.utcdatetime.UTCDateTime
+		:param bool copy: whether to copy the data out of the buffer
+		:rtype: obspy.core.trace.Trace
+		'''
+		b = self.buffers[cha]
+		if (starttime is None) and (endtime is None):
+			n = None if (seconds is None) else int(round(seconds * b.sps))
+			return self._trace(cha, b.view(n), b.gaps(n), b.starttime(n), copy=copy)
+		starttime = None if (starttime is None) else float(starttime)
+		endtime = None if (endtime is None) else float(endtime)
+		data, gaps, t = b.slice(starttime, endtime)
+		return self._trace(cha, data, gaps, t, copy=copy)
+
+	def stream(self, seconds=None, starttime=None, endtime=None, copy=False):
+		'''
+		Returns a stream with one trace per channel (see :py:func:`trace`).
+		Channels without data in the requested window are left out.
+
+		:param float seconds: length of the window in seconds (defaults to the whole buffer)
+		:param starttime: start of the window
+		:type starttime: float or obspy.core.utcdatetime.UTCDateTime
+		:param endtime: end of the window
+		:type endtime: float or obspy.core.utcdatetime.UTCDateTime
+		:param bool copy: whether to copy the data out of the buffers
+		:rtype: obspy.core.stream.Stream
+		'''
+		st = rs.Stream()
+		for cha in self.channels():
+			tr = self.trace(cha, seconds=seconds, starttime=starttime,
+							endtime=endtime, copy=copy)
+			if len(tr.data):
+				st.append(tr)
+		return st
@@ -0,0 +1,493 @@
+import signal
+import importlib
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import deque
+from threading import Thread
+from time import monotonic, monotonic_ns
+from queue import Empty
+import numpy as np
+import rsudp
+from rsudp import printM, printW, printE, start_logging, add_debug_handler
+import rsudp.raspberryshake as rs
+from rsudp.raspberryshake import ConsumerThread, Packet, Message, MsgKind
+from rsudp.test import TEST
+
+# settings sections whose consumers can run in a separate process
+# (they only need parsed data, not the raw packets or the display)
+SECTIONS = ('write', 'alert', 'rsam')
+
+# library state that a consumer process needs from the client
+STATE = ('port', 'stn', 'net', 'firstaddr', 'chns', 'numchns', 'tf', 'tr', 'sps', 'inv', 'region')
+DIRS = ('output_dir', 'data_dir', 'scap_dir')
+
+# consumer attributes that are sent back to the client when a process ends
+RESULTS = ('outfiles',)
+
+
+class PacketRing():
+	'''
+	.. versionadded:: 2.3.0
+
+	A ring of data packets in shared memory
+	(see :py:class:`multiprocessing.shared_memory.SharedMemory`),
+	written by the :py:class:`rsudp.p_producer.Producer` and read by
+	consumers running in other processes (see :py:class:`ProcessConsumer`).
+	Each reader keeps its own place in the ring (see :py:class:`RingReader`),
+	so one copy of each packet serves every process.
+
+	Every slot holds a sequence number that is odd while the slot is being
+	written and even once it is complete, so a reader can tell a packet
+	that is not complete yet from one that a writer that has gone all the
+	way around the ring has overwritten.
+
+	The slots are written with plain stores, which other processes may see
+	in a different order (the memory model of the ARM processors of a
+	Raspberry Pi allows this). So the number of packets written
+	(see :py:attr:`head`) and the number the writer has started to write
+	(see :py:attr:`reserved`) are only changed and read while holding
+	:py:attr:`lock`. Taking and releasing it are memory barriers:
+	a reader that sees a number sees every slot written before it, and
+	a reader that checks :py:attr:`reserved` after copying packets out knows
+	which of them may have been overwritten while it was copying them.
+	The lock is taken twice for each batch written and twice for each read,
+	never for each packet.
+
+	.. code-block:: python
+
+		>>> ring = PacketRing()
+		>>> ring.write_many(packets)
+		>>> reader = RingReader(PacketRing(name=ring.name, lock=ring.lock), start=0)
+		>>> reader.read()
+		[Packet('EHZ', 1582315130.292, 25 samples), ...]
+
+	:param name: name of an existing ring to attach to (``None`` = create a new one)
+	:type name: str or None
+	:param int slots: number of packets the ring holds
+	:param int samples: most samples kept from each packet
+	:param lock: the lock of the ring that ``name`` refers to (``None`` = make one for a new ring)
+	:type lock: multiprocessing.synchronize.Lock or None
+	:raise ValueError: if attaching to an existing ring without its lock
+	'''
+	HEADER = 64		# bytes before the first slot: write count, slots, samples, reserved count
+
+	def __init__(self, name=None, slots=4096, samples=256, lock=None):
+		self.owner = name is None
+		if self.owner:
+			# consumer processes are spawned, so the lock has to come from the same context
+			lock = multiprocessing.get_context('spawn').Lock() if lock is None else lock
+		elif lock is None:
+			raise ValueError('attaching to a shared memory ring needs the lock it was made with')
+		self.lock = lock
+		if self.owner:
+			size = self.HEADER + slots * self._dtype(samples).itemsize
+			self.shm = shared_memory.SharedMemory(create=True, size=size)
+		else:
+			self.shm = shared_memory.SharedMemory(name=name)
+		self.header = np.ndarray((4,), dtype=np.int64, buffer=self.shm.buf)
+		if self.owner:
+			self.header[:] = (0, slots, samples, 0)
+		self.nslots, self.samples = int(self.header[1]), int(self.header[2])
+		self.slots = np.ndarray((self.nslots,), dtype=self._dtype(self.samples),
+								buffer=self.shm.buf, offset=self.HEADER)
+		self.seq = self.slots['seq']
+		self.time = self.slots['time']
+		self.n = self.slots['n']
+		self.cha = self.slots['cha']
+		self.data = self.slots['data']
+		self.truncated = False
+
+	@staticmethod
+	def _dtype(samples):
+		return np.dtype([('seq', '<i8'), ('time', '<f8'), ('n', '<i4'),
+						 ('cha', 'S4'), ('data', '<i4', (samples,))])
+
+	def __str__(self):
+		return '%s packets written, %s slots of %s samples (%.1f MB)' % (
+			self.head, self.nslots, self.samples, self.shm.size / 1e6)
+
+	@property
+	def name(self):
+		return self.shm.name
+
+	@property
+	def head(self):
+		'''
+		The number of packets written so far.
+		'''
+		with self.lock:
+			return int(self.header[0])
+
+	@property
+	def reserved(self):
+		'''
+		The number of packets written so far, and being written now.
+		'''
+		with self.lock:
+			return int(self.header[3])
+
+	def write_many(self, items):
+		'''
+		Writes the data packets in a list to the ring.
+		Messages in the list are left out; they go to consumer processes
+		through their control pipes instead.
+
+		:param list items: data packets and messages
+		'''
+		packets = [p for p in items if isinstance(p, Packet)]
+		if not packets:
+			return
+		with self.lock:
+			head = int(self.header[0])
+			self.header[3] = head + len(packets)
+		for p in packets:
+			k = head % self.nslots
+			seq = 2 * (head // self.nslots)
+			n = len(p.data)
+			if n > self.samples:
+				if not self.truncated:
+					printW('Packets of %s samples are longer than the shared memory slots (%s samples); '
+						   'the rest of each packet is left out' % (n, self.samples), sender='PacketRing')
+					self.truncated = True
+				n = self.samples
+			self.seq[k] = seq + 1
+			self.time[k] = p.time
+			self.cha[k] = p.cha
+			self.n[k] = n
+			self.data[k, :n] = p.data[:n]
+			self.seq[k] = seq + 2
+			head += 1
+		with self.lock:
+			self.header[0] = head
+
+	def close(self):
+		'''
+		Detaches from the ring, and frees it if this is the ring that
+		was created here.
+		'''
+		self.header = self.slots = self.seq = self.time = self.n = self.cha = self.data = None
+		self.shm.close()
+		if self.owner:
+			self.shm.unlink()
+
+
+class RingReader():
+	'''
+	.. versionadded:: 2.3.0
+
+	One reader's place in a :py:class:`PacketRing`.
+	A reader that falls more than a full ring behind skips ahead to
+	the oldest packet still held, and counts what it missed in
+	:py:data:`lost`. A packet that is not complete yet
+	is read on the next poll instead.
+
+	:param PacketRing ring: the ring to read
+	:param start: number of the first packet to read (``None`` = only packets written from now on)
+	:type start: int or None
+	'''
+	def __init__(self, ring, start=None):
+		self.ring = ring
+		self.cursor = ring.head if start is None else start
+		self.lost = 0
+
+	def pending(self):
+		'''
+		:rtype: int
+		:return: the number of packets written that have not been read yet
+		'''
+		return self.ring.head - self.cursor
+
+	def read(self, channels=None):
+		'''
+		Reads every packet written since the last read.
+
+		:param channels: channels to keep (``None`` = all)
+		:type channels: list or None
+		:rtype: list
+		:return: the packets, as :py:class:`rsudp.raspberryshake.Packet` objects without the raw bytes
+		'''
+		ring = self.ring
+		head, nslots = ring.head, ring.nslots
+		if head - self.cursor > nslots:
+			self.lost += head - nslots - self.cursor
+			self.cursor = head - nslots
+		copied = []
+		i = self.cursor
+		while i < head:
+			k = i % nslots
+			seq = 2 * (i // nslots) + 2
+			now = int(ring.seq[k])
+			if now > seq:
+				# the writer has gone around the ring and (started to) overwrite it
+				self.lost += 1
+				i += 1
+				continue
+			if now != seq:
+				# not complete yet; read it on the next poll
+				break
+			cha = ring.cha[k].decode()
+			if (channels is None) or (cha in channels):
+				t, n = float(ring.time[k]), int(ring.n[k])
+				copied.append((i, Packet(cha, t, ring.data[k, :n].copy())))
+			i += 1
+		self.cursor = i
+		# packets the writer may have been overwriting while they were copied
+		safe = ring.reserved - nslots
+		out = []
+		for i, p in copied:
+			if i < safe:
+				self.lost += 1
+			else:
+				out.append(p)
+		return out
+
+
+class ProcessQueue():
+	'''
+	.. versionadded:: 2.3.0
+
+	The queue of a consumer running in its own process.
+	Data packets come from a :py:class:`RingReader` and messages
+	from the control pipe. Like the urgent lane of a
+	:py:class:`rsudp.bus.Subscription`, ``ALARM`` and ``RESET`` messages
+	are handed out ahead of data, while a ``TERM`` message comes after
+	every packet written before it. It has the same ``get``/``task_done``/``qsize``
+	methods as :py:class:`queue.Queue`, so the consumer's code reads from it unchanged.
+
+	:param RingReader reader: the consumer's place in the packet ring
+	:param multiprocessing.connection.Connection conn: the consumer's end of the control pipe
+	:param float interval: how often to look for new packets when there are no messages (s)
+	'''
+	def __init__(self, reader, conn, interval=0.01):
+		self.reader = reader
+		self.conn = conn
+		self.interval = interval
+		self.channels = None
+		self.items = deque()
+		self.urgent = deque()
+
+	def _fill(self, wait):
+		term = None
+		if self.conn.poll(wait):
+			while self.conn.poll():
+				msg = self.conn.recv()
+				if msg.kind == MsgKind.TERM:
+					term = msg
+				else:
+					self.urgent.append(msg)
+		self.items.extend(self.reader.read(self.channels))
+		if term:
+			self.items.append(term)
+
+	def get(self, block=True, timeout=None):
+		'''
+		Removes and returns the oldest urgent message if there is one,
+		otherwise the oldest item.
+
+		:param bool block: whether to wait for an item
+		:param float timeout: how long to wait (``None`` = forever)
+		:raise queue.Empty: if there is no item after waiting
+		'''
+		end = None if (timeout is None) else monotonic() + timeout
+		while True:
+			if self.urgent:
+				return self.urgent.popleft()
+			if self.items:
+				return self.items.popleft()
+			if not block or ((end is not None) and (monotonic() >= end)):
+				self._fill(0)
+				if not (self.urgent or self.items):
+					raise Empty
+			else:
+				self._fill(0 if self.reader.pending() else self.interval)
+
+	def get_nowait(self):
+		'''
+		Same as :py:meth:`get` with ``block=False``.
+		'''
+		return self.get(block=False)
+
+	def task_done(self):
+		'''
+		Does nothing. Kept so that consumers written for
+		:py:class:`queue.Queue` work without changes.
+		'''
+		pass
+
+	def qsize(self):
+		'''
+		:rtype: int
+		:return: the number of items waiting, including unread packets of every channel
+		'''
+		return len(self.urgent) + len(self.items) + self.reader.pending()
+
+	def empty(self):
+		return self.qsize() == 0
+
+
+class PipeBus():
+	'''
+	.. versionadded:: 2.3.0
+
+	Stands in for the :py:class:`rsudp.bus.Bus` in a consumer process,
+	so that :py:meth:`rsudp.raspberryshake.ConsumerThread.announce`
+	sends ``ALARM`` and ``RESET`` messages back to the client, which
+	publishes them to the other consumers.
+
+	:param multiprocessing.connection.Connection conn: the consumer's end of the control pipe
+	'''
+	def __init__(self, conn):
+		self.conn = conn
+
+	def publish_urgent(self, msg):
+		msg.sent = msg.sent or monotonic_ns()
+		self.conn.send(msg)
+
+
+def _main(module, name, kwargs, state, ring_name, lock, start, conn, testing, debug):
+	'''
+	Runs a consumer in a process started by :py:class:`ProcessConsumer`.
+	'''
+	# the client stops the consumer with a TERM message when it is interrupted
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	for key in DIRS:
+		setattr(rsudp, key, state[key])
+	start_logging(testing=testing)
+	if debug:
+		add_debug_handler(testing=testing)
+	for key in STATE:
+		setattr(rs, key, state[key])
+	if rs.inv:
+		rs.responses.fill(rs.inv, sender=name)
+
+	ring = PacketRing(name=ring_name, lock=lock)
+	queue = ProcessQueue(RingReader(ring, start), conn)
+	before = {key: test[1] for key, test in TEST.items()}
+	proc = None
+	try:
+		proc = getattr(importlib.import_module(module), name)(q=queue, **kwargs)
+		queue.channels = proc.channels
+		proc.bus = PipeBus(conn)
+		conn.send({'kinds': proc.kinds})
+		printM('Running in process %s.' % multiprocessing.current_process().pid, proc.sender)
+		proc.run()
+	finally:
+		if queue.reader.lost:
+			printW('%s packets were overwritten before they could be read' % queue.reader.lost,
+				   sender=name)
+		results = {key: getattr(proc, key) for key in RESULTS if hasattr(proc, key)}
+		results['TEST'] = {key: test[1] for key, test in TEST.items() if before.get(key) != test[1]}
+		conn.send(results)
+		ring.close()
+
+
+class ProcessConsumer(ConsumerThread):
+	'''
+	.. versionadded:: 2.3.0
+
+	Runs a consumer in a separate process, so that consumers that do a lot
+	of work on the data (such as the Alert's filters or the RSAM's
+	calculations) each have a core to themselves instead of sharing one
+	interpreter. The client makes one of these for each settings section
+	listed in the ``"processes"`` setting that can run in a process
+	(see :py:data:`SECTIONS`).
+
+	The consumer process reads data packets from the :py:class:`PacketRing`
+	that the Producer writes to, rather than having them pickled and sent.
+	This thread stays in the client and passes the messages the consumer
+	subscribes to (``ALARM``, ``RESET``, ``IMGPATH`` and ``TERM``) to it over
+	a :py:func:`multiprocessing.Pipe`. ``ALARM`` and ``RESET`` messages the
+	consumer announces come back the same way and are published to the
+	other consumers. When the process ends, the test results it set and
+	a few of its attributes (see :py:data:`RESULTS`) are copied back to
+	this object.
+
+	:param str module: the module of the consumer class
+	:param str name: the name of the consumer class
+	:param rsudp.bus.Subscription q: queue of messages sent by :py:class:`rsudp.c_consumer.Consumer`
+	:param dict kwargs: the arguments of the consumer class, except the queue
+	:param PacketRing ring: the ring the Producer writes data packets to
+	:param bool testing: whether or not testing is active
+	'''
+	def __init__(self, module, name, q, kwargs, ring, testing=False):
+		super().__init__()
+		self.sender = '%s process' % name
+		self.module = module
+		self.cls = name
+		self.queue = q
+		self.kwargs = kwargs
+		self.ring = ring
+		self.testing = testing
+		# data comes through the ring; the consumer narrows this down once it has started
+		self.kinds = ['ALARM', 'RESET', 'IMGPATH']
+		self.results = {}
+		self.process = None
+		self.listener = None
+		self.conn = None
+
+	def __getattr__(self, name):
+		results = self.__dict__.get('results', {})
+		if name in results:
+			return results[name]
+		raise AttributeError(name)
+
+	def _listen(self):
+		'''
+		Handles what the consumer process sends back until it ends.
+		'''
+		while True:
+			try:
+				item = self.conn.recv()
+			except (EOFError, OSError):
+				break
+			if isinstance(item, Message):
+				self.announce(item)
+			elif 'kinds' in item:
+				kinds = item['kinds']
+				if kinds is None:
+					kinds = ['ALARM', 'RESET', 'IMGPATH']
+				self.queue.subscribe(kinds=[k for k in kinds if k != 'DATA'])
+			else:
+				for key, value in item.pop('TEST').items():
+					if key in TEST:
+						TEST[key][1] = value
+				self.results.update(item)
+		self.alive = False
+
+	def run(self):
+		'''
+		Starts the consumer process and passes messages to it
+		until a ``TERM`` message arrives.
+		'''
+		ctx = multiprocessing.get_context('spawn')
+		self.conn, child = ctx.Pipe()
+		state = {key: getattr(rs, key) for key in STATE}
+		state.update({key: getattr(rsudp, key) for key in DIRS})
+		debug = any(getattr(h, 'stream', None) is not None and not hasattr(h, 'baseFilename')
+					for h in rsudp.LOG.handlers)
+		self.process = ctx.Process(target=_main, name=self.sender, daemon=True,
+								   args=(self.module, self.cls, self.kwargs, state,
+										 self.ring.name, self.ring.lock, self.ring.head, child,
+										 self.testing, debug))
+		self.process.start()
+		child.close()
+		printM('Started process %s.' % self.process.pid, self.sender)
+		self.listener = Thread(target=self._listen, daemon=True)
+		self.listener.start()
+
+		while True:
+			msg = self.queue.get()
+			try:
+				self.conn.send(msg)
+			except (BrokenPipeError, OSError):
+				break
+			if msg.kind == MsgKind.TERM:
+				break
+
+		self.process.join(10)
+		if self.process.is_alive():
+			printE('Process did not stop after the TERM message; terminating it.', self.sender)
+			self.process.terminate()
+		self.listener.join(1)
+		self.alive = False
+		printM('Exiting.', self.sender)
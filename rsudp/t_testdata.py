@@ -127,7 +127,7 @@ class TestData(Thread):
 				TEST['x_send'][1] = True
 
 		self.f.close()
-		self.sock.sendto(helpers.msg_term(), (self.addr, self.port))
+		self.sock.sendto(helpers.msg_term().to_bytes(), (self.addr, self.port))
 		printW('Exiting.', self.sender, announce=False)
 		sys.exit()
 
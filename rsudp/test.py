@@ -29,6 +29,9 @@ TEST = {
 	'x_RESET':				['RESET message               ', False],
 	'x_IMGPATH':			['IMGPATH message             ', False],
 	'x_TERM':				['TERM message                ', False],
+	'x_steim2':				['Steim2 round trip           ', False],
+	'x_codec':				['binary format round trip    ', False],
+	'x_stalta':				['streaming STA/LTA and filter', False],
 
 	# dependencies
 	'd_pydub':				['pydub dependencies          ', False],
@@ -248,3 +251,175 @@ def is_connected(hostname):
 	except:
 		pass
 	return False
+
+def steim2_roundtrip():
+	'''
+	.. versionadded:: 2.3.0
+
+	Test the streaming Steim2 encoder (:py:class:`rsudp.mseed.RecordWriter`).
+	Samples whose differences need every width of Steim2 word
+	(4 to 30 bits), and one jump too big for any word, are added in chunks
+	of random lengths with a gap in the middle, then flushed. The records
+	are read back with ObsPy and every sample and start time is compared.
+
+	:rtype: bool
+	:return: ``True`` if the samples read back are the ones added, ``False`` otherwise
+	'''
+	import io
+	import numpy as np
+	from obspy import read
+	from rsudp.mseed import RecordWriter
+	sender = 'steim2 test'
+	sps, t0 = 100., 1582315130.29
+	rng = np.random.default_rng(0)
+	# differences of 4, 5, 6, 8, 10, 15 and 30 bits, in runs and mixed
+	widths = [rng.integers(-(1 << (b - 1)), 1 << (b - 1), 500) for b in (4, 5, 6, 8, 10, 15, 30)]
+	d = np.concatenate(widths + [rng.permutation(np.concatenate(widths))])
+	d[1700] = 1 << 31		# does not fit in a word
+	x = np.cumsum(d) % (1 << 32) - (1 << 31)
+	times = t0 + np.arange(len(x)) / sps
+	times[len(x) // 2:] += 12.5		# gap
+	try:
+		w = RecordWriter('AM', 'R3BCF', '00', 'EHZ', sps)
+		records, i = [], 0
+		while i < len(x):
+			j = min(len(x), i + int(rng.integers(1, 300)), len(x) // 2 if i < len(x) // 2 else len(x))
+			records += w.add(times[i], x[i:j])
+			i = j
+		records += w.flush()
+		st = read(io.BytesIO(b''.join(records)), format='MSEED')
+		n = 0
+		for tr in st:
+			k = int(np.argmin(abs(times - tr.stats.starttime.timestamp)))
+			if (abs(times[k] - tr.stats.starttime.timestamp) > 0.5 / sps) or \
+			   (not np.array_equal(tr.data, x[k:k+tr.stats.npts])):
+				printE('Record read back as %s does not match the samples added' % tr, sender=sender)
+				return False
+			n += tr.stats.npts
+		if n != len(x):
+			printE('%s samples were added but %s were read back' % (len(x), n), sender=sender)
+			return False
+		return True
+	except Exception as e:
+		printE(e, sender=sender)
+		return False
+
+def codec_roundtrip():
+	'''
+	.. versionadded:: 2.3.0
+
+	Test the binary forwarding format (:py:mod:`rsudp.codec`).
+	Packets of several channels, one of them empty, are encoded in one
+	datagram and in datagrams of a :py:class:`rsudp.codec.Batcher`,
+	decoded directly and through :py:func:`rsudp.raspberryshake.parse_packets`,
+	and compared with the originals. Every truncation of the datagram
+	must raise a :py:class:`ValueError`.
+
+	:rtype: bool
+	:return: ``True`` if every packet comes back unchanged, ``False`` otherwise
+	'''
+	import numpy as np
+	from rsudp import codec
+	from rsudp.raspberryshake import Packet, Message, parse_packets
+	sender = 'codec test'
+	rng = np.random.default_rng(0)
+	t0 = 1582315130.292
+	packets = []
+	for n in range(8):
+		for cha in ('EHZ', 'ENZ', 'ENE', 'ENN'):
+			data = np.cumsum(rng.integers(-5000, 5000, 25)).astype(np.int32) + 14168
+			packets.append(Packet(cha, round(t0 + n * 0.25, 3), data))
+	packets[0].data[0] = -(1 << 31)
+	packets[1].data[-1] = (1 << 31) - 1
+	packets.insert(5, Packet('HDF', t0 + 0.25, np.zeros(0, dtype=np.int32)))
+
+	def same(got, sent):
+		return (len(got) == len(sent)) and all(
+			(g[0] == p.cha) and (abs(g[1] - p.time) < 1e-6) and np.array_equal(g[2], p.data)
+			for g, p in zip(got, sent))
+
+	try:
+		DP = codec.encode(packets)
+		if not same(codec.decode(DP), packets):
+			printE('Packets decoded from a datagram do not match the ones encoded', sender=sender)
+			return False
+		if codec.decode(codec.encode([])) != []:
+			printE('A datagram of no packets does not decode to none', sender=sender)
+			return False
+		for k in range(len(DP)):
+			try:
+				codec.decode(DP[:k])
+			except ValueError:
+				continue
+			printE('A datagram cut to %s of its %s bytes decoded without an error' % (k, len(DP)), sender=sender)
+			return False
+
+		b = codec.Batcher(latency=1.0, max_size=300)
+		DPs = []
+		for p in packets:
+			DPs += b.add(p, now=0.)
+		DPs += b.flush()
+		if (len(DPs) < 2) or any(len(dp) > 300 for dp in DPs if len(codec.decode(dp)) > 1):
+			printE('Batcher datagrams are not split at their size limit', sender=sender)
+			return False
+		if not same([g for dp in DPs for g in codec.decode(dp)], packets):
+			printE('Packets decoded from Batcher datagrams do not match the ones added', sender=sender)
+			return False
+
+		text = codec.to_text('EHZ', t0, packets[0].data)
+		parsed = parse_packets([DPs[0], text, b'TERM'] + DPs[1:])
+		got = [x for x in parsed if isinstance(x, Packet)]
+		msgs = [x for x in parsed if isinstance(x, Message)]
+		n = len(codec.decode(DPs[0]))
+		sent = packets[:n] + [packets[0]] + packets[n:]
+		if (len(msgs) != 1) or not same([(p.cha, p.time, p.data) for p in got], sent) or \
+		   any(p.raw != codec.to_text(p.cha, p.time, p.data) for p in got):
+			printE('Packets parsed from binary datagrams do not match the ones encoded', sender=sender)
+			return False
+		return True
+	except Exception as e:
+		printE(e, sender=sender)
+		return False
+
+
+def stalta_stream():
+	'''
+	.. versionadded:: 2.3.0
+
+	Test the streaming filter and STA/LTA that the alert module uses
+	(:py:class:`rsudp.dsp.SosFilter` and :py:class:`rsudp.dsp.StaLta`).
+	The vertical channel of the test data is fed through them in
+	packet-sized chunks with the default alert settings, and the result
+	is compared with filtering the whole trace with ObsPy and running
+	:py:func:`obspy.signal.trigger.recursive_sta_lta` over it.
+
+	:rtype: bool
+	:return: ``True`` if the streaming and whole-trace results agree, ``False`` otherwise
+	'''
+	import numpy as np
+	from obspy import read
+	from obspy.signal.trigger import recursive_sta_lta
+	from rsudp import resource_path
+	from rsudp.dsp import FilterStage, StaLta
+	sender = 'STA/LTA test'
+	try:
+		tr = read(resource_path('test', 'testdata.ms')).select(component='Z')[0]
+		sps = tr.stats.sampling_rate
+		nsta, nlta = int(6 * sps), int(30 * sps)
+		filt, trigger = FilterStage('bandpass', sps, freqmin=0.8, freqmax=9, sender=sender)(), StaLta(nsta, nlta)
+		y, cft = [], []
+		for i in range(0, tr.stats.npts, 25):
+			y.append(filt(tr.data[i:i+25]))
+			cft.append(trigger(y[-1]))
+		y, cft = np.concatenate(y), np.concatenate(cft)
+		tr.filter('bandpass', freqmin=0.8, freqmax=9, corners=4, zerophase=False)
+		if not np.allclose(y, tr.data):
+			printE('Data filtered packet by packet does not match the filtered trace', sender=sender)
+			return False
+		if not np.allclose(cft, recursive_sta_lta(tr.data, nsta, nlta)):
+			printE('STA/LTA computed packet by packet does not match recursive_sta_lta', sender=sender)
+			return False
+		return True
+	except Exception as e:
+		printE(e, sender=sender)
+		return False
@@ -0,0 +1,440 @@
+import os, sys
+import json
+import math
+import time
+import getopt
+from datetime import datetime, timezone
+import numpy as np
+
+
+TIERS = (60, 600, 3600)
+'''
+Steps in seconds of the tiers that RSAM results roll up into, besides
+the RSAM interval itself. Each is a multiple of the one before.
+'''
+POINTS = 1000
+'''
+Most rows :py:meth:`Trend.query` returns when no step is asked for.
+'''
+
+
+def dtype(nbands=0):
+	'''
+	.. versionadded:: 2.3.0
+
+	The fixed-width row of a trend file: the number of RSAM intervals the
+	row covers (``n``, 0 for a row without data), the mean, median,
+	minimum and maximum (``rsam``), and one amplitude per band (``ssam``),
+	all little-endian.
+
+	:param int nbands: number of SSAM bands
+	:rtype: numpy.dtype
+	'''
+	return np.dtype([('n', '<u4'), ('rsam', '<f4', (4,)), ('ssam', '<f4', (nbands,))])
+
+
+def rollup(rows):
+	'''
+	.. versionadded:: 2.3.0
+
+	Combines rows into one row of a coarser tier. The mean and the band
+	amplitudes are averaged, weighted by the number of intervals in each
+	row; the minimum and maximum are those of all the rows; the median
+	is the median of the rows' medians (the exact one would need every
+	sample). Rows without data are left out.
+
+	:param numpy.ndarray rows: rows (see :py:func:`dtype`)
+	:rtype: numpy.ndarray
+	:return: one row, with ``n`` 0 if none of ``rows`` had data
+	'''
+	out = np.zeros(1, dtype=rows.dtype)
+	rows = rows[rows['n'] > 0]
+	if len(rows):
+		n = rows['n'].astype(np.float64)
+		w = n / n.sum()
+		r = rows['rsam']
+		out['n'] = rows['n'].sum()
+		out['rsam'][0] = (w @ r[:,0], np.median(r[:,1]), r[:,2].min(), r[:,3].max())
+		out['ssam'][0] = w @ rows['ssam']
+	return out
+
+
+def trend_path(root, stn, cha):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param str root: archive directory
+	:param str stn: station name
+	:param str cha: channel name
+	:rtype: str
+	:return: the directory of the trend of a channel (``root/STN.CHA``)
+	'''
+	return os.path.join(root, '%s.%s' % (stn, cha))
+
+
+def list_trends(root):
+	'''
+	.. versionadded:: 2.3.0
+
+	:param str root: archive directory
+	:rtype: list
+	:return: names (``STN.CHA``) of the trends in the archive, sorted
+	'''
+	if not os.path.isdir(root):
+		return []
+	return sorted(d for d in os.listdir(root) if os.path.exists(os.path.join(root, d, 'meta.json')))
+
+
+class Trend():
+	'''
+	.. versionadded:: 2.3.0
+
+	The RSAM trend of one channel, kept on disk as fixed-width binary
+	rows (see :py:func:`dtype`) with one file per tier: one for the RSAM
+	interval itself, and one for each step in :py:data:`TIERS` that is
+	longer than the interval. Row ``i`` of the tier with step ``S`` covers
+	the ``S`` seconds that start ``i * S`` seconds after the tier's origin
+	(the start of the first interval, rounded down to a multiple of ``S``),
+	so the rows of a time range are found by arithmetic and read
+	in one go, and rows without data read as zeros.
+
+	Each result is written to its row of the interval tier, and the row of
+	each coarser tier that covers it is then recomputed from the rows of
+	the tier below (see :py:func:`rollup`), so every tier is up to date,
+	including the rows still being filled, and a restart picks up where
+	the files end. The directory holds ``meta.json`` (interval, start, bands
+	and units) and a ``<step>.dat`` file for each tier.
+
+	:param str path: directory of the trend
+	:param float interval: RSAM interval in seconds, to create or add to the trend; ``None`` to open an existing trend for reading
+	:param list bands: ``[freqmin, freqmax]`` pairs of the SSAM bands
+	:param str units: units of the RSAM values
+	:raise ValueError: if the trend at ``path`` was written with another interval, other bands or other units, or if ``interval`` is ``None`` and there is no trend at ``path``
+	'''
+	def __init__(self, path, interval=None, bands=(), units='counts'):
+		self.path = path
+		self.meta = None
+		self.files = {}
+		meta_file = os.path.join(path, 'meta.json')
+		if os.path.exists(meta_file):
+			with open(meta_file, 'r') as f:
+				self.meta = json.load(f)
+			if interval is None:
+				interval, bands, units = self.meta['interval'], self.meta['bands'], self.meta['units']
+		elif interval is None:
+			raise ValueError('there is no RSAM trend in %s' % path)
+		self.interval = float(interval)
+		self.bands = [[float(b[0]), float(b[1])] for b in bands]
+		self.units = units
+		if self.meta:
+			for key in ('interval', 'bands', 'units'):
+				if self.meta[key] != getattr(self, key):
+					raise ValueError('the RSAM trend in %s has %s %s, not %s; move it aside to start a new one'
+									 % (path, key, self.meta[key], getattr(self, key)))
+		self.dtype = dtype(len(self.bands))
+		self.steps = [self.interval] + [float(s) for s in TIERS if s > self.interval]
+
+
+	def origin(self, step):
+		'''
+		:param float step: step of a tier
+		:rtype: float
+		:return: the time row 0 of the tier starts at
+		'''
+		if step == self.interval:
+			return self.meta['start']
+		return math.floor(self.meta['start'] / step) * step
+
+
+	def _index(self, step, t):
+		return math.floor((t - self.origin(step)) / step + 1e-6)
+
+
+	def _file_name(self, step):
+		return os.path.join(self.path, '%g.dat' % step)
+
+
+	def _file(self, step):
+		if step not in self.files:
+			name = self._file_name(step)
+			self.files[step] = open(name, 'r+b' if os.path.exists(name) else 'w+b')
+		return self.files[step]
+
+
+	def _read(self, step, lo, hi):
+		'''
+		Reads rows ``lo`` to ``hi`` (not included) of a tier being written,
+		with zeros past the end of the file.
+		'''
+		f = self._file(step)
+		f.seek(lo * self.dtype.itemsize)
+		rows = np.zeros(hi - lo, dtype=self.dtype)
+		got = np.frombuffer(f.read((hi - lo) * self.dtype.itemsize), dtype=self.dtype)
+		rows[:len(got)] = got
+		return rows
+
+
+	def _write(self, step, i, row):
+		f = self._file(step)
+		f.seek(i * self.dtype.itemsize)
+		f.write(row.tobytes())
+
+
+	def append(self, end, rsam, ssam=()):
+		'''
+		Adds the result of one RSAM interval and rolls it up into the coarser tiers.
+
+		:param float end: end time of the interval
+		:param list rsam: mean, median, minimum and maximum
+		:param list ssam: one amplitude per band
+		:rtype: bool
+		:return: ``False`` if the interval is older than the start of the trend and was not added
+		'''
+		start = end - self.interval
+		if self.meta is None:
+			os.makedirs(self.path, exist_ok=True)
+			self.meta = {'version': 1, 'interval': self.interval, 'start': start,
+						 'bands': self.bands, 'units': self.units}
+			meta_file = os.path.join(self.path, 'meta.json')
+			with open(meta_file + '.tmp', 'w') as f:
+				json.dump(self.meta, f)
+			os.replace(meta_file + '.tmp', meta_file)
+		i = self._index(self.interval, start)
+		if i < 0:
+			return False
+		row = np.zeros(1, dtype=self.dtype)
+		row['n'] = 1
+		row['rsam'][0] = rsam[:4]
+		row['ssam'][0] = ssam
+		self._write(self.interval, i, row)
+		for below, step in zip(self.steps, self.steps[1:]):
+			j = self._index(step, start)
+			t0 = self.origin(step) + j * step - self.origin(below)
+			lo = max(0, math.ceil(t0 / below - 1e-6))
+			hi = math.ceil((t0 + step) / below - 1e-6)
+			self._write(step, j, rollup(self._read(below, lo, hi)))
+		for f in self.files.values():
+			# so that queries from other processes see the new rows
+			f.flush()
+		return True
+
+
+	def rows(self, step):
+		'''
+		:param float step: step of a tier
+		:rtype: int
+		:return: number of rows in the tier's file
+		'''
+		name = self._file_name(step)
+		return os.path.getsize(name) // self.dtype.itemsize if os.path.exists(name) else 0
+
+
+	def span(self):
+		'''
+		:rtype: tuple
+		:return: start time of the first interval and end time of the last, or ``(None, None)`` if the trend is empty
+		'''
+		if self.meta is None:
+			return None, None
+		return self.meta['start'], self.meta['start'] + self.rows(self.interval) * self.interval
+
+
+	def query(self, start=None, end=None, points=POINTS, step=None):
+		'''
+		Reads the rows of a time range from the finest tier that has no
+		more than ``points`` rows in it (or from the coarsest), or from the
+		tier of ``step``. Only the rows in the range are read from the file.
+
+		.. code-block:: python
+
+			>>> Trend('/home/pi/rsudp/rsam/R3BCF.EHZ').query(time.time() - 86400)['step']
+			600.0
+
+		:param float start: start of the range (default: the start of the trend)
+		:param float end: end of the range (default: the end of the trend)
+		:param int points: most rows to return when ``step`` is not given
+		:param float step: step of the tier to read
+		:rtype: dict
+		:return: ``step`` (seconds), and arrays of the rows that have data: ``time`` (the end of each row), ``n`` (number of intervals in each row), ``mean``, ``median``, ``min``, ``max``, and ``ssam`` (one column per band)
+		:raise ValueError: if ``step`` is not the step of a tier
+		'''
+		first, last = self.span() if self.meta else (0.0, 0.0)
+		start = first if start is None else start
+		end = last if end is None else end
+		if step is None:
+			step = next((s for s in self.steps if (end - start) / s <= points), self.steps[-1])
+		elif float(step) not in self.steps:
+			raise ValueError('no tier with a %s second step (the tiers are %s)' % (step, self.steps))
+		step = float(step)
+		rows = np.zeros(0, dtype=self.dtype)
+		lo = hi = 0
+		if self.meta is not None:
+			o = self.origin(step)
+			lo = max(0, math.floor((start - o) / step))
+			hi = min(self.rows(step), math.ceil((end - o) / step))
+			if hi > lo:
+				rows = np.fromfile(self._file_name(step), dtype=self.dtype, count=hi - lo,
+								   offset=lo * self.dtype.itemsize)
+		keep = np.flatnonzero(rows['n'] > 0)
+		rows = rows[keep]
+		return {
+			'step': step,
+			'time': (self.origin(step) + (lo + keep + 1) * step) if len(keep) else np.zeros(0),
+			'n': rows['n'],
+			'mean': rows['rsam'][:,0],
+			'median': rows['rsam'][:,1],
+			'min': rows['rsam'][:,2],
+			'max': rows['rsam'][:,3],
+			'ssam': rows['ssam'],
+		}
+
+
+	def close(self):
+		'''
+		Closes the tier files.
+		'''
+		for f in self.files.values():
+			f.close()
+		self.files = {}
+
+
+def parse_time(s, now=None):
+	'''
+	.. versionadded:: 2.3.0
+
+	Reads a time given on the command line.
+
+	.. code-block:: python
+
+		>>> parse_time('2024-05-01T12:00:00')
+		1714564800.0
+		>>> parse_time('-3d', now=1714564800)
+		1714305600.0
+
+	:param str s: seconds since 1970-01-01 00:00:00Z, an ISO 8601 time (UTC unless it has an offset), ``now``, or a time relative to now such as ``-90s``, ``-30m``, ``-6h``, ``-3d`` or ``-2w``
+	:param float now: the time now (default: :py:func:`time.time`)
+	:rtype: float
+	:raise ValueError: if the time can not be read
+	'''
+	now = time.time() if now is None else now
+	if s == 'now':
+		return now
+	units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+	if s.startswith('-') and (s[-1] in units):
+		return now - float(s[1:-1]) * units[s[-1]]
+	try:
+		return float(s)
+	except ValueError:
+		pass
+	t = datetime.fromisoformat(s[:-1] + '+00:00' if s.endswith('Z') else s)
+	if t.tzinfo is None:
+		t = t.replace(tzinfo=timezone.utc)
+	return t.timestamp()
+
+
+def _iso(t):
+	return datetime.fromtimestamp(t, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def main():
+	'''
+	.. versionadded:: 2.3.0
+
+	Prints RSAM trends from the archive written by the RSAM module
+	(see :py:class:`rsudp.c_rsam.RSAM`) as CSV, at the resolution that
+	fits the time range (see :py:meth:`Trend.query`).
+	Supply -h from the command line to see help text.
+	'''
+	from rsudp import settings_loc
+	from rsudp.c_settings import Settings
+	hlp_txt = '''
+Usage: rs-rsam [ OPTIONS ] [ TREND ... ]
+where TREND is a channel (e.g. EHZ) or station and channel (e.g. R3BCF.EHZ)
+in the archive (default: all of them), and OPTIONS := {
+    -h | --help
+            display this help message
+    -s | --settings=/path/to/settings/json
+            read the archive in the output directory of this settings file
+            (default: %s)
+    -d | --dir=/path/to/archive
+            read the archive in this directory instead
+    -l | --list
+            list the trends in the archive with their time spans
+    -b | --begin=TIME
+            start of the time range (default: one day before its end)
+    -e | --end=TIME
+            end of the time range (default: the end of the trend)
+    -p | --points=N
+            read the finest tier with at most N rows in the range
+            (default: %s)
+    -r | --resolution=SECONDS
+            read the tier with this step instead
+    }
+TIME is seconds since 1970, an ISO 8601 time such as 2024-05-01T12:00:00
+(UTC unless it has an offset), now, or a time before now such as -6h or -3d.
+''' % (settings_loc, POINTS)
+
+	root, begin, end, points, step, listing = None, None, None, POINTS, None, False
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], 'hs:d:lb:e:p:r:',
+			['help', 'settings=', 'dir=', 'list', 'begin=', 'end=', 'points=', 'resolution=']
+			)
+		for o, a in opts:
+			if o in ('-h', '--help'):
+				print(hlp_txt)
+				exit(0)
+			if o in ('-s', '--settings'):
+				settings = Settings.read_settings(os.path.abspath(os.path.expanduser(a)))
+				root = os.path.join(os.path.expanduser(settings['settings']['output_dir']), 'rsam')
+			if o in ('-d', '--dir'):
+				root = os.path.abspath(os.path.expanduser(a))
+			if o in ('-l', '--list'):
+				listing = True
+			if o in ('-b', '--begin'):
+				begin = parse_time(a)
+			if o in ('-e', '--end'):
+				end = parse_time(a)
+			if o in ('-p', '--points'):
+				points = max(1, int(a))
+			if o in ('-r', '--resolution'):
+				step = float(a)
+	except Exception as e:
+		print('ERROR: %s' % e)
+		print(hlp_txt)
+		exit(1)
+
+	if root is None:
+		settings = Settings.default_settings(verbose=False)
+		if os.path.exists(settings_loc):
+			settings = Settings.read_settings(settings_loc)
+		root = os.path.join(os.path.expanduser(settings['settings']['output_dir']), 'rsam')
+	names = [n for n in list_trends(root)
+			 if (not args) or (n in args) or (n.split('.')[-1] in args)]
+	if not names:
+		print('ERROR: no RSAM trends%s in %s' % ((' for %s' % ', '.join(args)) if args else '', root))
+		exit(1)
+
+	for name in names:
+		trend = Trend(os.path.join(root, name))
+		first, last = trend.span()
+		if listing:
+			print('%s %s to %s, interval %g s, tiers %s s, units %s, bands %s' % (name,
+				  _iso(first), _iso(last), trend.interval, ' '.join('%g' % s for s in trend.steps),
+				  trend.units, trend.bands or 'none'))
+			continue
+		e = last if end is None else end
+		b = e - 86400 if begin is None else begin
+		try:
+			r = trend.query(b, e, points=points, step=step)
+		except ValueError as ex:
+			print('ERROR: %s' % ex)
+			exit(1)
+		print('# %s, %g s rows, units %s' % (name, r['step'], trend.units))
+		print('time,n,mean,median,min,max%s' % ''.join(',ssam_%g-%g' % tuple(band) for band in trend.bands))
+		for i in range(len(r['time'])):
+			print('%s,%s,%.6g,%.6g,%.6g,%.6g%s' % (_iso(r['time'][i]), r['n'][i], r['mean'][i],
+				  r['median'][i], r['min'][i], r['max'][i], ''.join(',%.6g' % a for a in r['ssam'][i])))
+
+
+if __name__ == '__main__':
+	main()
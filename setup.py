@@ -32,6 +32,8 @@ setuptools.setup(
             'rs-settings=rsudp.entry_points:ep_edit_settings',
             'rs-log=rsudp.entry_points:ep_cat_log',
             'rs-tailf=rsudp.entry_points:ep_tailf_log',
+            'rs-bench=rsudp.bench:main',
+            'rs-rsam=rsudp.trends:main',
             ],
     },
     classifiers=[